@@ -2,7 +2,7 @@
     'name': 'Runbot',
     'category': 'Website',
     'summary': 'Runbot',
-    'version': '1.2',
+    'version': '1.5',
     'description': "Runbot",
     'author': 'OpenERP SA',
     'depends': ['website'],
@@ -0,0 +1,16 @@
+# -*- encoding: utf-8 -*-
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # reserve the ports of the builds started before the port allocator
+    cr.execute("""
+        INSERT INTO runbot_port (host, port, build_id)
+             SELECT DISTINCT ON (host, port) host, port, id
+               FROM runbot_build
+              WHERE state NOT IN ('pending', 'done', 'duplicate')
+                AND host IS NOT NULL
+                AND port IS NOT NULL
+           ORDER BY host, port, id DESC
+    """)
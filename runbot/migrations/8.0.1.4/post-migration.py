@@ -0,0 +1,16 @@
+# -*- encoding: utf-8 -*-
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # resolve the build of the rows inserted by --log-db, the build pages only
+    # look up the logs by build_id
+    cr.execute("""
+        UPDATE ir_logging l
+           SET build_id = b.id
+          FROM runbot_build b
+         WHERE l.build_id IS NULL
+           AND l.dbname LIKE '%-%'
+           AND regexp_replace(l.dbname, '-[^-]*$', '') = b.dest
+    """)
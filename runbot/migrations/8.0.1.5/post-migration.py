@@ -0,0 +1,76 @@
+# -*- encoding: utf-8 -*-
+
+# jobs of the pipeline before this version
+DEFAULT_JOBS = ['job_00_init', 'job_10_test_base', 'job_20_test_all', 'job_30_run']
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # the jobs of the builds now follow the state of their job records
+    cr.execute("""
+        UPDATE runbot_build_job j
+           SET state = 'running'
+          FROM runbot_build b
+         WHERE b.id = j.build_id
+           AND b.state = 'running'
+           AND j.job = b.job
+           AND NOT j.reaped
+    """)
+    cr.execute("UPDATE runbot_build_job SET state = 'done' WHERE state IS NULL AND job_end IS NOT NULL")
+    # running builds went through every job before their current one: record
+    # them as done, and the current one as running, so that the scheduler does
+    # not start their pipeline over next to their live server
+    cr.execute("SELECT DISTINCT job FROM runbot_build_job")
+    jobs = set(row[0] for row in cr.fetchall()) | set(DEFAULT_JOBS)
+    for job in sorted(jobs):
+        cr.execute("""
+            INSERT INTO runbot_build_job (build_id, repo_id, branch_id, job, host, state, job_start, job_end)
+            SELECT b.id, b.repo_id, b.branch_id, %s, b.host, 'done', b.job_start, b.job_start
+              FROM runbot_build b
+             WHERE b.state = 'running'
+               AND b.job > %s
+               AND NOT EXISTS (SELECT 1 FROM runbot_build_job j
+                                WHERE j.build_id = b.id AND j.job = %s AND j.state IN ('running', 'done'))
+        """, [job, job, job])
+    cr.execute("""
+        INSERT INTO runbot_build_job (build_id, repo_id, branch_id, job, host, state, pid, job_start)
+        SELECT b.id, b.repo_id, b.branch_id, b.job, b.host, 'running', b.pid, b.job_start
+          FROM runbot_build b
+         WHERE b.state = 'running'
+           AND b.job IS NOT NULL
+           AND NOT EXISTS (SELECT 1 FROM runbot_build_job j
+                            WHERE j.build_id = b.id AND j.job = b.job AND j.state = 'running')
+    """)
+    # the pipeline of builds in the middle of their tests is unknown, test them
+    # again; their processes are cancelled so that their host kills them, see
+    # runbot_host.kill_orphans
+    cr.execute("""
+        UPDATE runbot_build_job j
+           SET state = 'cancelled', job_end = (now() at time zone 'UTC')
+          FROM runbot_build b
+         WHERE b.id = j.build_id
+           AND b.state = 'testing'
+           AND j.reaped IS NOT TRUE
+           AND j.job_end IS NULL
+    """)
+    cr.execute("""
+        INSERT INTO runbot_build_job (build_id, repo_id, branch_id, job, host, state, pid, reaped, job_start, job_end)
+        SELECT b.id, b.repo_id, b.branch_id, b.job, b.host, 'cancelled', b.pid, FALSE, b.job_start, (now() at time zone 'UTC')
+          FROM runbot_build b
+         WHERE b.state = 'testing'
+           AND b.job IS NOT NULL
+           AND b.pid > 0
+           AND NOT EXISTS (SELECT 1 FROM runbot_build_job j
+                            WHERE j.build_id = b.id AND j.pid = b.pid)
+    """)
+    cr.execute("""
+        DELETE FROM runbot_port
+              WHERE build_id IN (SELECT id FROM runbot_build WHERE state = 'testing')
+    """)
+    cr.execute("""
+        UPDATE runbot_build
+           SET state = 'pending', host = NULL, port = NULL, pid = NULL, job = NULL,
+               job_start = NULL, job_end = NULL, cpu_slot = 0, shards = 0, result = ''
+         WHERE state = 'testing'
+    """)
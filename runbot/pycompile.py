@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""Compile the python files of a build tree through a shared bytecode cache
+
+    pycompile.py CACHE_DIR TREE [PROCESSES]
+
+The bytecode of a source file is cached by the hash of its content and of
+its path in the tree, which is the file name recorded in the bytecode, and
+hard linked next to it. As the bytecode records the mtime of its source,
+the sources are given a fixed mtime so that the cached bytecode is valid
+in every tree. The interpreter running this script is the one the cache
+is for: use the interpreter of the builds.
+"""
+
+import errno
+import hashlib
+import imp
+import multiprocessing
+import os
+import py_compile
+import sys
+
+# mtime given to the sources, recorded in the cached bytecode
+SOURCE_MTIME = 946684800
+
+
+def compile_file(args):
+    cache_dir, tree, path = args
+    # shown in the tracebacks, the same in every tree
+    relpath = os.path.relpath(path, tree)
+    try:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(relpath + '\0' + f.read()).hexdigest()
+        os.utime(path, (SOURCE_MTIME, SOURCE_MTIME))
+        cached = os.path.join(cache_dir, digest[:2], digest + '.pyc')
+        if not os.path.isfile(cached):
+            try:
+                os.makedirs(os.path.dirname(cached))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            tmp = '%s.%d' % (cached, os.getpid())
+            py_compile.compile(path, cfile=tmp, dfile=relpath, doraise=True)
+            # atomic, a concurrent compilation of the same content is identical
+            os.rename(tmp, cached)
+        target = path + 'c'
+        if os.path.lexists(target):
+            os.unlink(target)
+        os.link(cached, target)
+        return True
+    except (py_compile.PyCompileError, IOError, OSError):
+        # left to the interpreter, e.g. files of another python version
+        return False
+
+
+def main(cache_dir, tree, processes=None):
+    cache_dir = os.path.join(cache_dir, imp.get_magic().encode('hex'))
+    paths = []
+    for root, dirs, files in os.walk(tree):
+        paths += [(cache_dir, tree, os.path.join(root, name)) for name in files if name.endswith('.py')]
+    pool = multiprocessing.Pool(processes)
+    try:
+        compiled = sum(pool.map(compile_file, paths, chunksize=64))
+    finally:
+        pool.close()
+        pool.join()
+    print '%d/%d files compiled through %s' % (compiled, len(paths), cache_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else None)
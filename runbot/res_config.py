@@ -30,6 +30,11 @@ class runbot_config_settings(osv.osv_memory):
         'default_timeout': fields.integer('Default Timeout (in seconds)'),
         'default_starting_port': fields.integer('Starting Port for Running Builds'),
         'default_domain': fields.char('Runbot Domain'),
+        'default_scheduling_policy': fields.selection([('fifo', 'Sticky builds first, then by sequence'),
+                                                       ('fair', 'Sticky builds first, then fair share between repositories')],
+                                                      string='Scheduling Policy'),
+        'default_fair_aging': fields.integer('Fair Share Aging (in seconds)'),
+        'default_preempt_delay': fields.integer('Preempt for Sticky Builds Pending for (in seconds, 0 to disable)'),
     }
 
     def get_default_parameters(self, cr, uid, fields, context=None):
@@ -39,12 +44,18 @@ class runbot_config_settings(osv.osv_memory):
         timeout = icp.get_param(cr, uid, 'runbot.timeout', default=1800)
         starting_port = icp.get_param(cr, uid, 'runbot.starting_port', default=2000)
         runbot_domain = icp.get_param(cr, uid, 'runbot.domain', default='runbot.odoo.com')
+        scheduling_policy = icp.get_param(cr, uid, 'runbot.scheduling_policy', default='fair')
+        fair_aging = icp.get_param(cr, uid, 'runbot.fair_aging', default=3600)
+        preempt_delay = icp.get_param(cr, uid, 'runbot.preempt_delay', default=0)
         return {
         	'default_workers': int(workers),
         	'default_running_max': int(running_max),
             'default_timeout': int(timeout),
             'default_starting_port': int(starting_port),
             'default_domain': runbot_domain,
+            'default_scheduling_policy': scheduling_policy,
+            'default_fair_aging': int(fair_aging),
+            'default_preempt_delay': int(preempt_delay),
         }
 
     def set_default_parameters(self, cr, uid, ids, context=None):
@@ -55,6 +66,9 @@ class runbot_config_settings(osv.osv_memory):
         icp.set_param(cr, uid, 'runbot.timeout', config.default_timeout)
         icp.set_param(cr, uid, 'runbot.starting_port', config.default_starting_port)
         icp.set_param(cr, uid, 'runbot.domain', config.default_domain)
+        icp.set_param(cr, uid, 'runbot.scheduling_policy', config.default_scheduling_policy)
+        icp.set_param(cr, uid, 'runbot.fair_aging', config.default_fair_aging)
+        icp.set_param(cr, uid, 'runbot.preempt_delay', config.default_preempt_delay)
 
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
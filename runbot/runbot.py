@@ -1,14 +1,21 @@
 # -*- encoding: utf-8 -*-
 
+import ast
 import contextlib
+import ctypes
+import ctypes.util
 import datetime
 import fcntl
 import glob
 import hashlib
+import heapq
 import itertools
 import logging
+import math
 import operator
 import os
+import pipes
+import platform
 import psycopg2
 import re
 import resource
@@ -16,8 +23,10 @@ import shutil
 import signal
 import simplejson
 import socket
+import StringIO
 import subprocess
 import sys
+import threading
 import time
 from collections import OrderedDict
 
@@ -32,7 +41,7 @@ import openerp
 from openerp import http, SUPERUSER_ID
 from openerp.http import request
 from openerp.osv import fields, osv
-from openerp.tools import config, appdirs
+from openerp.tools import config, appdirs, ustr
 from openerp.addons.website.models.website import slug
 from openerp.addons.website_sale.controllers.main import QueryURL
 
@@ -44,7 +53,32 @@ _logger = logging.getLogger(__name__)
 
 _re_error = r'^(?:\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} \d+ (?:ERROR|CRITICAL) )|(?:Traceback \(most recent call last\):)$'
 _re_warning = r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} \d+ WARNING '
+_re_error_line = re.compile(_re_error)
+_re_warning_line = re.compile(_re_warning)
+# module of the logger of an error line
+_re_error_module = re.compile(r' (?:openerp|odoo)\.addons\.(\w+)[.:]')
+# module loading and test run lines of --log-level=test, see runbot_build_job._collect_timing
+_re_module_loading = re.compile(r'^module (\w+): creating or updating database tables')
+_re_tests_ran = re.compile(r'^Ran (\d+) tests? in ([\d.]+)s')
+_re_addons_logger = re.compile(r'^(?:openerp|odoo)\.addons\.(\w+)')
+# date, level, dbname, logger and message of a server log line
+_re_log_record = re.compile(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d{3} \d+ (\w+) (\S+) ([^\s:]+): (.*)$')
 _re_job = re.compile('job_\d')
+# frames of a traceback, and the variable parts of error messages
+_re_frame = re.compile(r'^\s*File "([^"]+)", line \d+, in (\S+)')
+_re_fingerprint_noise = re.compile(r'0x[0-9a-fA-F]+|\b\d+\b')
+
+# ioprio_set syscall numbers and io scheduling classes, see ioprio_set(2)
+_NR_ioprio_set = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30}
+IOPRIO_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+# processes spawned by this runbot process, kept referenced until they are
+# reaped by runbot_build.reap so that subprocess does not reap them itself
+# and lose their resource usage
+_spawned = {}
+
+# capabilities of the server trees by server hash, see runbot_server_capability.probe
+_server_capabilities = {}
 
 # increase cron frequency from 0.016 Hz to 0.1 Hz to reduce starvation and improve throughput with many workers
 # TODO: find a nicer way than monkey patch to accomplish this
@@ -125,6 +159,31 @@ def run(l, env=None):
     log("run", rc=rc)
     return rc
 
+def error_fingerprint(name, lines, strip=None):
+    """Return the fingerprint and the title of an error
+
+    ``name`` is the logger of the error and ``lines`` its message, with the
+    traceback if any. The fingerprint only depends on the logger, the frames
+    of the traceback and the exception, without line numbers, ids, addresses
+    nor the ``strip`` prefix of the paths.
+    """
+    frames, summary = [], None
+    for line in lines:
+        if strip:
+            line = line.replace(strip, '')
+        match = _re_frame.match(line)
+        if match:
+            frames.append('%s:%s' % match.groups())
+        elif frames and line.strip() and not line[0].isspace():
+            # the exception ends the traceback
+            summary = line
+    if summary is None:
+        summary = lines[0] if lines else ''
+    summary = _re_fingerprint_noise.sub('#', summary.strip())
+    key = '\n'.join([name or ''] + frames + [summary])
+    title = ('%s: %s' % (name, summary)) if name else summary
+    return hashlib.sha1(ustr(key).encode('utf-8')).hexdigest(), title[:256]
+
 def now():
     return time.strftime(openerp.tools.DEFAULT_SERVER_DATETIME_FORMAT)
 
@@ -151,9 +210,244 @@ def decode_utf(field):
 def uniq_list(l):
     return OrderedDict.fromkeys(l).keys()
 
+def split_shards(items, weights, count):
+    """Split ``items`` into ``count`` lists of balanced total weight
+
+    Items are placed heaviest first on the lightest list. Items without
+    weight are given the mean weight of the others.
+    """
+    known = [weights[item] for item in items if weights.get(item)]
+    default = float(sum(known)) / len(known) if known else 1.0
+    heap = [(0.0, index, []) for index in range(count)]
+    for item in sorted(items, key=lambda item: (-(weights.get(item) or default), item)):
+        total, index, shard = heapq.heappop(heap)
+        shard.append(item)
+        heapq.heappush(heap, (total + (weights.get(item) or default), index, shard))
+    return [sorted(shard) for _, _, shard in sorted(heap, key=lambda s: s[1]) if shard]
+
+def merge_timings(timings, skip=()):
+    """Return the [load time, test time, test count] of the modules of
+    ``timings``, given by database then by module
+
+    A module loaded in several databases, such as a dependency of several
+    shards, is timed once: in the database where it took the longest. The
+    databases of ``skip`` are ignored.
+    """
+    merged = {}
+    for dbname, modules in timings.items():
+        if dbname in skip:
+            continue
+        for module, timing in modules.items():
+            if module not in merged or sum(timing[:2]) > sum(merged[module][:2]):
+                merged[module] = list(timing)
+    return merged
+
+def parallel_command(cmds):
+    """Return a command running ``cmds`` concurrently, which fails if any of them fails"""
+    script = ['pids=""']
+    for cmd in cmds:
+        script.append('%s & pids="$pids $!"' % ' '.join(pipes.quote(arg) for arg in cmd))
+    script.append('rc=0; for pid in $pids; do wait $pid || rc=$?; done; exit $rc')
+    return ['/bin/sh', '-c', '\n'.join(script)]
+
+def with_port(cmd, port):
+    """Return the server command ``cmd`` listening on ``port`` instead of its own port"""
+    return ['--xmlrpc-port=%d' % port if arg.startswith('--xmlrpc-port=') else arg for arg in cmd]
+
 def fqdn():
     return socket.getfqdn()
 
+def port_free(port):
+    """Check that nothing is listening on ``port`` on this host"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', port))
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+def host_pressure():
+    """Return the current load figures of this host
+
+    Memory is in kB, pressures are the ``some avg10`` percentages of
+    /proc/pressure (zero on kernels without PSI).
+    """
+    result = {
+        'load': os.getloadavg()[0],
+        'cpus': os.sysconf('SC_NPROCESSORS_ONLN'),
+        'mem_available': 0,
+        'cpu_pressure': 0.0,
+        'memory_pressure': 0.0,
+    }
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    result['mem_available'] = int(line.split()[1])
+    except IOError:
+        pass
+    for resource_name in ('cpu', 'memory'):
+        try:
+            with open('/proc/pressure/%s' % resource_name) as f:
+                for line in f:
+                    if line.startswith('some '):
+                        values = dict(item.split('=') for item in line.split()[1:])
+                        result['%s_pressure' % resource_name] = float(values['avg10'])
+        except (IOError, OSError):
+            pass
+    return result
+
+def pgroup_rss(pgids):
+    """Return the resident memory (in kB) used by each of the process groups ``pgids``"""
+    pgids = set(pgids)
+    result = dict.fromkeys(pgids, 0)
+    pagesize = resource.getpagesize() / 1024
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % pid) as f:
+                stat = f.read()
+        except IOError:
+            continue
+        # the command name may contain spaces, fields are counted after it
+        stat_fields = stat[stat.rfind(')') + 2:].split()
+        pgid = int(stat_fields[2])
+        if pgid in pgids:
+            result[pgid] += int(stat_fields[21]) * pagesize
+    return result
+
+def parse_cpus(cpus):
+    """Convert a cpu list such as '0-3,8' into a list of cpu numbers"""
+    result = []
+    for item in filter(None, (cpus or '').replace(' ', '').split(',')):
+        if '-' in item:
+            first, last = item.split('-')
+            result += range(int(first), int(last) + 1)
+        else:
+            result.append(int(item))
+    return uniq_list(result)
+
+# resolved at import: find_library forks ldconfig, which must not happen in
+# the preexec_fn of spawn, after the fork of a multithreaded process
+_LIBC = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+def _libc():
+    return _LIBC
+
+def set_affinity(cpus):
+    """Restrict the current process (and its future children) to ``cpus``"""
+    mask = (ctypes.c_ulong * 16)()
+    bits = ctypes.sizeof(ctypes.c_ulong) * 8
+    for cpu in cpus:
+        mask[cpu / bits] |= 1 << (cpu % bits)
+    if _libc().sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        raise OSError(ctypes.get_errno(), 'sched_setaffinity failed')
+
+def set_ioprio(ioclass, level=0):
+    """Set the io scheduling class and level of the current process"""
+    nr = _NR_ioprio_set.get(platform.machine())
+    if nr is None:
+        return
+    # IOPRIO_WHO_PROCESS, current process
+    if _libc().syscall(nr, 1, 0, (IOPRIO_CLASSES[ioclass] << 13) | level) != 0:
+        raise OSError(ctypes.get_errno(), 'ioprio_set failed')
+
+class Watchdog(object):
+    """Kill the process group of spawned jobs as soon as their timeout expires
+
+    Timers are kept in a heap served by a daemon thread, independently of the
+    cron cadence. On expiry the process group receives SIGTERM, then SIGKILL
+    after the grace period if it still holds its lock, and a ``.timeout``
+    marker is left next to the lock file for the scheduler once the signal
+    is delivered. Timers of killed jobs are disarmed so that they do not
+    stop the next job holding the same lock file.
+    """
+
+    def __init__(self):
+        self.timers = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def arm(self, pgid, lock_path, timeout, grace=10):
+        with self.condition:
+            heapq.heappush(self.timers, (time.time() + timeout, pgid, lock_path, grace, signal.SIGTERM))
+            # threads do not survive the fork of the process, e.g. prefork cron workers
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='runbot.watchdog')
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    def disarm(self, pgid):
+        with self.condition:
+            timers = [timer for timer in self.timers if timer[1] != pgid]
+            if len(timers) != len(self.timers):
+                heapq.heapify(timers)
+                self.timers = timers
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.timers or self.timers[0][0] > time.time():
+                    self.condition.wait(self.timers[0][0] - time.time() if self.timers else None)
+                deadline, pgid, lock_path, grace, sig = heapq.heappop(self.timers)
+            try:
+                self.expire(pgid, lock_path, grace, sig)
+            except Exception:
+                _logger.exception('watchdog failed to stop process group %s', pgid)
+
+    def expire(self, pgid, lock_path, grace, sig):
+        if not locked(lock_path):
+            # the job finished in time
+            return
+        _logger.debug('watchdog: %s expired, sending signal %s to %s', lock_path, sig, pgid)
+        try:
+            os.killpg(pgid, sig)
+        except OSError:
+            # the process group is gone, the lock is held by another job
+            return
+        open(timeout_marker(lock_path), 'w').close()
+        if sig == signal.SIGTERM and grace:
+            with self.condition:
+                heapq.heappush(self.timers, (time.time() + grace, pgid, lock_path, 0, signal.SIGKILL))
+                self.condition.notify()
+
+watchdog = Watchdog()
+
+def timeout_marker(lock_path):
+    return os.path.splitext(lock_path)[0] + '.timeout'
+
+def zygote_alive(sock_path):
+    """Check whether a zygote listens on ``sock_path``"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(sock_path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+def zygote_spawn(sock_path, request):
+    """Ask the zygote listening on ``sock_path`` to fork a job process, see zygote.py
+
+    Return the pid of the process, None if the zygote is not available.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(30)
+        sock.connect(sock_path)
+        sock.sendall(simplejson.dumps(request) + '\n')
+        return int(sock.makefile().readline())
+    except (socket.error, ValueError):
+        return None
+    finally:
+        sock.close()
+
 @contextlib.contextmanager
 def local_pgadmin_cursor():
     cnx = None
@@ -207,6 +501,9 @@ class runbot_repo(osv.osv):
                                           ('repo', 'Repository modules (excluding dependencies)'),
                                           ('all', 'All modules (including dependencies)')],
                                          string="Other modules to install automatically"),
+        'modules_impact': fields.boolean('Test impacted modules only',
+                                         help="Builds of non-sticky branches only install and test the modules changed "
+                                              "since their base branch and the modules depending on them."),
         'dependency_ids': fields.many2many(
             'runbot.repo', 'runbot_repo_dep_rel',
             id1='dependant_id', id2='dependency_id',
@@ -214,10 +511,13 @@ class runbot_repo(osv.osv):
             help="Community addon repos which need to be present to run tests."),
         'token': fields.char("Github token"),
         'group_ids': fields.many2many('res.groups', string='Limited to groups'),
+        'share_weight': fields.float('Share weight', help="Relative share of the workers given to this repository by the fair scheduling policy."),
+        'max_testing': fields.integer('Maximum testing builds', help="Maximum number of non-sticky builds of this repository tested at the same time. For no limit: Mark it zero"),
     }
     _defaults = {
         'mode': 'poll',
         'modules_auto': 'repo',
+        'share_weight': 1.0,
         'job_timeout': 30,
     }
 
@@ -352,36 +652,45 @@ class runbot_repo(osv.osv):
         Build.skip(cr, uid, to_be_skipped_ids)
 
     def scheduler(self, cr, uid, ids=None, context=None):
-        icp = self.pool['ir.config_parameter']
-        workers = int(icp.get_param(cr, uid, 'runbot.workers', default=6))
-        running_max = int(icp.get_param(cr, uid, 'runbot.running_max', default=75))
+        Host = self.pool['runbot.host']
+        host_id = Host.heartbeat(cr, uid)
+        workers, running_max = Host.get_capacity(cr, uid, [host_id])
         host = fqdn()
 
+        # give back the builds of the hosts that stopped beating
+        Host.requeue_dead(cr, uid)
+        # stop our processes of the builds given back while this host looked dead
+        Host.kill_orphans(cr, uid)
+
         Build = self.pool['runbot.build']
         domain = [('repo_id', 'in', ids)]
         domain_host = domain + [('host', '=', host)]
 
+        # exit status of the finished jobs, see _memory_exceeded
+        Build.reap(cr, uid, [])
+
         # schedule jobs (transitions testing -> running, kill jobs, ...)
         build_ids = Build.search(cr, uid, domain_host + [('state', 'in', ['testing', 'running'])])
         Build.schedule(cr, uid, build_ids)
 
-        # launch new tests
+        # launch new tests: claim our share of pending builds given our free workers
         testing = Build.search_count(cr, uid, domain_host + [('state', '=', 'testing')])
-        pending = Build.search_count(cr, uid, domain + [('state', '=', 'pending')])
-
-        while testing < workers and pending > 0:
-
-            # find sticky pending build if any, otherwise, last pending (by id, not by sequence) will do the job
-            pending_ids = Build.search(cr, uid, domain + [('state', '=', 'pending'), ('branch_id.sticky', '=', True)], limit=1)
-            if not pending_ids:
-                pending_ids = Build.search(cr, uid, domain + [('state', '=', 'pending')], order="sequence", limit=1)
-
-            pending_build = Build.browse(cr, uid, pending_ids[0])
-            pending_build.schedule()
-
-            # compute the number of testing and pending jobs again
-            testing = Build.search_count(cr, uid, domain_host + [('state', '=', 'testing')])
-            pending = Build.search_count(cr, uid, domain + [('state', '=', 'pending')])
+        # builds running concurrent jobs take several slots
+        testing = max(testing, Build._used_slots(cr, uid, host))
+        quota = Host.claim_quota(cr, uid, host_id, workers - testing, ids or [])
+        if quota:
+            claimed_ids = Build.claim(cr, uid, ids, host, quota)
+            # release the row locks before starting the (long) first jobs
+            cr.commit()
+            Build.start(cr, uid, claimed_ids)
+        elif ids and testing >= workers:
+            # all workers are busy, make room for sticky builds waiting for too long
+            preempted_ids = Build.preempt(cr, uid, ids, host)
+            if preempted_ids:
+                cr.commit()
+                claimed_ids = Build.claim(cr, uid, ids, host, len(preempted_ids))
+                cr.commit()
+                Build.start(cr, uid, claimed_ids)
 
         # terminate and reap doomed build
         build_ids = Build.search(cr, uid, domain_host + [('state', '=', 'running')])
@@ -438,6 +747,233 @@ class runbot_repo(osv.osv):
         self.scheduler(cr, uid, ids, context=context)
         self.reload_nginx(cr, uid, context=context)
 
+class runbot_host(osv.osv):
+    _name = "runbot.host"
+    _order = 'name'
+
+    def _get_alive(self, cr, uid, ids, field_name, arg, context=None):
+        timeout = self._heartbeat_timeout(cr, uid)
+        result = {}
+        for host in self.browse(cr, uid, ids, context=context):
+            result[host.id] = bool(host.heartbeat) and time.time() - dt2time(host.heartbeat) < timeout
+        return result
+
+    _columns = {
+        'name': fields.char('Host', required=True, select=1),
+        'heartbeat': fields.datetime('Last heartbeat'),
+        'alive': fields.function(_get_alive, type='boolean', string='Alive'),
+        'nb_worker': fields.integer('Workers', help='Maximum number of testing builds. For runbot.workers: Mark it zero'),
+        'running_max': fields.integer('Maximum running builds', help='For runbot.running_max: Mark it zero'),
+        'nb_testing': fields.integer('Testing builds', readonly=True),
+        'nb_running': fields.integer('Running builds', readonly=True),
+        'load_avg': fields.float('Load average', readonly=True),
+        'mem_available': fields.integer('Available memory (MB)', readonly=True),
+        'cpu_pressure': fields.float('CPU pressure (%)', readonly=True),
+        'memory_pressure': fields.float('Memory pressure (%)', readonly=True),
+        'adaptive': fields.boolean('Adaptive workers', help='Adjust the number of workers to the load, memory and pressure of the host'),
+        'nb_worker_min': fields.integer('Minimum workers'),
+        'nb_worker_max': fields.integer('Maximum workers', help='For the number of CPUs: Mark it zero'),
+        'nb_worker_current': fields.integer('Current workers', readonly=True),
+        'testing_cpus': fields.char('Testing CPUs', help="CPUs of the testing jobs, e.g. '2-15'. For all CPUs: Leave it empty"),
+        'cpus_per_job': fields.integer('CPUs per testing job', help="Pin each testing build to its own set of CPUs. For no pinning: Mark it zero"),
+        'testing_nice': fields.integer('Testing niceness'),
+        'testing_ioclass': fields.selection([('best-effort', 'Best effort'), ('idle', 'Idle')], string='Testing io class'),
+        'running_cpus': fields.char('Running CPUs', help="CPUs of the running builds. For all CPUs: Leave it empty"),
+        'running_nice': fields.integer('Running niceness'),
+    }
+    _defaults = {
+        'testing_nice': 0,
+        'testing_ioclass': 'best-effort',
+    }
+
+    _sql_constraints = [
+        ('name_uniq', 'unique(name)', 'A host can only be registered once.'),
+    ]
+
+    def _heartbeat_timeout(self, cr, uid, context=None):
+        icp = self.pool['ir.config_parameter']
+        return int(icp.get_param(cr, uid, 'runbot.host_timeout', default=600))
+
+    def _get_host(self, cr, uid, name=None, context=None):
+        """Return the id of the host ``name`` (default: this host), registering it if needed"""
+        name = name or fqdn()
+        host_ids = self.search(cr, uid, [('name', '=', name)], context=context)
+        if host_ids:
+            return host_ids[0]
+        return self.create(cr, uid, {'name': name}, context=context)
+
+    def get_capacity(self, cr, uid, ids, context=None):
+        """Return the (workers, running_max) capacity of the host"""
+        icp = self.pool['ir.config_parameter']
+        for host in self.browse(cr, uid, ids, context=context):
+            workers = host.nb_worker or int(icp.get_param(cr, uid, 'runbot.workers', default=6))
+            if host.adaptive and host.nb_worker_current:
+                workers = host.nb_worker_current
+            running_max = host.running_max or int(icp.get_param(cr, uid, 'runbot.running_max', default=75))
+            return workers, running_max
+        return 0, 0
+
+    def placement(self, cr, uid, ids, job_class, slot=0, slots=1, context=None):
+        """Return the spawn placement of a job on the host
+
+        :param job_class: 'testing' or 'running'
+        :param slot: 1-based first cpu slot of a testing build, see ``cpus_per_job``
+        :param slots: number of consecutive cpu slots of the job
+        :return: dict suitable for the ``placement`` of runbot_build.spawn
+        """
+        for host in self.browse(cr, uid, ids, context=context):
+            if job_class == 'testing':
+                cpus = parse_cpus(host.testing_cpus)
+                if host.cpus_per_job and slot:
+                    cpus = cpus or range(os.sysconf('SC_NPROCESSORS_ONLN'))
+                    count = max(len(cpus) / host.cpus_per_job, 1)
+                    indexes = sorted(set((slot - 1 + i) % count for i in range(slots)))
+                    cpus = sum([cpus[index * host.cpus_per_job:(index + 1) * host.cpus_per_job]
+                                for index in indexes], [])
+                # lowest priority level of the class
+                return {'cpus': cpus, 'nice': host.testing_nice,
+                        'ioclass': host.testing_ioclass or 'best-effort', 'iolevel': 7}
+            # interactive: highest priority level of best effort
+            return {'cpus': parse_cpus(host.running_cpus), 'nice': host.running_nice,
+                    'ioclass': 'best-effort', 'iolevel': 0}
+
+    def heartbeat(self, cr, uid, context=None):
+        """Record that this host is alive along with its current load, return its id"""
+        Build = self.pool['runbot.build']
+        host_id = self._get_host(cr, uid, context=context)
+        name = fqdn()
+        pressure = host_pressure()
+        self.write(cr, uid, [host_id], {
+            'heartbeat': now(),
+            'nb_testing': Build.search_count(cr, uid, [('state', '=', 'testing'), ('host', '=', name)]),
+            'nb_running': Build.search_count(cr, uid, [('state', '=', 'running'), ('host', '=', name)]),
+            'load_avg': pressure['load'],
+            'mem_available': pressure['mem_available'] / 1024,
+            'cpu_pressure': pressure['cpu_pressure'],
+            'memory_pressure': pressure['memory_pressure'],
+        }, context=context)
+        self.adapt_workers(cr, uid, host_id, pressure, context=context)
+        return host_id
+
+    def adapt_workers(self, cr, uid, host_id, pressure, context=None):
+        """Raise or lower the number of workers of an adaptive host by one
+
+        The host is overloaded when the CPU or memory pressure goes above the
+        ``runbot.cpu_pressure_max``/``runbot.memory_pressure_max`` percentages,
+        when the load exceeds 1.5 per CPU or when there is not enough memory
+        left for another testing build (estimated from the resident memory of
+        the builds being tested). It is underloaded when all of them are well
+        below their limits while all its workers are used.
+        """
+        host = self.browse(cr, uid, host_id, context=context)
+        if not host.adaptive:
+            return
+        icp = self.pool['ir.config_parameter']
+        cpu_pressure_max = float(icp.get_param(cr, uid, 'runbot.cpu_pressure_max', default=40))
+        memory_pressure_max = float(icp.get_param(cr, uid, 'runbot.memory_pressure_max', default=10))
+        low = max(host.nb_worker_min, 1)
+        high = max(host.nb_worker_max or pressure['cpus'], low)
+        workers = host.nb_worker_current or host.nb_worker or int(icp.get_param(cr, uid, 'runbot.workers', default=6))
+
+        Build = self.pool['runbot.build']
+        build_ids = Build.search(cr, uid, [('state', '=', 'testing'), ('host', '=', host.name), ('pid', '>', 0)])
+        pids = [build['pid'] for build in Build.read(cr, uid, build_ids, ['pid'])]
+        rss = pgroup_rss(pids).values()
+        build_rss = sum(rss) / len(rss) if rss else 0
+
+        load = pressure['load'] / pressure['cpus']
+        if (pressure['cpu_pressure'] > cpu_pressure_max or
+                pressure['memory_pressure'] > memory_pressure_max or
+                load > 1.5 or
+                pressure['mem_available'] < build_rss):
+            workers -= 1
+        elif (pressure['cpu_pressure'] < cpu_pressure_max / 2 and
+                pressure['memory_pressure'] < memory_pressure_max / 2 and
+                load < 0.75 and
+                pressure['mem_available'] > 2 * build_rss and
+                host.nb_testing >= workers):
+            workers += 1
+        workers = min(max(workers, low), high)
+        if workers != host.nb_worker_current:
+            _logger.info('host %s: adapting workers from %s to %s (%r, build rss %skB)',
+                         host.name, host.nb_worker_current, workers, pressure, build_rss)
+            host.write({'nb_worker_current': workers})
+
+    def requeue_dead(self, cr, uid, context=None):
+        """Give back the builds of hosts whose heartbeat expired
+
+        Testing builds are put back in the queue so that a live host can claim
+        them, running builds cannot be served anymore and are marked as done.
+        The jobs of both are cancelled, so that the host kills their processes
+        if it comes back, see kill_orphans.
+        """
+        Build = self.pool['runbot.build']
+        dead = [host.name for host in self.browse(cr, uid, self.search(cr, uid, [], context=context), context=context)
+                if host.heartbeat and not host.alive]
+        if not dead:
+            return
+        testing_ids = Build.search(cr, uid, [('host', 'in', dead), ('state', '=', 'testing')], context=context)
+        if testing_ids:
+            _logger.info('requeue builds %s of dead hosts %s', testing_ids, dead)
+            Build.requeue(cr, uid, testing_ids, context=context)
+        running_ids = Build.search(cr, uid, [('host', 'in', dead), ('state', '=', 'running')], context=context)
+        Build._cancel_jobs(cr, uid, running_ids, context=context)
+        Build.write(cr, uid, running_ids, {'state': 'done', 'job': False}, context=context)
+        self.pool['runbot.port'].release(cr, uid, running_ids)
+
+    def kill_orphans(self, cr, uid, context=None):
+        """Kill the processes of this host whose jobs were cancelled by
+        another host, e.g. when a long scheduler pass let the heartbeat of
+        this host expire and its builds were requeued"""
+        Job = self.pool['runbot.build.job']
+        since = (datetime.datetime.utcnow() - datetime.timedelta(days=1)).strftime(openerp.tools.DEFAULT_SERVER_DATETIME_FORMAT)
+        job_ids = Job.search(cr, uid, [('host', '=', fqdn()), ('state', '=', 'cancelled'), ('reaped', '=', False),
+                                       ('pid', '>', 0), ('job_end', '>', since)], context=context)
+        for job in Job.read(cr, uid, job_ids, ['pid'], context=context):
+            watchdog.disarm(job['pid'])
+            try:
+                os.killpg(job['pid'], signal.SIGKILL)
+                _logger.info('killed process group %s of a requeued build', job['pid'])
+            except OSError:
+                pass
+
+    def claim_quota(self, cr, uid, host_id, free, repo_ids, context=None):
+        """Return how many pending builds ``host_id`` should claim with ``free`` slots
+
+        Pending builds are spread over the live hosts in proportion of their free
+        capacity, so that a burst of builds is not entirely taken by the first
+        host whose scheduler runs.
+        """
+        if free <= 0:
+            return 0
+        Build = self.pool['runbot.build']
+        pending = Build.search_count(cr, uid, [('repo_id', 'in', repo_ids), ('state', '=', 'pending')])
+        if not pending:
+            return 0
+        total_free = free
+        for host in self.browse(cr, uid, self.search(cr, uid, [('id', '!=', host_id)], context=context), context=context):
+            if host.alive:
+                workers, running_max = host.get_capacity()
+                total_free += max(workers - host.nb_testing, 0)
+        return min(free, max(1, int(math.ceil(pending * free / float(total_free)))))
+
+    def host_stats(self, cr, uid, context=None):
+        """Return the load figures of the live hosts for the dashboards"""
+        stats = []
+        for host in self.browse(cr, uid, self.search(cr, uid, [], context=context), context=context):
+            if not host.alive:
+                continue
+            workers, running_max = host.get_capacity()
+            stats.append({
+                'host': host.name,
+                'testing': host.nb_testing,
+                'running': host.nb_running,
+                'workers': workers,
+                'running_max': running_max,
+                'load': host.load_avg,
+            })
+        return stats
+
 class runbot_branch(osv.osv):
     _name = "runbot.branch"
     _order = 'name'
@@ -476,6 +1012,8 @@ class runbot_branch(osv.osv):
         'state': fields.char('Status'),
         'modules': fields.char("Modules to Install", help="Comma-separated list of modules to install and test."),
         'job_timeout': fields.integer('Job Timeout (minutes)', help='For default timeout: Mark it zero'),
+        'job_memory_limit': fields.integer('Job Memory Limit (MB)', help='For default memory limit: Mark it zero'),
+        'fail_fast': fields.boolean('Fail fast', help='Stop testing as soon as an error is logged'),
     }
 
     def _get_pull_info(self, cr, uid, ids, context=None):
@@ -566,8 +1104,11 @@ class runbot_build(osv.osv):
         'committer_email': fields.char('Committer Email'),
         'subject': fields.text('Subject'),
         'sequence': fields.integer('Sequence', select=1),
+        'queue_date': fields.datetime('Queued since'),
+        'cpu_slot': fields.integer('CPU slot'),
+        'shards': fields.integer('Test shards', help='Number of parallel processes testing the modules'),
         'modules': fields.char("Modules to Install"),
-        'result': fields.char('Result'), # ok, ko, warn, skipped, killed
+        'result': fields.char('Result'), # ok, ko, warn, skipped, killed, oom
         'pid': fields.integer('Pid'),
         'state': fields.char('Status'), # pending, testing, running, done, duplicate
         'job': fields.char('Job'), # job_*
@@ -576,6 +1117,16 @@ class runbot_build(osv.osv):
         'job_time': fields.function(_get_time, type='integer', string='Job time'),
         'job_age': fields.function(_get_age, type='integer', string='Job age'),
         'duplicate_id': fields.many2one('runbot.build', 'Corresponding Build'),
+        'retry_of_id': fields.many2one('runbot.build', 'Retry of', readonly=True, select=1,
+                                       help='Build whose failed modules are tested again by this build'),
+        'retry_ids': fields.one2many('runbot.build', 'retry_of_id', 'Retries', readonly=True),
+        'input_hash': fields.char('Input hash', readonly=True, select=1,
+                                  help='Hash of the trees, modules and jobs the result of the build depends on'),
+        'server_hash': fields.char('Server hash', readonly=True,
+                                   help='Hash of the git trees of the server package, with its tests and core modules, '
+                                        'and of the server scripts of the checkout'),
+        'python_env': fields.char('Python environment', readonly=True,
+                                  help='Hash of the python requirements of the build, whose environment runs it'),
         'server_match': fields.selection([('builtin', 'This branch includes Odoo server'),
                                           ('exact', 'branch/PR exact name'),
                                           ('prefix', 'branch whose name is a prefix of current one'),
@@ -592,7 +1143,7 @@ class runbot_build(osv.osv):
     def create(self, cr, uid, values, context=None):
         build_id = super(runbot_build, self).create(cr, uid, values, context=context)
         build = self.browse(cr, uid, build_id)
-        extra_info = {'sequence' : build_id}
+        extra_info = {'sequence' : build_id, 'queue_date': now()}
 
         # detect duplicate
         domain = [
@@ -603,13 +1154,51 @@ class runbot_build(osv.osv):
         ]
         duplicate_ids = self.search(cr, uid, domain, context=context)
 
-        if len(duplicate_ids):
+        # a retry tests again what its build tested, it is never a duplicate
+        if len(duplicate_ids) and not build.retry_of_id:
             extra_info.update({'state': 'duplicate', 'duplicate_id': duplicate_ids[0]})
             self.write(cr, uid, [duplicate_ids[0]], {'duplicate_id': build_id})
         self.write(cr, uid, [build_id], extra_info, context=context)
+        return build_id
 
     def reset(self, cr, uid, ids, context=None):
-        self.write(cr, uid, ids, { 'state' : 'pending' }, context=context)
+        self._cancel_jobs(cr, uid, ids, context=context)
+        self.write(cr, uid, ids, { 'state' : 'pending', 'queue_date': now() }, context=context)
+
+    def _cancel_jobs(self, cr, uid, ids, context=None):
+        """Forget the jobs run so far, the pipeline of the builds starts over"""
+        Job = self.pool['runbot.build.job']
+        job_ids = Job.search(cr, uid, [('build_id', 'in', ids), ('state', 'in', ['running', 'done'])], context=context)
+        running_ids = []
+        for job in Job.read(cr, uid, job_ids, ['pid', 'state'], context=context):
+            if job['pid'] > 0:
+                watchdog.disarm(job['pid'])
+            if job['state'] == 'running':
+                running_ids.append(job['id'])
+        Job.write(cr, uid, job_ids, {'state': 'cancelled'}, context=context)
+        # when the processes were given up, see runbot_host.kill_orphans
+        Job.write(cr, uid, running_ids, {'job_end': now()}, context=context)
+
+    def requeue(self, cr, uid, ids, context=None):
+        """Put builds back in the queue so that any host can claim them again"""
+        self.pool['runbot.port'].release(cr, uid, ids)
+        self._cancel_jobs(cr, uid, ids, context=context)
+        self.write(cr, uid, ids, {
+            'state': 'pending',
+            'queue_date': now(),
+            'host': False,
+            'port': False,
+            'pid': False,
+            'job': False,
+            'job_start': False,
+            'job_end': False,
+            'cpu_slot': 0,
+            'shards': 0,
+            'input_hash': False,
+            'server_hash': False,
+            'python_env': False,
+            'result': '',
+        }, context=context)
 
     def logger(self, cr, uid, ids, *l, **kw):
         l = list(l)
@@ -617,23 +1206,48 @@ class runbot_build(osv.osv):
             l[0] = "%s %s" % (build.dest , l[0])
             _logger.debug(*l)
 
+    # jobs whose log decides the result of the build, see job_30_run
+    _fail_fast_jobs = ['job_20_test_all']
+
     def list_jobs(self):
         return sorted(job for job in dir(self) if _re_job.match(job))
 
-    def find_port(self, cr, uid):
-        # currently used port
-        ids = self.search(cr, uid, [('state','not in',['pending','done'])])
-        ports = set(i['port'] for i in self.read(cr, uid, ids, ['port']))
+    # specs of the jobs of the default pipeline, see pipeline()
+    _pipeline = {
+        'job_00_init': {'depends': [], 'spawn': False},
+        'job_10_test_base': {'depends': ['job_00_init']},
+        'job_20_test_all': {'depends': ['job_00_init']},
+    }
 
-        # starting port
+    def pipeline(self, cr, uid, context=None):
+        """Return the jobs of the builds with their spec, in order
+
+        A spec gives the jobs that must be done before the job starts
+        (``depends``, by default the previous job), whether the job spawns a
+        process or runs within the scheduler (``spawn``), and the testing
+        slots of the host its process takes (``slots``). Jobs whose
+        dependencies are done run concurrently. The last job is the running
+        stage of the build and waits for every other job. A sharded
+        job_20_test_all runs a server process per shard besides the one of
+        the -all database, and takes as many slots.
+        """
         icp = self.pool['ir.config_parameter']
-        port = int(icp.get_param(cr, uid, 'runbot.starting_port', default=2000))
-
-        # find next free port
-        while port in ports:
-            port += 2
-
-        return port
+        shards = int(icp.get_param(cr, uid, 'runbot.test_shards', default=1))
+        jobs = self.list_jobs()
+        specs = OrderedDict()
+        for index, job in enumerate(jobs):
+            spec = {'depends': jobs[max(index - 1, 0):index], 'spawn': True, 'slots': 1}
+            spec.update(self._pipeline.get(job, {}))
+            if job == 'job_20_test_all' and shards > 1:
+                spec['slots'] = shards + 1
+            if job == jobs[-1]:
+                spec['depends'] = jobs[:-1]
+            specs[job] = spec
+        return specs
+
+    def find_port(self, cr, uid, build_id, host=None):
+        """Reserve a free port on ``host`` (default: this host) for ``build_id``"""
+        return self.pool['runbot.port'].allocate(cr, uid, build_id, host=host)
 
     def _get_closest_branch_name(self, cr, uid, ids, target_repo_id, context=None):
         """Return (repo, branch name) of the closest common branch between build's branch and
@@ -742,6 +1356,15 @@ class runbot_build(osv.osv):
         # 5. last-resort value
         return target_repo_id, 'master', 'default'
 
+    def _closest_branch(self, cr, uid, ids, target_repo_id, closest=None, context=None):
+        """_get_closest_branch_name, remembered in the ``closest`` dict by
+        target repository so that it is searched once per job"""
+        if closest is None:
+            return self._get_closest_branch_name(cr, uid, ids, target_repo_id, context=context)
+        if target_repo_id not in closest:
+            closest[target_repo_id] = self._get_closest_branch_name(cr, uid, ids, target_repo_id, context=context)
+        return closest[target_repo_id]
+
     def path(self, cr, uid, ids, *l, **kw):
         for build in self.browse(cr, uid, ids, context=None):
             root = self.pool['runbot.repo'].root(cr, uid)
@@ -765,7 +1388,7 @@ class runbot_build(osv.osv):
         )
         return uniq_list(filter(mod_filter, modules))
 
-    def checkout(self, cr, uid, ids, context=None):
+    def checkout(self, cr, uid, ids, closest=None, context=None):
         for build in self.browse(cr, uid, ids, context=context):
             # starts from scratch
             if os.path.isdir(build.path()):
@@ -801,7 +1424,7 @@ class runbot_build(osv.osv):
                     _logger.debug("local modules_to_test for build %s: %s", build.dest, modules_to_test)
 
                 for extra_repo in build.repo_id.dependency_ids:
-                    repo_id, closest_name, server_match = build._get_closest_branch_name(extra_repo.id)
+                    repo_id, closest_name, server_match = build._closest_branch(extra_repo.id, closest=closest)
                     repo = self.pool['runbot.repo'].browse(cr, uid, repo_id, context=context)
                     _logger.debug('branch %s of %s: %s match branch %s of %s',
                                   build.branch_id.name, build.repo_id.name,
@@ -838,9 +1461,343 @@ class runbot_build(osv.osv):
 
             modules_to_test = self.filter_modules(cr, uid, modules_to_test,
                                                   set(available_modules), explicit_modules)
+            if build.repo_id.modules_impact and not build.branch_id.sticky:
+                impacted = build._impacted_modules(available_modules)
+                impacted_to_test = [m for m in modules_to_test if m in explicit_modules or m in (impacted or ())]
+                if impacted is not None and impacted_to_test:
+                    build._log('Building environment', 'Testing %d impacted modules out of %d' %
+                               (len(impacted_to_test), len(modules_to_test)))
+                    modules_to_test = impacted_to_test
             _logger.debug("modules_to_test for build %s: %s", build.dest, modules_to_test)
+            if build.retry_of_id:
+                # only the failed modules of the retried build
+                modules_to_test = build.modules.split(',')
             build.write({'server_match': server_match,
-                         'modules': ','.join(modules_to_test)})
+                         'modules': ','.join(modules_to_test),
+                         'server_hash': False})
+            build._server_hash(closest=closest)
+            build._python_env()
+            build._compile_bytecode()
+
+    def _bytecode_cache(self, cr, uid, context=None):
+        """Return the directory of the bytecode cache shared by the builds, None if disabled"""
+        icp = self.pool['ir.config_parameter']
+        if icp.get_param(cr, uid, 'runbot.bytecode_cache', default='1') in ('0', 'False'):
+            return None
+        return os.path.join(self.pool['runbot.repo'].root(cr, uid), 'pycache')
+
+    def _compile_bytecode(self, cr, uid, ids, context=None):
+        """Link the bytecode of the python files of the checkout from the shared cache, see pycompile.py"""
+        cache_dir = self._bytecode_cache(cr, uid, context=context)
+        if not cache_dir:
+            return
+        script = os.path.join(os.path.dirname(__file__), 'pycompile.py')
+        for build in self.browse(cr, uid, ids, context=context):
+            if run([build._python(), script, cache_dir, build.path()]):
+                _logger.warning('bytecode compilation of build %s failed', build.dest)
+
+    # entries of a commit holding the server package and scripts, see _server_hash
+    _server_paths = ['odoo', 'openerp', 'openerp-server', 'openerp-server.py', 'bin']
+
+    def _server_hash(self, cr, uid, ids, closest=None, context=None):
+        """Return the hash of the server tree of the build
+
+        It is the hash of the git trees of the server package and scripts, in
+        the commit of the build or else in the branch of the dependency
+        repository providing them. The checkout is only hashed when git fails.
+        """
+        Repo = self.pool['runbot.repo']
+        for build in self.browse(cr, uid, ids, context=context):
+            if build.server_hash:
+                return build.server_hash
+            try:
+                sources = [(build.repo_id, build.name)]
+                for extra_repo in build.repo_id.dependency_ids:
+                    repo_id, closest_name, server_match = build._closest_branch(extra_repo.id, closest=closest)
+                    sources.append((Repo.browse(cr, uid, repo_id, context=context), closest_name))
+                for repo, ref in sources:
+                    trees = repo.git(['ls-tree', ref, '--'] + self._server_paths)
+                    if trees.strip():
+                        build.write({'server_hash': hashlib.sha1(trees).hexdigest()[:20]})
+                        return build.server_hash
+            except subprocess.CalledProcessError:
+                pass
+            server = build.server()
+            digest = hashlib.sha1()
+            for dirpath, dirnames, filenames in os.walk(server):
+                if dirpath == build.server('addons'):
+                    dirnames[:] = [d for d in dirnames if d == 'base']
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.endswith('.pyc'):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    digest.update(os.path.relpath(path, server) + '\0')
+                    with open(path, 'rb') as f:
+                        digest.update(hashlib.sha1(f.read()).digest())
+            build.write({'server_hash': digest.hexdigest()[:20]})
+            return build.server_hash
+
+    def _capabilities(self, cr, uid, ids, context=None):
+        """Return the capabilities of the server of the build, see runbot.server.capability"""
+        for build in self.browse(cr, uid, ids, context=context):
+            return self.pool['runbot.server.capability'].probe(cr, uid, build._server_hash(), build.path(),
+                                                               build.server(), context=context)
+
+    def _zygote(self, cr, uid, ids, cmd, context=None):
+        """Return the socket of the zygote of the server of the build, None
+        if runbot.zygote is not set or ``cmd`` can not be forked by a zygote
+
+        The zygote is started when needed. It only runs the servers of the
+        openerp cli, from a copy without the modules of the build: their
+        addons path is appended to ``cmd``.
+        """
+        icp = self.pool['ir.config_parameter']
+        if icp.get_param(cr, uid, 'runbot.zygote', default='0') in ('0', 'False'):
+            return None
+        for build in self.browse(cr, uid, ids, context=context):
+            if len(cmd) < 2 or cmd[0] != build._python() or not build._capabilities()['cli']:
+                return None
+            zygote_dir = os.path.join(self.pool['runbot.repo'].root(cr, uid), 'zygote')
+            mkdirs([zygote_dir])
+            # a zygote by server and python environment
+            path = os.path.join(zygote_dir, '-'.join(filter(None, [build._server_hash(), build.python_env])))
+            sock_path = path + '.sock'
+            with open(path + '.lock', 'w') as f:
+                # a single zygote by server, whatever the number of cron workers
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if not zygote_alive(sock_path) and not build._start_zygote(path, sock_path):
+                    return None
+            # last argument, removed by spawn when it falls back to Popen
+            cmd.append('--addons-path=%s' % build.server('addons'))
+            return sock_path
+
+    def _start_zygote(self, cr, uid, ids, path, sock_path, context=None):
+        """Copy the server of the build to ``path`` and start its zygote on
+        ``sock_path``, return whether the zygote is listening"""
+        icp = self.pool['ir.config_parameter']
+        idle = icp.get_param(cr, uid, 'runbot.zygote_idle', default='1800')
+        for build in self.browse(cr, uid, ids, context=context):
+            if not os.path.isdir(path):
+                tmp = '%s.%d' % (path, os.getpid())
+                mkdirs([tmp])
+                # hard links, as the checkout they share the cached bytecode
+                if run(['cp', '-al', build.server(), tmp]):
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    return False
+                addons = os.path.join(tmp, os.path.basename(build.server()), 'addons')
+                for module in os.listdir(addons):
+                    if module != 'base' and os.path.isdir(os.path.join(addons, module)):
+                        shutil.rmtree(os.path.join(addons, module))
+                os.rename(tmp, path)
+            script = os.path.join(os.path.dirname(__file__), 'zygote.py')
+            out = open(path + '.log', 'a')
+            p = subprocess.Popen([build._python(), script, sock_path, path, idle], stdout=out, stderr=out,
+                                 preexec_fn=os.setsid, close_fds=True)
+            _spawned[p.pid] = p
+            # the framework is imported before listening
+            for i in range(60):
+                if zygote_alive(sock_path):
+                    build._log('zygote', 'Started the zygote of server %s' % os.path.basename(path))
+                    return True
+                if p.poll() is not None:
+                    break
+                time.sleep(0.5)
+            _logger.warning('zygote %s did not start, see %s.log', path, path)
+            return False
+
+    def _requirements(self, cr, uid, ids, context=None):
+        """Return the python requirements of the build: the lines of its
+        requirements.txt, else the python external dependencies of its modules"""
+        for build in self.browse(cr, uid, ids, context=context):
+            path = build.path('requirements.txt')
+            if os.path.isfile(path):
+                with open(path) as f:
+                    # comments start at a # preceded by a blank, unlike url fragments such as #egg=
+                    lines = filter(None, [re.sub(r'(^|\s)#.*$', '', line).strip() for line in f])
+                # pip options and includes are not supported
+                ignored = [line for line in lines if line.startswith('-')]
+                if ignored:
+                    build._log('python_env', 'Ignored requirements.txt lines: %s' % ', '.join(ignored))
+                return sorted(set(line for line in lines if not line.startswith('-')))
+            requirements = set()
+            for module in filter(None, (build.modules or '').split(',')):
+                try:
+                    with open(build.server('addons', module, '__openerp__.py')) as f:
+                        manifest = ast.literal_eval(f.read())
+                except (IOError, SyntaxError, ValueError):
+                    continue
+                requirements.update(manifest.get('external_dependencies', {}).get('python', []))
+            return sorted(requirements)
+
+    def _python_env(self, cr, uid, ids, context=None):
+        """Set up the python environment of the requirements of the build
+        when runbot.wheelhouse is set, see _python
+
+        The environments are cached by hash of the requirements, which are
+        installed offline from the runbot.wheelhouse directory.
+        """
+        icp = self.pool['ir.config_parameter']
+        wheelhouse = icp.get_param(cr, uid, 'runbot.wheelhouse')
+        for build in self.browse(cr, uid, ids, context=context):
+            requirements = build._requirements() if wheelhouse else []
+            if not requirements:
+                build.write({'python_env': False})
+                continue
+            key = hashlib.sha1('\n'.join([sys.version] + requirements)).hexdigest()[:20]
+            env_dir = os.path.join(self.pool['runbot.repo'].root(cr, uid), 'venv')
+            mkdirs([env_dir])
+            path = os.path.join(env_dir, key)
+            with open(path + '.lock', 'w') as f:
+                # a single installation by environment, whatever the number of cron workers
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if not os.path.isfile(os.path.join(path, 'requirements.txt')):
+                    build._log('python_env', 'Installing %d python requirements' % len(requirements))
+                    if not self._create_python_env(cr, uid, path, requirements, wheelhouse, context=context):
+                        build._log('python_env', 'Python requirements not installed, see %s.log' % path)
+                        build.write({'python_env': False})
+                        continue
+                # used from now on, for the eviction of the other hosts and workers, see _local_cleanup
+                os.utime(path, None)
+                build.write({'python_env': key})
+                cr.commit()
+
+    def _create_python_env(self, cr, uid, path, requirements, wheelhouse, context=None):
+        """Install ``requirements`` from ``wheelhouse`` in a new environment
+        at ``path``, return whether it succeeded
+
+        The environment is a hard linked copy of a bare virtualenv of the
+        runbot interpreter, which also sees the packages of the runbot.
+        """
+        env_dir = os.path.dirname(path)
+        base = os.path.join(env_dir, 'base-%s' % platform.python_version())
+        with open(path + '.log', 'w') as out:
+            with open(base + '.lock', 'w') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if not os.path.isfile(os.path.join(base, 'bin', 'python')):
+                    shutil.rmtree(base, ignore_errors=True)
+                    if subprocess.call([sys.executable, '-m', 'virtualenv', '--system-site-packages',
+                                        '--python', sys.executable, base], stdout=out, stderr=out):
+                        shutil.rmtree(base, ignore_errors=True)
+                        return False
+            shutil.rmtree(path, ignore_errors=True)
+            # pip replaces the files it installs, the base environment is left untouched
+            if run(['cp', '-al', base, path]):
+                shutil.rmtree(path, ignore_errors=True)
+                return False
+            requirements_path = os.path.join(path, 'requirements.tmp')
+            with open(requirements_path, 'w') as f:
+                f.write('\n'.join(requirements) + '\n')
+            if subprocess.call([os.path.join(path, 'bin', 'python'), '-m', 'pip', 'install', '--no-index',
+                                '--find-links', wheelhouse, '-r', requirements_path], stdout=out, stderr=out):
+                shutil.rmtree(path, ignore_errors=True)
+                return False
+            # marks the environment as complete
+            os.rename(requirements_path, os.path.join(path, 'requirements.txt'))
+        return True
+
+    def _python(self, cr, uid, ids, context=None):
+        """Return the interpreter running the build: the one of its python
+        environment, else the runbot's"""
+        for build in self.browse(cr, uid, ids, context=context):
+            if build.python_env:
+                path = os.path.join(self.pool['runbot.repo'].root(cr, uid), 'venv', build.python_env)
+                if os.path.isfile(os.path.join(path, 'bin', 'python')):
+                    # least recently used environments are evicted first, see _local_cleanup
+                    os.utime(path, None)
+                    return os.path.join(path, 'bin', 'python')
+            return sys.executable
+
+    def _reuse_checkout(self, cr, uid, ids, context=None):
+        """Copy the checkout of the build a retry comes from, return False
+        when it is not available on this host"""
+        for build in self.browse(cr, uid, ids, context=context):
+            source = build.retry_of_id.path()
+            if build.retry_of_id.host != build.host or not os.path.isdir(source):
+                return False
+            if os.path.isdir(build.path()):
+                shutil.rmtree(build.path())
+            # hard links, the sources are not modified by the builds
+            if run(['cp', '-al', source, build.path()]):
+                return False
+            for transient in ('logs', 'datadir'):
+                shutil.rmtree(build.path(transient), ignore_errors=True)
+            mkdirs([build.path('logs')])
+            build.write({'server_match': build.retry_of_id.server_match,
+                         'server_hash': build.retry_of_id.server_hash,
+                         'python_env': build.retry_of_id.python_env})
+            return True
+
+    def _impact_base(self, cr, uid, ids, context=None):
+        """Return the ref of the branch the build branch is based on: the
+        target of its pull request, else the longest sticky branch whose name
+        dash-prefixes its name, else None"""
+        branch_pool = self.pool['runbot.branch']
+        for build in self.browse(cr, uid, ids, context=context):
+            pi = build.branch_id._get_pull_info()
+            if pi:
+                return 'refs/heads/%s' % pi['base']['ref']
+            name = build.branch_id.branch_name
+            sticky_ids = branch_pool.search(cr, uid, [('repo_id', '=', build.repo_id.id), ('sticky', '=', True)],
+                                            context=context)
+            bases = [b for b in branch_pool.browse(cr, uid, sticky_ids, context=context)
+                     if name.startswith(b.branch_name + '-')]
+            if bases:
+                return max(bases, key=lambda b: len(b.branch_name)).name
+            return None
+
+    def _changed_files(self, cr, uid, ids, context=None):
+        """Return the files changed by the build since its base branch, None if unknown"""
+        for build in self.browse(cr, uid, ids, context=context):
+            base = build._impact_base()
+            if not base:
+                return None
+            try:
+                merge_base = build.repo_id.git(['merge-base', build.name, base]).strip()
+                return filter(None, build.repo_id.git(['diff', '--name-only', merge_base, build.name]).splitlines())
+            except subprocess.CalledProcessError:
+                return None
+
+    def _impacted_modules(self, cr, uid, ids, available_modules, context=None):
+        """Return the modules changed by the build and the modules depending on them
+
+        Returns None when the impact can not be restricted to modules: the
+        base branch is unknown, or a changed file is not part of an addon.
+        """
+        for build in self.browse(cr, uid, ids, context=context):
+            changed_files = build._changed_files()
+            if changed_files is None:
+                return None
+            available = set(available_modules)
+            changed = set()
+            for path in changed_files:
+                parts = path.split('/')
+                # <module>/... in addons repositories, [odoo/|openerp/]addons/<module>/... in the server
+                candidates = [parts[0]] + [parts[i + 1] for i, part in enumerate(parts[:-1]) if part == 'addons']
+                modules = [m for m in candidates if m in available]
+                if not modules:
+                    _logger.debug("build %s changes %s outside of addons, testing every module", build.dest, path)
+                    return None
+                changed.add(modules[0])
+
+            # reverse dependency graph of the manifests
+            dependents = {}
+            for module in available:
+                try:
+                    with open(build.server('addons', module, '__openerp__.py')) as f:
+                        depends = ast.literal_eval(f.read()).get('depends', [])
+                except (IOError, SyntaxError, ValueError, AttributeError):
+                    depends = []
+                for dependency in depends:
+                    dependents.setdefault(dependency, set()).add(module)
+            impacted = set()
+            todo = list(changed)
+            while todo:
+                module = todo.pop()
+                if module not in impacted:
+                    impacted.add(module)
+                    todo.extend(dependents.get(module, ()))
+            return impacted
 
     def _local_pg_dropdb(self, cr, uid, dbname):
         with local_pgadmin_cursor() as local_cr:
@@ -856,36 +1813,45 @@ class runbot_build(osv.osv):
         with local_pgadmin_cursor() as local_cr:
             local_cr.execute("""CREATE DATABASE "%s" TEMPLATE template0 LC_COLLATE 'C' ENCODING 'unicode'""" % dbname)
 
+    def _local_pg_clonedb(self, cr, uid, source, dbname):
+        """Create ``dbname`` as a copy of ``source``, return False if it can
+        not be copied (missing, or in use by a running server)"""
+        self._local_pg_dropdb(cr, uid, dbname)
+        _logger.debug("clonedb %s %s", source, dbname)
+        try:
+            with local_pgadmin_cursor() as local_cr:
+                local_cr.execute('CREATE DATABASE "%s" TEMPLATE "%s"' % (dbname, source))
+        except psycopg2.Error:
+            _logger.debug("cannot clone %s", source, exc_info=True)
+            return False
+        return True
+
     def cmd(self, cr, uid, ids, context=None):
         """Return a list describing the command to start the build"""
         for build in self.browse(cr, uid, ids, context=context):
-            # Server
-            server_path = build.path("openerp-server")
-            # for 7.0
-            if not os.path.isfile(server_path):
-                server_path = build.path("openerp-server.py")
-            # for 6.0 branches
-            if not os.path.isfile(server_path):
-                server_path = build.path("bin/openerp-server.py")
+            capabilities = build._capabilities()
 
             # commandline
             cmd = [
-                sys.executable,
-                server_path,
+                build._python(),
+                build.path(capabilities['script']),
                 "--xmlrpc-port=%d" % build.port,
             ]
             # options
-            if grep(build.server("tools/config.py"), "no-xmlrpcs"):
+            if capabilities['no_xmlrpcs']:
                 cmd.append("--no-xmlrpcs")
-            if grep(build.server("tools/config.py"), "no-netrpc"):
+            if capabilities['no_netrpc']:
                 cmd.append("--no-netrpc")
-            if grep(build.server("tools/config.py"), "log-db"):
+            icp = self.pool['ir.config_parameter']
+            log_shipping = icp.get_param(cr, uid, 'runbot.log_shipping', default='batch')
+            # in batch mode the logs are shipped from the job log files, see runbot_build_job.tail_log
+            if log_shipping == 'db' and capabilities['log_db']:
                 logdb = cr.dbname
-                if config['db_host'] and grep(build.server('sql_db.py'), 'allow_uri'):
+                if config['db_host'] and capabilities['allow_uri']:
                     logdb = 'postgres://{cfg[db_user]}:{cfg[db_password]}@{cfg[db_host]}/{db}'.format(cfg=config, db=cr.dbname)
                 cmd += ["--log-db=%s" % logdb]
 
-            if grep(build.server("tools/config.py"), "data-dir"):
+            if capabilities['data_dir']:
                 datadir = build.path('datadir')
                 if not os.path.exists(datadir):
                     os.mkdir(datadir)
@@ -901,7 +1867,153 @@ class runbot_build(osv.osv):
 
         return cmd, build.modules
 
-    def spawn(self, cmd, lock_path, log_path, cpu_limit=None, shell=False):
+    def _placement(self, cr, uid, ids, job_class, job=None, context=None):
+        """Return the spawn placement of ``job``, of class ``job_class``, of the build on its host
+
+        Testing jobs get the lowest cpu slots not taken by the other running
+        jobs of the testing builds of their host, concurrent jobs of a build
+        included, so that pinned jobs do not share their CPUs. A job takes
+        as many consecutive cpu slots as its testing slots, see pipeline.
+        """
+        Host = self.pool['runbot.host']
+        pipeline = self.pipeline(cr, uid, context=context)
+        width = lambda job: pipeline[job]['slots'] if job in pipeline else 1
+        for build in self.browse(cr, uid, ids, context=context):
+            host_id = Host._get_host(cr, uid, build.host, context=context)
+            slot, slots = 0, 1
+            if job_class == 'testing' and job:
+                record = build._get_job(job)
+                slots = width(job)
+                cr.execute("""SELECT j.cpu_slot, j.job
+                                FROM runbot_build_job j
+                                JOIN runbot_build b ON (b.id = j.build_id)
+                               WHERE b.host = %s
+                                 AND b.state = 'testing'
+                                 AND j.state = 'running'
+                                 AND j.cpu_slot > 0
+                                 AND j.id != %s""", [build.host, record.id])
+                used = set()
+                for cpu_slot, other in cr.fetchall():
+                    used.update(range(cpu_slot, cpu_slot + width(other)))
+                free = lambda first: not used.intersection(range(first, first + slots))
+                slot = record.cpu_slot
+                if not slot or not free(slot):
+                    slot = min(first for first in range(1, len(used) + 2) if free(first))
+                    record.write({'cpu_slot': slot})
+                build.write({'cpu_slot': slot})
+            return Host.placement(cr, uid, [host_id], job_class, slot=slot, slots=slots, context=context)
+
+    def _memory_cgroup(self, cr, uid, ids, job, context=None):
+        """Return the cgroup v2 directory of ``job`` when runbot.cgroup_root is set"""
+        icp = self.pool['ir.config_parameter']
+        cgroup_root = icp.get_param(cr, uid, 'runbot.cgroup_root')
+        for build in self.browse(cr, uid, ids, context=context):
+            if cgroup_root and os.path.isdir(cgroup_root):
+                return os.path.join(cgroup_root, '%s-%s' % (build.dest, job))
+            return None
+
+    def _memory_limit(self, cr, uid, ids, job, context=None):
+        """Return the memory limit of ``job`` in MB, zero means no limit
+
+        The limit is the Job Memory Limit of the branch, else the
+        runbot.memory_limit.<job> parameter, else the runbot.memory_limit
+        parameter.
+        """
+        icp = self.pool['ir.config_parameter']
+        for build in self.browse(cr, uid, ids, context=context):
+            return (build.branch_id.job_memory_limit or
+                    int(icp.get_param(cr, uid, 'runbot.memory_limit.%s' % job, default=0)) or
+                    int(icp.get_param(cr, uid, 'runbot.memory_limit', default=0)))
+
+    def _memory_limits(self, cr, uid, ids, job, context=None):
+        """Return the memory limit (MB) and cgroup of ``job`` as spawn arguments
+
+        When runbot.cgroup_root points to a delegated cgroup v2 subtree, the
+        job gets its own cgroup with the limit as memory.max, otherwise an
+        address space rlimit is used.
+        """
+        for build in self.browse(cr, uid, ids, context=context):
+            limit = build._memory_limit(job)
+            if not limit:
+                return {}
+            cgroup = build._memory_cgroup(job)
+            if cgroup:
+                try:
+                    mkdirs([cgroup])
+                    with open(os.path.join(cgroup, 'memory.max'), 'w') as f:
+                        f.write('%d' % (limit * 1024 * 1024))
+                except (IOError, OSError):
+                    _logger.exception('cannot setup cgroup %s, falling back to rlimit', cgroup)
+                    cgroup = None
+            return {'memory_limit': limit, 'cgroup': cgroup}
+
+    def _memory_exceeded(self, cr, uid, ids, job, context=None):
+        """Check whether ``job`` of the build was stopped by its memory limit"""
+        for build in self.browse(cr, uid, ids, context=context):
+            if not build._memory_limit(job):
+                return False
+            cgroup = build._memory_cgroup(job)
+            events = os.path.join(cgroup, 'memory.events') if cgroup else None
+            if events and os.path.isfile(events):
+                with open(events) as f:
+                    for line in f:
+                        key, value = line.split()
+                        if key == 'oom_kill' and int(value):
+                            return True
+            # with an address space limit python raises MemoryError, which
+            # only counts when the job died of it: tests may log MemoryError
+            record = build._classify(job)
+            return record.reaped and record.exit_status != 0 and record.log_memory_error
+
+    def _get_job(self, cr, uid, ids, job, context=None):
+        """Return the record of the last run of ``job`` of the build"""
+        Job = self.pool['runbot.build.job']
+        for build in self.browse(cr, uid, ids, context=context):
+            job_ids = Job.search(cr, uid, [('build_id', '=', build.id), ('job', '=', job)],
+                                 order='id desc', limit=1, context=context)
+            if not job_ids:
+                job_ids = [Job.create(cr, uid, {'build_id': build.id, 'job': job, 'host': build.host}, context=context)]
+            return Job.browse(cr, uid, job_ids[0], context=context)
+
+    def _classify(self, cr, uid, ids, job, final=False, context=None):
+        """Bring the classification of the log of ``job`` up to date and return its record
+
+        :param final: the job is over, its log will not grow anymore
+        """
+        for build in self.browse(cr, uid, ids, context=context):
+            job_record = build._get_job(job)
+            job_record.tail_log(final=final)
+            job_record.refresh()
+            return job_record
+
+    def spawn(self, cmd, lock_path, log_path, cpu_limit=None, shell=False, placement=None,
+              memory_limit=None, cgroup=None, zygote=None):
+        if zygote and not shell:
+            # forked by the zygote, which reports the exit of the process in <lock_path>.exit
+            exit_path = lock_path + '.exit'
+            if os.path.exists(exit_path):
+                os.unlink(exit_path)
+            placement = dict(placement or {})
+            if placement.get('ioclass'):
+                placement['ioprio_nr'] = _NR_ioprio_set.get(platform.machine())
+                placement['ioprio'] = (IOPRIO_CLASSES[placement['ioclass']] << 13) | placement.get('iolevel', 0)
+            pid = zygote_spawn(zygote, {
+                'argv': cmd[1:],
+                'cwd': os.getcwd(),
+                'env': dict(os.environ),
+                'log_path': log_path,
+                'lock_path': lock_path,
+                'cpu_limit': cpu_limit,
+                'memory_limit': memory_limit,
+                'cgroup': cgroup,
+                'placement': placement,
+            })
+            if pid:
+                _logger.debug("spawn: %s stdout: %s zygote: %s", ' '.join(cmd), log_path, zygote)
+                return pid
+            _logger.warning('zygote %s not available, spawning the process', zygote)
+            # without the addons path appended by _zygote, always the last argument
+            cmd = cmd[:-1]
         def preexec_fn():
             os.setsid()
             if cpu_limit:
@@ -910,12 +2022,30 @@ class runbot_build(osv.osv):
                 r = resource.getrusage(resource.RUSAGE_SELF)
                 cpu_time = r.ru_utime + r.ru_stime
                 resource.setrlimit(resource.RLIMIT_CPU, (cpu_time + cpu_limit, hard))
+            if cgroup:
+                with open(os.path.join(cgroup, 'cgroup.procs'), 'w') as f:
+                    f.write('%d' % os.getpid())
+            elif memory_limit:
+                limit = memory_limit * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            if placement:
+                # best effort, a job is better run misplaced than not at all
+                try:
+                    if placement.get('cpus'):
+                        set_affinity(placement['cpus'])
+                    if placement.get('nice'):
+                        os.nice(placement['nice'])
+                    if placement.get('ioclass'):
+                        set_ioprio(placement['ioclass'], placement.get('iolevel', 0))
+                except OSError:
+                    pass
             # close parent files
             os.closerange(3, os.sysconf("SC_OPEN_MAX"))
             lock(lock_path)
         out=open(log_path,"w")
         _logger.debug("spawn: %s stdout: %s", ' '.join(cmd), log_path)
         p=subprocess.Popen(cmd, stdout=out, stderr=out, preexec_fn=preexec_fn, shell=shell)
+        _spawned[p.pid] = p
         return p.pid
 
     def github_status(self, cr, uid, ids, context=None):
@@ -943,33 +2073,148 @@ class runbot_build(osv.osv):
             _logger.debug("github updating status %s to %s", build.name, state)
             build.repo_id.github('/repos/:owner/:repo/statuses/%s' % build.name, status, ignore_errors=True)
 
+    def _input_hash(self, cr, uid, ids, closest=None, context=None):
+        """Return the hash of the inputs of the build, None if they can not be resolved
+
+        The inputs are the tree of the build commit, the trees of the branches
+        of the dependency repositories it would be built with, what selects
+        the modules to test, and the jobs of the pipeline.
+        """
+        Repo = self.pool['runbot.repo']
+        for build in self.browse(cr, uid, ids, context=context):
+            try:
+                inputs = ['tree %s' % build.repo_id.git(['rev-parse', '%s^{tree}' % build.name]).strip()]
+                for extra_repo in build.repo_id.dependency_ids:
+                    repo_id, closest_name, server_match = build._closest_branch(extra_repo.id, closest=closest)
+                    repo = Repo.browse(cr, uid, repo_id, context=context)
+                    tree = repo.git(['rev-parse', '%s^{tree}' % closest_name]).strip()
+                    inputs.append('dependency %s %s' % (repo.name, tree))
+                if build.repo_id.modules_impact and not build.branch_id.sticky:
+                    # the impacted modules depend on the base of the branch
+                    base = build._impact_base()
+                    merge_base = base and build.repo_id.git(['merge-base', build.name, base]).strip()
+                    inputs.append('base %s' % merge_base)
+            except subprocess.CalledProcessError:
+                return None
+            inputs += [
+                'modules %s' % (build.branch_id.modules or ''),
+                'repo modules %s %s' % (build.repo_id.modules or '', build.repo_id.modules_auto),
+                'jobs %s' % ','.join(self.pipeline(cr, uid, context=context).keys()),
+            ]
+            return hashlib.sha1('\n'.join(ustr(i) for i in inputs).encode('utf-8')).hexdigest()
+
+    def _reuse_result(self, cr, uid, ids, closest=None, context=None):
+        """Turn the build into a duplicate of a done build with the same
+        inputs, return whether such a build was found"""
+        for build in self.browse(cr, uid, ids, context=context):
+            input_hash = build._input_hash(closest=closest)
+            build.write({'input_hash': input_hash})
+            if not input_hash:
+                return False
+            same_ids = self.search(cr, uid, [('input_hash', '=', input_hash), ('id', '!=', build.id),
+                                             ('state', 'in', ['running', 'done']), ('result', 'in', ['ok', 'ko', 'warn']),
+                                             ('retry_of_id', '=', False)], order='id desc', limit=1, context=context)
+            if not same_ids:
+                return False
+            same = self.browse(cr, uid, same_ids[0], context=context)
+            build._log('init', 'Same inputs as build %s, its result is reused' % same.dest)
+            self.pool['runbot.port'].release(cr, uid, [build.id])
+            build.write({'state': 'duplicate', 'duplicate_id': same.id, 'job': False, 'job_end': now()})
+            if not same.duplicate_id:
+                # linked both ways as in create, so that skip and force find the original
+                same.write({'duplicate_id': build.id})
+            return True
+
     def job_00_init(self, cr, uid, build, lock_path, log_path):
         build._log('init', 'Init build environment')
+        # the closest branches of the dependencies, searched once for both
+        closest = {}
+        if not build.retry_of_id and build._reuse_result(closest=closest):
+            return -2
         # notify pending build - avoid confusing users by saying nothing
         build.github_status()
-        build.checkout()
+        if build.retry_of_id and build._reuse_checkout():
+            build._log('init', 'Reusing the checkout of build %s' % build.retry_of_id.dest)
+        else:
+            build.checkout(closest=closest)
         return -2
 
     def job_10_test_base(self, cr, uid, build, lock_path, log_path):
+        if build.retry_of_id:
+            build._log('test_base', 'Retry of build %s, base tests skipped' % build.retry_of_id.dest)
+            return -2
         build._log('test_base', 'Start test base module')
         # run base test
         self._local_pg_createdb(cr, uid, "%s-base" % build.dest)
         cmd, mods = build.cmd()
-        if grep(build.server("tools/config.py"), "test-enable"):
+        # the build port is taken by job_20_test_all, which runs concurrently
+        cmd = with_port(cmd, self.find_port(cr, uid, build.id))
+        if build._capabilities()['test_enable']:
             cmd.append("--test-enable")
         cmd += ['-d', '%s-base' % build.dest, '-i', 'base', '--stop-after-init', '--log-level=test', '--max-cron-threads=0']
-        return self.spawn(cmd, lock_path, log_path, cpu_limit=300)
+        return self.spawn(cmd, lock_path, log_path, cpu_limit=300, placement=build._placement('testing', 'job_10_test_base'),
+                          zygote=build._zygote(cmd), **build._memory_limits('job_10_test_base'))
+
+    def _module_durations(self, cr, uid, ids, modules, context=None):
+        """Return the expected test duration of ``modules`` in seconds, by module
+
+        Until the repository has timed builds, the number of test files of
+        each module is used as its weight instead.
+        """
+        for build in self.browse(cr, uid, ids, context=context):
+            durations = self.pool['runbot.build.module.timing'].mean_durations(cr, uid, build.repo_id.id, modules,
+                                                                               context=context)
+            if durations:
+                return durations
+            return dict((module, len(glob.glob(build.server('addons', module, 'tests', '*.py'))) or 1)
+                        for module in modules)
+
+    def _shards(self, cr, uid, ids, modules, context=None):
+        """Split ``modules`` in runbot.test_shards lists of similar test duration"""
+        icp = self.pool['ir.config_parameter']
+        count = int(icp.get_param(cr, uid, 'runbot.test_shards', default=1))
+        for build in self.browse(cr, uid, ids, context=context):
+            count = min(count, len(modules))
+            if count < 2:
+                return [modules]
+            return split_shards(modules, build._module_durations(modules), count)
 
     def job_20_test_all(self, cr, uid, build, lock_path, log_path):
         build._log('test_all', 'Start test all modules')
-        self._local_pg_createdb(cr, uid, "%s-all" % build.dest)
+        install = '-i'
+        if build.retry_of_id and self._local_pg_clonedb(cr, uid, "%s-all" % build.retry_of_id.dest, "%s-all" % build.dest):
+            # the modules are installed, updating them runs their tests again
+            build._log('test_all', 'Reusing the database of build %s' % build.retry_of_id.dest)
+            install = '-u'
+            filestore = build.retry_of_id.path('datadir', 'filestore', '%s-all' % build.retry_of_id.dest)
+            if os.path.isdir(filestore):
+                shutil.copytree(filestore, build.path('datadir', 'filestore', '%s-all' % build.dest))
+        else:
+            self._local_pg_createdb(cr, uid, "%s-all" % build.dest)
         cmd, mods = build.cmd()
-        if grep(build.server("tools/config.py"), "test-enable"):
-            cmd.append("--test-enable")
-        cmd += ['-d', '%s-all' % build.dest, '-i', openerp.tools.ustr(mods), '--stop-after-init', '--log-level=test', '--max-cron-threads=0']
+        test_cmd = list(cmd)
+        if build._capabilities()['test_enable']:
+            test_cmd.append("--test-enable")
+        options = ['--stop-after-init', '--log-level=test', '--max-cron-threads=0']
+        shards = build._shards([m for m in (mods or '').split(',') if m])
+        if len(shards) < 2:
+            cmd = test_cmd + ['-d', '%s-all' % build.dest, install, openerp.tools.ustr(mods)] + options
+        else:
+            # the -all database of the running stage is installed without
+            # tests, while each shard tests its modules in its own database
+            # and on its own port; their logs are interleaved in the job log
+            cmds = [cmd + ['-d', '%s-all' % build.dest, install, openerp.tools.ustr(mods)] + options]
+            for index, shard in enumerate(shards, 1):
+                dbname = '%s-all-%d' % (build.dest, index)
+                self._local_pg_createdb(cr, uid, dbname)
+                shard_cmd = with_port(test_cmd, self.find_port(cr, uid, build.id))
+                cmds.append(shard_cmd + ['-d', dbname, '-i', ','.join(shard)] + options)
+            build._log('test_all', 'Testing modules in %d shards' % len(shards))
+            cmd = parallel_command(cmds)
         # reset job_start to an accurate job_20 job_time
-        build.write({'job_start': now()})
-        return self.spawn(cmd, lock_path, log_path, cpu_limit=2100)
+        build.write({'job_start': now(), 'shards': len(shards)})
+        return self.spawn(cmd, lock_path, log_path, cpu_limit=2100, placement=build._placement('testing', 'job_20_test_all'),
+                          zygote=build._zygote(cmd), **build._memory_limits('job_20_test_all'))
 
     def job_30_run(self, cr, uid, build, lock_path, log_path):
         # adjust job_end to record an accurate job_20 job_time
@@ -979,17 +2224,25 @@ class runbot_build(osv.osv):
         v = {
             'job_end': time.strftime(openerp.tools.DEFAULT_SERVER_DATETIME_FORMAT, log_time),
         }
-        if grep(log_all, ".modules.loading: Modules loaded."):
-            if rfind(log_all, _re_error):
+        # the log has been classified while the job was running, only the tail is left
+        test_all = build._classify('job_20_test_all', final=True)
+        # every server process of a sharded job logs its own loading and shutdown
+        processes = build.shards + 1 if build.shards > 1 else 0
+        if test_all.log_loaded and test_all.log_loaded_count >= processes:
+            if test_all.log_errors:
                 v['result'] = "ko"
-            elif rfind(log_all, _re_warning):
+            elif test_all.log_warnings:
                 v['result'] = "warn"
-            elif not grep(build.server("test/common.py"), "post_install") or grep(log_all, "Initiating shutdown."):
+            elif not build._capabilities()['post_install'] or (test_all.log_shutdown and test_all.log_shutdown_count >= processes):
                 v['result'] = "ok"
         else:
             v['result'] = "ko"
         build.write(v)
         build.github_status()
+        if build.branch_id.sticky:
+            for timing in self.pool['runbot.build.module.timing'].check_regressions(cr, uid, build.id):
+                build._log('timing', 'Module %s took %ds, %ds on average in the previous builds' %
+                           (timing.module, timing.duration, timing.baseline))
 
         # run server
         cmd, mods = build.cmd()
@@ -1003,7 +2256,7 @@ class runbot_build(osv.osv):
 
         cmd += ['-d', "%s-all" % build.dest]
 
-        if grep(build.server("tools/config.py"), "db-filter"):
+        if build._capabilities()['db_filter']:
             if build.repo_id.nginx:
                 cmd += ['--db-filter','%d.*$']
             else:
@@ -1021,7 +2274,8 @@ class runbot_build(osv.osv):
         #    f.close()
         #cmd=[self.client_web_bin_path]
 
-        return self.spawn(cmd, lock_path, log_path, cpu_limit=None)
+        return self.spawn(cmd, lock_path, log_path, cpu_limit=None, placement=build._placement('running'),
+                          zygote=build._zygote(cmd), **build._memory_limits('job_30_run'))
 
     def force(self, cr, uid, ids, context=None):
         """Force a rebuild"""
@@ -1035,7 +2289,7 @@ class runbot_build(osv.osv):
 
             # Force it now
             if build.state == 'done' and build.result == 'skipped':
-                values = {'state': 'pending', 'sequence':sequence, 'result': ''}
+                values = {'state': 'pending', 'sequence':sequence, 'result': '', 'queue_date': now()}
                 self.write(cr, SUPERUSER_ID, [build.id], values, context=context)
             # or duplicate it
             elif build.state in ['running', 'done', 'duplicate']:
@@ -1053,77 +2307,383 @@ class runbot_build(osv.osv):
                 self.create(cr, SUPERUSER_ID, new_build, context=context)
             return build.repo_id.id
 
-    def schedule(self, cr, uid, ids, context=None):
-        jobs = self.list_jobs()
+    def retry(self, cr, uid, ids, context=None):
+        """Test again the modules whose tests failed, in a new build linked to the original one"""
+        Job = self.pool['runbot.build.job']
+        for build in self.browse(cr, uid, ids, context=context):
+            if build.state == 'duplicate':
+                build = build.duplicate_id
+            job_ids = Job.search(cr, uid, [('build_id', '=', build.id), ('job', '=', 'job_20_test_all')],
+                                 order='id desc', limit=1, context=context)
+            failed = job_ids and Job.browse(cr, uid, job_ids[0], context=context).log_failed_modules
+            if not failed:
+                raise osv.except_osv('Retry', 'No failed module found in the logs of build %s' % build.dest)
+            retry_id = self.create(cr, SUPERUSER_ID, {
+                'branch_id': build.branch_id.id,
+                'name': build.name,
+                'author': build.author,
+                'author_email': build.author_email,
+                'committer': build.committer,
+                'committer_email': build.committer_email,
+                'subject': build.subject,
+                'modules': failed,
+                'retry_of_id': build.id,
+            }, context=context)
+            # ahead of the pending builds, create gives it the sequence of a new build
+            pending_ids = self.search(cr, uid, [('state', '=', 'pending'), ('id', '!=', retry_id)],
+                                      order='sequence', limit=1)
+            if pending_ids:
+                sequence = self.browse(cr, uid, pending_ids[0], context=context).sequence - 1
+                self.write(cr, SUPERUSER_ID, [retry_id], {'sequence': sequence}, context=context)
+            return build.repo_id.id
 
+    def _get_timeout(self, cr, uid, ids, context=None):
+        """Return the job timeout of the build in seconds"""
         icp = self.pool['ir.config_parameter']
         # For retro-compatibility, keep this parameter in seconds
         default_timeout = int(icp.get_param(cr, uid, 'runbot.timeout', default=1800)) / 60
+        for build in self.browse(cr, uid, ids, context=context):
+            return (build.branch_id.job_timeout or default_timeout) * 60
+
+    def schedule(self, cr, uid, ids, context=None):
+        pipeline = self.pipeline(cr, uid, context=context)
 
         for build in self.browse(cr, uid, ids, context=context):
             if build.state == 'pending':
                 # allocate port and schedule first job
-                port = self.find_port(cr, uid)
+                port = self.find_port(cr, uid, build.id)
                 values = {
                     'host': fqdn(),
                     'port': port,
                     'state': 'testing',
-                    'job': jobs[0],
+                    'job': pipeline.keys()[0],
                     'job_start': now(),
                     'job_end': False,
                 }
                 build.write(values)
                 cr.commit()
             else:
-                # check if current job is finished
-                lock_path = build.path('logs', '%s.lock' % build.job)
+                build._check_jobs(pipeline)
+                build.refresh()
+            if build.state in ('testing', 'running'):
+                build._start_jobs(pipeline)
+
+    def _check_jobs(self, cr, uid, ids, pipeline, context=None):
+        """Follow the running jobs of the builds: classify their logs, stop
+        them on errors or timeouts, and mark them done once finished"""
+        jobs = pipeline.keys()
+        Job = self.pool['runbot.build.job']
+        for build in self.browse(cr, uid, ids, context=context):
+            job_ids = Job.search(cr, uid, [('build_id', '=', build.id), ('state', '=', 'running')], context=context)
+            for record in Job.browse(cr, uid, job_ids, context=context):
+                job = record.job
+                # check if the job is finished
+                lock_path = build.path('logs', '%s.lock' % job)
                 if locked(lock_path):
-                    # kill if overpassed
-                    timeout = (build.branch_id.job_timeout or default_timeout) * 60
-                    if build.job != jobs[-1] and build.job_time > timeout:
-                        build.logger('%s time exceded (%ss)', build.job, build.job_time)
-                        build.write({'job_end': now()})
-                        build.kill(result='killed')
+                    record = build._classify(job)
+                    if job != jobs[-1]:
+                        if job in self._fail_fast_jobs and build.branch_id.fail_fast and record.log_errors and record.pid > 0:
+                            build.logger('%s failed, stopping it', job)
+                            build._log('fail_fast', 'Error found in %s, test job stopped' % job)
+                            try:
+                                os.killpg(record.pid, signal.SIGTERM)
+                            except OSError:
+                                pass
+                        # kill if overpassed, in case the watchdog of the job was lost
+                        job_time = int(time.time() - dt2time(record.job_start))
+                        if job_time > build._get_timeout():
+                            build.logger('%s time exceded (%ss)', job, job_time)
+                            build.write({'job_end': now()})
+                            build.kill(result='killed')
+                            break
                     continue
-                build.logger('%s finished', build.job)
-                # schedule
-                v = {}
-                # testing -> running
-                if build.job == jobs[-2]:
-                    v['state'] = 'running'
-                    v['job'] = jobs[-1]
-                    v['job_end'] = now(),
-                # running -> done
-                elif build.job == jobs[-1]:
-                    v['state'] = 'done'
-                    v['job'] = ''
-                # testing
-                else:
-                    v['job'] = jobs[jobs.index(build.job) + 1]
-                build.write(v)
-            build.refresh()
-
-            # run job
-            pid = None
-            if build.state != 'done':
-                build.logger('running %s', build.job)
-                job_method = getattr(self,build.job)
-                mkdirs([build.path('logs')])
-                lock_path = build.path('logs', '%s.lock' % build.job)
-                log_path = build.path('logs', '%s.txt' % build.job)
-                pid = job_method(cr, uid, build, lock_path, log_path)
-                build.write({'pid': pid})
-            # needed to prevent losing pids if multiple jobs are started and one them raise an exception
+                if os.path.exists(timeout_marker(lock_path)):
+                    # stopped by the watchdog
+                    build.logger('%s time exceded', job)
+                    build._log(job, 'Job timeout exceeded, build killed')
+                    build.write({'job_end': now()})
+                    build.kill(result='killed')
+                    break
+                build.logger('%s finished', job)
+                if os.path.isfile(lock_path + '.exit'):
+                    # forked by a zygote, not reaped by this process
+                    record.record_exit(lock_path + '.exit')
+                elif not record.reaped and record.pid > 0:
+                    # it may have exited after the reap of this scheduler pass
+                    record.reap()
+                record = build._classify(job, final=True)
+                self.pool['ir.logging'].resolve_build(cr, uid, [build.id])
+                if job != jobs[-1] and build._memory_exceeded(job):
+                    build.logger('%s memory limit exceeded', job)
+                    build._log(job, 'Memory limit exceeded, build stopped')
+                    build.write({'job_end': now()})
+                    build.kill(result='oom')
+                    break
+                record.write({'state': 'done', 'job_end': now()})
+                if job == jobs[-1]:
+                    # running -> done
+                    build.write({'state': 'done', 'job': ''})
+                    self.pool['runbot.port'].release(cr, uid, [build.id])
+                    cr.commit()
+                    build._local_cleanup()
+
+    def _start_jobs(self, cr, uid, ids, pipeline, context=None):
+        """Start the jobs of the builds whose dependencies are done
+
+        A job is only started next to other jobs of its build if the host has
+        enough free testing slots for it. The last job of the pipeline turns
+        the build to running.
+        """
+        jobs = pipeline.keys()
+        Job = self.pool['runbot.build.job']
+        for build in self.browse(cr, uid, ids, context=context):
+            if build.state == 'running' and not Job.search(cr, uid, [('build_id', '=', build.id)], limit=1,
+                                                           context=context):
+                # started before the pipeline, its jobs are unknown: never run them again
+                continue
+            while build.state in ('testing', 'running'):
+                job_ids = Job.search(cr, uid, [('build_id', '=', build.id), ('state', 'in', ['running', 'done'])],
+                                     context=context)
+                records = Job.browse(cr, uid, job_ids, context=context)
+                started = set(r.job for r in records)
+                done = set(r.job for r in records if r.state == 'done')
+                ready = [job for job in jobs
+                         if job not in started and all(dep in done for dep in pipeline[job]['depends'])]
+                if not ready:
+                    break
+                job = ready[0]
+                slots = pipeline[job]['slots'] if pipeline[job]['spawn'] else 0
+                if job == jobs[-1]:
+                    # testing -> running
+                    build.write({'state': 'running', 'job_end': now()})
+                    # ports of the test shards
+                    self.pool['runbot.port'].release(cr, uid, [build.id], keep_build_port=True)
+                elif started - done and slots and self._free_slots(cr, uid, build.host, pipeline) < slots:
+                    # wait for free testing slots, the build keeps its running jobs
+                    break
+                self._run_job(cr, uid, build, job, final=job == jobs[-1], context=context)
+                build.refresh()
+
+    def _used_slots(self, cr, uid, host, pipeline=None, context=None):
+        """Return the testing slots of ``host`` taken by the running jobs of its testing builds"""
+        pipeline = pipeline or self.pipeline(cr, uid, context=context)
+        cr.execute("""SELECT j.job
+                        FROM runbot_build_job j
+                        JOIN runbot_build b ON (b.id = j.build_id)
+                       WHERE j.state = 'running'
+                         AND b.state = 'testing'
+                         AND b.host = %s""", [host])
+        specs = [pipeline.get(job) for job, in cr.fetchall()]
+        return sum(spec['slots'] if spec['spawn'] else 0 for spec in specs if spec)
+
+    def _free_slots(self, cr, uid, host, pipeline=None, context=None):
+        """Return the testing slots of ``host`` not taken by running jobs"""
+        Host = self.pool['runbot.host']
+        workers, _ = Host.get_capacity(cr, uid, [Host._get_host(cr, uid, host, context=context)], context=context)
+        return workers - self._used_slots(cr, uid, host, pipeline, context=context)
+
+    def _policy_fifo(self, cr, uid, repo_ids, context=None):
+        """Sticky builds first, then every pending build by sequence"""
+        query = """
+            SELECT bu.id,
+                   CASE WHEN br.sticky THEN 0 ELSE 1 END AS lane,
+                   bu.sequence::float AS score
+              FROM runbot_build bu
+              JOIN runbot_branch br ON (br.id = bu.branch_id)
+             WHERE bu.state = 'pending'
+               AND bu.repo_id IN %s
+        """
+        return query, [tuple(repo_ids)]
+
+    def _policy_fair(self, cr, uid, repo_ids, context=None):
+        """Sticky builds first, then weighted fair share between repositories
+
+        A non-sticky build is scored with the virtual time at which its
+        repository would get it: (non-sticky builds of the repository already
+        testing + its rank in the repository queue) / share weight. The waiting time is
+        subtracted from that score (one slot every ``runbot.fair_aging``
+        seconds) so that no build waits forever, and builds beyond the
+        ``max_testing`` cap of their repository are not taken at all.
+        """
+        icp = self.pool['ir.config_parameter']
+        aging = float(icp.get_param(cr, uid, 'runbot.fair_aging', default=3600)) or 3600.0
+        query = """
+            SELECT id, lane, score
+              FROM (SELECT bu.id,
+                           br.sticky IS TRUE AS sticky,
+                           CASE WHEN br.sticky THEN 0 ELSE 1 END AS lane,
+                           CASE WHEN br.sticky THEN bu.sequence::float
+                                ELSE (coalesce(t.testing, 0) + row_number() OVER w) / greatest(coalesce(re.share_weight, 1.0), 0.01)
+                                     - extract(epoch FROM (now() at time zone 'UTC') - coalesce(bu.queue_date, bu.create_date)) / %s
+                            END AS score,
+                           coalesce(t.testing, 0) + row_number() OVER w AS slot,
+                           coalesce(re.max_testing, 0) AS max_testing
+                      FROM runbot_build bu
+                      JOIN runbot_branch br ON (br.id = bu.branch_id)
+                      JOIN runbot_repo re ON (re.id = bu.repo_id)
+                 LEFT JOIN (SELECT tb.repo_id, count(*) AS testing
+                              FROM runbot_build tb
+                              JOIN runbot_branch tbr ON (tbr.id = tb.branch_id)
+                             WHERE tb.state = 'testing'
+                               AND tbr.sticky IS NOT TRUE
+                          GROUP BY tb.repo_id) t ON (t.repo_id = bu.repo_id)
+                     WHERE bu.state = 'pending'
+                       AND bu.repo_id IN %s
+                    WINDOW w AS (PARTITION BY bu.repo_id, br.sticky IS TRUE ORDER BY bu.sequence, bu.id)
+                   ) q
+             WHERE sticky OR max_testing = 0 OR slot <= max_testing
+        """
+        return query, [aging, tuple(repo_ids)]
+
+    def claim(self, cr, uid, repo_ids, host, limit, context=None):
+        """Atomically take up to ``limit`` pending builds of ``repo_ids`` for ``host``
+
+        Builds are taken in the order of the scheduling policy set in the
+        ``runbot.scheduling_policy`` parameter (a ``_policy_<name>`` method
+        returning the (id, lane, score) of the candidate builds) and switched
+        to the first job in the same statement. Rows locked by a concurrent
+        claim of another host are skipped instead of waited for, so several
+        hosts can share the same database without double-claiming a build.
+
+        :return: ids of the claimed builds, which still have to be started
+        """
+        if limit <= 0 or not repo_ids:
+            return []
+        jobs = self.pipeline(cr, uid, context=context).keys()
+        icp = self.pool['ir.config_parameter']
+        policy = icp.get_param(cr, uid, 'runbot.scheduling_policy', default='fair')
+        if not hasattr(self, '_policy_%s' % policy):
+            _logger.warning('unknown scheduling policy %r, using fifo', policy)
+            policy = 'fifo'
+        query, params = getattr(self, '_policy_%s' % policy)(cr, uid, repo_ids, context=context)
+        cr.execute("""
+            UPDATE runbot_build
+               SET state = 'testing',
+                   host = %s,
+                   job = %s,
+                   job_start = %s,
+                   job_end = NULL,
+                   write_uid = %s,
+                   write_date = (now() at time zone 'UTC')
+             WHERE id IN (SELECT bu.id
+                            FROM runbot_build bu
+                            JOIN (""" + query + """) q ON (q.id = bu.id)
+                       LEFT JOIN runbot_build o ON (o.id = bu.retry_of_id)
+                           WHERE bu.state = 'pending'
+                             -- retries reuse the checkout on the host of their build: the
+                             -- other hosts take them last, with a fresh checkout
+                        ORDER BY q.lane, coalesce(o.host != %s, FALSE), q.score, bu.sequence, bu.id
+                           LIMIT %s
+                             FOR UPDATE OF bu SKIP LOCKED)
+         RETURNING id
+        """, [host, jobs[0], now(), uid] + params + [host, limit])
+        claimed_ids = [row[0] for row in cr.fetchall()]
+        self.invalidate_cache(cr, uid, ['state', 'host', 'job', 'job_start', 'job_end'], claimed_ids)
+        return claimed_ids
+
+    def start(self, cr, uid, ids, context=None):
+        """Allocate a port and run the first jobs of freshly claimed builds"""
+        pipeline = self.pipeline(cr, uid, context=context)
+        for build in self.browse(cr, uid, ids, context=context):
+            build.write({'port': self.find_port(cr, uid, build.id, host=build.host)})
             cr.commit()
+            build._start_jobs(pipeline)
 
-            if pid == -2:
-                # no process to wait, directly call next job
-                # FIXME find a better way that this recursive call
-                build.schedule()
+    def preempt(self, cr, uid, repo_ids, host, context=None):
+        """Requeue testing builds of ``host`` in favor of sticky builds waiting for too long
 
-            # cleanup only needed if it was not killed
-            if build.state == 'done':
-                build._local_cleanup()
+        When sticky builds of ``repo_ids`` have been pending for more than
+        ``runbot.preempt_delay`` seconds (zero disables preemption), the
+        youngest non-sticky testing builds of ``host`` are stopped and put
+        back at the front of their lane, with their queue date, instead of
+        being marked as killed. Each live host preempts its share of the
+        waiting builds only.
+
+        :return: ids of the preempted builds
+        """
+        icp = self.pool['ir.config_parameter']
+        delay = int(icp.get_param(cr, uid, 'runbot.preempt_delay', default=0))
+        if not delay:
+            return []
+        cr.execute("""
+            SELECT count(*)
+              FROM runbot_build bu
+              JOIN runbot_branch br ON (br.id = bu.branch_id)
+             WHERE bu.state = 'pending'
+               AND br.sticky
+               AND bu.repo_id IN %s
+               AND coalesce(bu.queue_date, bu.create_date) < (now() at time zone 'UTC') - interval '1 second' * %s
+        """, [tuple(repo_ids), delay])
+        waiting = cr.fetchone()[0]
+        if not waiting:
+            return []
+        Host = self.pool['runbot.host']
+        hosts = [h for h in Host.browse(cr, uid, Host.search(cr, uid, [], context=context), context=context) if h.alive]
+        share = int(math.ceil(waiting / float(max(len(hosts), 1))))
+        domain = [('host', '=', host), ('state', '=', 'testing'), ('branch_id.sticky', '=', False)]
+        build_ids = self.search(cr, uid, domain, order='create_date desc, id desc', limit=share, context=context)
+        for build in self.browse(cr, uid, build_ids, context=context):
+            build._log('preempt', 'Build %s preempted by sticky builds, requeued' % build.dest)
+            build.logger('preempting %s', build.pid)
+            build._kill_jobs()
+            # front of its lane: before the oldest pending build of the repository
+            front_ids = self.search(cr, uid, [('repo_id', '=', build.repo_id.id), ('state', '=', 'pending')],
+                                    order='sequence', limit=1, context=context)
+            sequence = build.sequence
+            if front_ids:
+                sequence = min(sequence, self.browse(cr, uid, front_ids[0], context=context).sequence - 1)
+            # its age in the queue still counts, see _policy_fair
+            queue_date = build.queue_date
+            build.requeue()
+            build.write({'sequence': sequence, 'queue_date': queue_date})
+            cr.commit()
+            build._local_cleanup()
+        return build_ids
+
+    def _run_job(self, cr, uid, build, job, final=False, context=None):
+        """Start ``job`` of ``build``, in-process jobs are done when it returns"""
+        Job = self.pool['runbot.build.job']
+        build.logger('running %s', job)
+        job_method = getattr(self, job)
+        mkdirs([build.path('logs')])
+        lock_path = build.path('logs', '%s.lock' % job)
+        log_path = build.path('logs', '%s.txt' % job)
+        job_id = Job.create(cr, uid, {
+            'build_id': build.id,
+            'job': job,
+            'host': build.host,
+            'job_start': now(),
+            'state': 'running',
+        }, context=context)
+        build.write({'job': job})
+        pid = job_method(cr, uid, build, lock_path, log_path)
+        if pid > 0:
+            build.write({'pid': pid})
+            Job.write(cr, uid, [job_id], {'pid': pid}, context=context)
+            if not final:
+                icp = self.pool['ir.config_parameter']
+                grace = int(icp.get_param(cr, uid, 'runbot.timeout_grace', default=10))
+                watchdog.arm(pid, lock_path, build._get_timeout(), grace)
+        else:
+            # no process to wait
+            Job.write(cr, uid, [job_id], {'state': 'done', 'job_end': now()}, context=context)
+        # needed to prevent losing pids if multiple jobs are started and one them raise an exception
+        cr.commit()
+
+    def _kill_jobs(self, cr, uid, ids, context=None):
+        """Kill the processes of the running jobs of the builds"""
+        Job = self.pool['runbot.build.job']
+        for build in self.browse(cr, uid, ids, context=context):
+            job_ids = Job.search(cr, uid, [('build_id', '=', build.id), ('state', '=', 'running')], context=context)
+            pids = set(job['pid'] for job in Job.read(cr, uid, job_ids, ['pid'], context=context))
+            for pid in (pids | set([build.pid])):
+                if pid > 0:
+                    watchdog.disarm(pid)
+                    try:
+                        os.killpg(pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+            Job.write(cr, uid, job_ids, {'state': 'cancelled', 'job_end': now()}, context=context)
 
     def skip(self, cr, uid, ids, context=None):
         self.write(cr, uid, ids, {'state': 'done', 'result': 'skipped'}, context=context)
@@ -1144,6 +2704,14 @@ class runbot_build(osv.osv):
                 to_delete = local_cr.fetchall()
             for db, in to_delete:
                 self._local_pg_dropdb(cr, uid, db)
+            # remove the memory cgroups of the jobs, which are empty once killed
+            cgroup_root = self.pool['ir.config_parameter'].get_param(cr, uid, 'runbot.cgroup_root')
+            if cgroup_root:
+                for cgroup in glob.glob(os.path.join(cgroup_root, build.dest + '-*')):
+                    try:
+                        os.rmdir(cgroup)
+                    except OSError:
+                        pass
 
         # cleanup: find any build older than 7 days.
         root = self.pool['runbot.repo'].root(cr, uid)
@@ -1162,23 +2730,81 @@ class runbot_build(osv.osv):
             if b not in actives and os.path.isdir(path):
                 shutil.rmtree(path)
 
+        # cleanup: the server copies of the zygotes no longer running
+        zygote_dir = os.path.join(root, 'zygote')
+        if os.path.isdir(zygote_dir):
+            expired = time.time() - 7 * 24 * 3600
+            for name in os.listdir(zygote_dir):
+                path = os.path.join(zygote_dir, name)
+                if (os.path.isdir(path) and os.path.getmtime(path) < expired
+                        and not zygote_alive(path + '.sock')):
+                    shutil.rmtree(path, ignore_errors=True)
+
+        # cleanup: the least recently used python environments
+        env_dir = os.path.join(root, 'venv')
+        if os.path.isdir(env_dir):
+            max_envs = int(self.pool['ir.config_parameter'].get_param(cr, uid, 'runbot.python_envs_max', default=10))
+            cr.execute("""SELECT DISTINCT python_env FROM runbot_build
+                           WHERE state IN ('pending', 'testing', 'running') AND python_env IS NOT NULL""")
+            used = set(row[0] for row in cr.fetchall())
+            envs = [name for name in os.listdir(env_dir)
+                    if os.path.isdir(os.path.join(env_dir, name)) and not name.startswith('base-')]
+            envs.sort(key=lambda name: os.path.getmtime(os.path.join(env_dir, name)), reverse=True)
+            recent = time.time() - 3600
+            for name in envs[max_envs:]:
+                if name in used:
+                    continue
+                path = os.path.join(env_dir, name)
+                with open(path + '.lock', 'a') as f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except IOError:
+                        # being installed or selected by a build
+                        continue
+                    # selected after the snapshot of this transaction
+                    if os.path.getmtime(path) > recent:
+                        continue
+                    shutil.rmtree(path, ignore_errors=True)
+                    if os.path.exists(path + '.log'):
+                        os.unlink(path + '.log')
+
+        # cleanup: the cached bytecode no longer linked in a build
+        cache_dir = self._bytecode_cache(cr, uid)
+        if cache_dir and os.path.isdir(cache_dir):
+            expired = time.time() - 7 * 24 * 3600
+            for dirpath, dirnames, filenames in os.walk(cache_dir):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                        if st.st_nlink == 1 and st.st_mtime < expired:
+                            os.unlink(path)
+                    except OSError:
+                        pass
+
     def kill(self, cr, uid, ids, result=None, context=None):
         for build in self.browse(cr, uid, ids, context=context):
             build._log('kill', 'Kill build %s' % build.dest)
             build.logger('killing %s', build.pid)
-            try:
-                os.killpg(build.pid, signal.SIGKILL)
-            except OSError:
-                pass
+            if build.state != 'pending':
+                # ship the last lines of the jobs
+                Job = self.pool['runbot.build.job']
+                job_ids = Job.search(cr, uid, [('build_id', '=', build.id), ('state', '=', 'running')])
+                for job in Job.browse(cr, uid, job_ids):
+                    build._classify(job.job, final=True)
+                self.pool['ir.logging'].resolve_build(cr, uid, [build.id])
+            build._kill_jobs()
             v = {'state': 'done', 'job': False}
             if result:
                 v['result'] = result
             build.write(v)
+            self.pool['runbot.port'].release(cr, uid, [build.id])
             cr.commit()
             build.github_status()
             build._local_cleanup()
 
     def reap(self, cr, uid, ids):
+        Job = self.pool['runbot.build.job']
         while True:
             try:
                 pid, status, rusage = os.wait3(os.WNOHANG)
@@ -1187,6 +2813,8 @@ class runbot_build(osv.osv):
             if pid == 0:
                 break
             _logger.debug('reaping: pid: %s status: %s', pid, status)
+            _spawned.pop(pid, None)
+            Job.record_usage(cr, uid, pid, status, rusage)
 
     def _log(self, cr, uid, ids, func, message, context=None):
         assert len(ids) == 1
@@ -1202,6 +2830,559 @@ class runbot_build(osv.osv):
             'line': '0',
         }, context=context)
 
+class runbot_build_job(osv.osv):
+    """Processes spawned for the jobs of the builds and their resource usage"""
+    _name = "runbot.build.job"
+    _order = 'id desc'
+
+    _columns = {
+        'build_id': fields.many2one('runbot.build', 'Build', required=True, ondelete='cascade', select=1),
+        'repo_id': fields.related('build_id', 'repo_id', type='many2one', relation='runbot.repo',
+                                  string='Repository', readonly=True, store=True),
+        'branch_id': fields.related('build_id', 'branch_id', type='many2one', relation='runbot.branch',
+                                    string='Branch', readonly=True, store=True),
+        'job': fields.char('Job', required=True, select=1),
+        'state': fields.selection([('running', 'Running'), ('done', 'Done'), ('cancelled', 'Cancelled')],
+                                  'Status', select=1, help='State of the job in the pipeline of its build'),
+        'host': fields.char('Host'),
+        'pid': fields.integer('Pid', select=1),
+        'cpu_slot': fields.integer('CPU slot', help='Testing cpu slot of the job on its host, see runbot_host.placement'),
+        'job_start': fields.datetime('Job start'),
+        'job_end': fields.datetime('Job end'),
+        'exit_status': fields.integer('Exit status', group_operator='max'),
+        'cpu_user': fields.float('User CPU time (s)'),
+        'cpu_system': fields.float('System CPU time (s)'),
+        'cpu_time': fields.float('CPU time (s)'),
+        'max_rss': fields.integer('Peak memory (kB)', group_operator='max'),
+        'reaped': fields.boolean('Reaped'),
+        # incremental log classification, see tail_log
+        'log_offset': fields.integer('Log offset'),
+        'log_errors': fields.integer('Errors'),
+        'log_warnings': fields.integer('Warnings'),
+        'log_loaded': fields.boolean('Modules loaded'),
+        'log_loaded_count': fields.integer('Modules loaded count'),
+        'log_shutdown': fields.boolean('Shutdown'),
+        'log_shutdown_count': fields.integer('Shutdown count'),
+        'log_memory_error': fields.boolean('Memory error'),
+        'log_failed_modules': fields.char('Failed modules'),
+        # module being loaded and timings so far in each database of the job, see _collect_timing
+        'log_timing': fields.text('Timing state'),
+        # last record of the log, which may go on in the next pass, see _collect_record
+        'log_pending': fields.text('Pending log state'),
+    }
+
+    _log_state_fields = ['log_errors', 'log_warnings', 'log_loaded', 'log_loaded_count',
+                         'log_shutdown', 'log_shutdown_count', 'log_memory_error', 'log_failed_modules',
+                         'log_timing', 'log_pending']
+
+    # jobs whose log is parsed into module timings
+    _timing_jobs = ['job_20_test_all']
+
+    def tail_log(self, cr, uid, ids, final=False, context=None):
+        """Process the lines appended to the log of the jobs since the last call
+
+        Only complete lines are consumed, the log is read from the stored
+        offset so that each line is processed exactly once. The last record
+        is kept pending until the next record starts or the job is over
+        (``final``), as its continuation lines may not be written yet.
+        """
+        ship = self._ship_level(cr, uid, context=context)
+        for job in self.browse(cr, uid, ids, context=context):
+            log_path = job.build_id.path('logs', '%s.txt' % job.job)
+            if not os.path.isfile(log_path):
+                continue
+            state = dict((name, job[name]) for name in self._log_state_fields)
+            # data of this pass, e.g. the records to ship
+            pending = simplejson.loads(job.log_pending or '{}')
+            buf = {
+                'ship': ship,
+                'fingerprint': job.build_id.state == 'testing',
+                'current': pending.get('record'),
+            }
+            if pending.get('error'):
+                buf['error'] = tuple(pending['error'])
+            if job.job in self._timing_jobs:
+                timing = simplejson.loads(job.log_timing or '{}')
+                buf['loading'] = timing.get('loading', {})
+                buf['timings'] = timing.get('timings', {})
+            offset = job.log_offset
+            with open(log_path) as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith('\n'):
+                        # still being written
+                        break
+                    offset += len(line)
+                    self._process_line(cr, uid, job, state, buf, line, context=context)
+            # the timings are recorded by the final pass, even without new lines
+            if offset != job.log_offset or (final and (job.log_pending or 'loading' in buf)):
+                state['log_offset'] = offset
+                self._flush_log(cr, uid, job, state, buf, final=final, context=context)
+
+    def _process_line(self, cr, uid, job, state, buf, line, context=None):
+        """Update the classification ``state`` of ``job`` with a new log line"""
+        line = line.rstrip('\n')
+        if buf['ship'] is not None:
+            self._collect_record(buf, line)
+        if buf['fingerprint']:
+            self._collect_error(buf, line)
+        if 'loading' in buf:
+            self._collect_timing(buf, line)
+        if _re_error_line.search(line):
+            state['log_errors'] += 1
+            match = _re_error_module.search(line)
+            failed = (state['log_failed_modules'] or '').split(',')
+            if match and match.group(1) not in failed:
+                state['log_failed_modules'] = ','.join(filter(None, failed + [match.group(1)]))
+        elif _re_warning_line.search(line):
+            state['log_warnings'] += 1
+        if '.modules.loading: Modules loaded.' in line:
+            state['log_loaded'] = True
+            state['log_loaded_count'] += 1
+        elif 'Initiating shutdown.' in line:
+            state['log_shutdown'] = True
+            state['log_shutdown_count'] += 1
+        elif 'MemoryError' in line:
+            state['log_memory_error'] = True
+
+    def _flush_log(self, cr, uid, job, state, buf, final=False, context=None):
+        """Store the new classification ``state`` of ``job`` and the data
+        gathered in ``buf`` by the lines of one tail_log pass"""
+        if final:
+            if buf.get('current'):
+                buf.setdefault('records', []).append(buf.pop('current'))
+            self._end_error(buf)
+        pending = dict((key, buf[key]) for key in ('current', 'error') if buf.get(key))
+        state['log_pending'] = simplejson.dumps({'record': pending.get('current'), 'error': pending.get('error')}) if pending else False
+        if 'loading' in buf:
+            state['log_timing'] = simplejson.dumps({'loading': buf['loading'], 'timings': buf['timings']})
+            if final:
+                # a sharded job installs the -all database without tests
+                skip = ['%s-all' % job.build_id.dest] if job.build_id.shards > 1 else []
+                timings = merge_timings(buf['timings'], skip=skip)
+                if timings:
+                    self.pool['runbot.build.module.timing'].record(cr, uid, job.build_id.id, timings, context=context)
+        if buf.get('records'):
+            self._ship_records(cr, uid, job, buf['records'], context=context)
+        if buf.get('errors'):
+            self.pool['runbot.error.fingerprint'].record(cr, uid, job.build_id.id, buf['errors'],
+                                                         strip=job.build_id.path(), context=context)
+        job.write(state)
+
+    def _collect_timing(self, buf, line):
+        """Gather the load and test durations of the modules into ``buf``, by database
+
+        The load time of a module runs from its "creating or updating
+        database tables" line to the next one, or to "Modules loaded.", in
+        the same database; it includes its at_install tests. The test time is
+        the sum of the "Ran N tests" of its test loggers.
+        """
+        match = _re_log_record.match(line)
+        if not match:
+            return
+        date, level, dbname, name, message = match.groups()
+        timings = buf.setdefault('timings', {}).setdefault(dbname, {})
+        loading = _re_module_loading.match(message) if name.endswith('.modules.loading') else None
+        if loading or (name.endswith('.modules.loading') and message == 'Modules loaded.'):
+            timestamp = dt2time(date)
+            previous = buf['loading'].pop(dbname, None)
+            if previous:
+                module, start = previous
+                timings.setdefault(module, [0.0, 0.0, 0])[0] += timestamp - start
+            if loading:
+                buf['loading'][dbname] = [loading.group(1), timestamp]
+            return
+        ran = _re_tests_ran.match(message)
+        addon = _re_addons_logger.match(name)
+        if ran and addon:
+            timing = timings.setdefault(addon.group(1), [0.0, 0.0, 0])
+            timing[1] += float(ran.group(2))
+            timing[2] += int(ran.group(1))
+
+    def _collect_error(self, buf, line):
+        """Gather the errors of the log, with their traceback, into ``buf``"""
+        match = _re_log_record.match(line)
+        if match:
+            self._end_error(buf)
+            date, level, dbname, name, message = match.groups()
+            if level in ('ERROR', 'CRITICAL'):
+                buf['error'] = (name, [message])
+        elif line == 'Traceback (most recent call last):' and not buf.get('error'):
+            # printed on stderr, outside of a log record
+            buf['error'] = ('', [line])
+        elif buf.get('error'):
+            buf['error'][1].append(line)
+
+    def _end_error(self, buf):
+        error = buf.pop('error', None)
+        if error:
+            buf.setdefault('errors', []).append(error)
+
+    def _ship_level(self, cr, uid, context=None):
+        """Return the minimum level of the records to ship, None when not shipping"""
+        icp = self.pool['ir.config_parameter']
+        if icp.get_param(cr, uid, 'runbot.log_shipping', default='batch') != 'batch':
+            return None
+        level = icp.get_param(cr, uid, 'runbot.log_shipping_level', default='INFO')
+        return logging.getLevelName(level.upper())
+
+    def _collect_record(self, buf, line):
+        """Parse a server log line into the records of ``buf``, the last one
+        stays in ``buf['current']`` until the next record starts"""
+        match = _re_log_record.match(line)
+        if match:
+            date, level, dbname, name, message = match.groups()
+            levelno = logging.getLevelName(level)
+            if buf.get('current'):
+                buf.setdefault('records', []).append(buf['current'])
+            buf['current'] = None
+            if isinstance(levelno, int) and levelno >= buf['ship']:
+                buf['current'] = [date, dbname, name, level, message]
+        elif buf.get('current'):
+            # continuation of a multiline message, e.g. a traceback
+            buf['current'][4] += '\n' + line
+
+    def _ship_records(self, cr, uid, job, records, context=None):
+        """Bulk load log ``records`` of ``job`` into ir.logging with COPY"""
+        def escape(value):
+            return (value or '').replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+        columns = ('create_date', 'type', 'dbname', 'name', 'level', 'message', 'path', 'line', 'func', 'build_id')
+        for i in range(0, len(records), self._ship_batch):
+            data = StringIO.StringIO()
+            for date, dbname, name, level, message in records[i:i + self._ship_batch]:
+                row = [date, 'server', dbname, name, level, message, name, '0', '', str(job.build_id.id)]
+                data.write('\t'.join(escape(ustr(value).encode('utf-8')) for value in row) + '\n')
+            data.seek(0)
+            cr.copy_from(data, 'ir_logging', columns=columns)
+
+    _ship_batch = 1000
+
+    def _usage_values(self, status, cpu_user, cpu_system, max_rss):
+        return {
+            'job_end': now(),
+            'exit_status': os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status),
+            'cpu_user': cpu_user,
+            'cpu_system': cpu_system,
+            'cpu_time': cpu_user + cpu_system,
+            # kilobytes on linux
+            'max_rss': max_rss,
+            'reaped': True,
+        }
+
+    def record_usage(self, cr, uid, pid, status, rusage, context=None):
+        """Store the exit status and resource usage of the job process ``pid`` of this host"""
+        job_ids = self.search(cr, uid, [('pid', '=', pid), ('host', '=', fqdn()), ('reaped', '=', False)],
+                              order='id desc', limit=1, context=context)
+        if not job_ids:
+            return
+        self.write(cr, uid, job_ids, self._usage_values(status, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss),
+                   context=context)
+
+    def reap(self, cr, uid, ids, context=None):
+        """Reap the exited processes of the jobs, when they are children of this process"""
+        for job in self.browse(cr, uid, ids, context=context):
+            try:
+                pid, status, rusage = os.wait4(job.pid, os.WNOHANG)
+            except OSError:
+                # spawned by another scheduler process
+                continue
+            if pid:
+                _spawned.pop(pid, None)
+                job.write(self._usage_values(status, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss))
+
+    def record_exit(self, cr, uid, ids, exit_path, context=None):
+        """Store the exit status and resource usage of a job process forked by a zygote, see zygote.py"""
+        try:
+            with open(exit_path) as f:
+                usage = simplejson.load(f)
+            os.unlink(exit_path)
+        except (IOError, OSError, ValueError):
+            return
+        self.write(cr, uid, ids, self._usage_values(usage['status'], usage['cpu_user'], usage['cpu_system'],
+                                                    usage['max_rss']), context=context)
+
+class runbot_port(osv.osv):
+    """Port reservations of the builds, one row per (host, port) in use"""
+    _name = "runbot.port"
+    _order = 'host, port'
+    _log_access = False
+
+    _columns = {
+        'host': fields.char('Host', required=True),
+        'port': fields.integer('Port', required=True),
+        'build_id': fields.many2one('runbot.build', 'Build', required=True, ondelete='cascade', select=1),
+    }
+
+    _sql_constraints = [
+        ('host_port_uniq', 'unique(host, port)', 'A port can only be reserved once per host.'),
+    ]
+
+    def allocate(self, cr, uid, build_id, host=None, context=None):
+        """Reserve the lowest free port of ``host`` for ``build_id``
+
+        Ports are reserved by pairs (the build port and its longpolling port),
+        the unique index on (host, port) makes concurrent allocations safe and
+        every candidate port is a single index lookup. When the
+        ``runbot.port_probe`` parameter is set, ports of this host which are
+        already bound by a foreign process are skipped.
+        """
+        icp = self.pool['ir.config_parameter']
+        start = int(icp.get_param(cr, uid, 'runbot.starting_port', default=2000))
+        probe = icp.get_param(cr, uid, 'runbot.port_probe', default=False)
+        host = host or fqdn()
+        skipped = []
+        for attempt in range(100):
+            cr.execute("""
+                INSERT INTO runbot_port (host, port, build_id)
+                     SELECT %s, p, %s
+                       FROM generate_series(%s, 65534, 2) p
+                      WHERE p <> ALL(%s::integer[])
+                        AND NOT EXISTS (SELECT 1 FROM runbot_port r WHERE r.host = %s AND r.port = p)
+                      LIMIT 1
+                ON CONFLICT DO NOTHING
+                  RETURNING id, port
+            """, [host, build_id, start, skipped, host])
+            row = cr.fetchone()
+            if not row:
+                # lost the race against a concurrent allocation, try the next one
+                continue
+            reservation_id, port = row
+            if probe and host == fqdn() and not (port_free(port) and port_free(port + 1)):
+                _logger.debug('port %s is used by a foreign process, skipping it', port)
+                cr.execute("DELETE FROM runbot_port WHERE id = %s", [reservation_id])
+                skipped.append(port)
+                continue
+            return port
+        raise osv.except_osv('Runbot', 'No free port found on host %s' % host)
+
+    def release(self, cr, uid, build_ids, keep_build_port=False, context=None):
+        """Free the ports reserved by ``build_ids``, but their main port if ``keep_build_port``"""
+        if build_ids and keep_build_port:
+            cr.execute("""DELETE FROM runbot_port p USING runbot_build b
+                           WHERE p.build_id = b.id AND b.id IN %s AND p.port != b.port""", [tuple(build_ids)])
+        elif build_ids:
+            cr.execute("DELETE FROM runbot_port WHERE build_id IN %s", [tuple(build_ids)])
+
+class runbot_build_module_timing(osv.osv):
+    """Load and test durations of the modules tested by a build"""
+    _name = "runbot.build.module.timing"
+    _order = 'build_id desc, module'
+    _log_access = False
+
+    _columns = {
+        'build_id': fields.many2one('runbot.build', 'Build', required=True, ondelete='cascade', select=1),
+        'repo_id': fields.many2one('runbot.repo', 'Repository', readonly=True, select=1),
+        'branch_id': fields.many2one('runbot.branch', 'Branch', readonly=True, select=1),
+        'date': fields.datetime('Date', readonly=True),
+        'module': fields.char('Module', required=True, select=1),
+        'load_time': fields.float('Load time (s)', readonly=True),
+        'test_time': fields.float('Test time (s)', readonly=True),
+        'test_count': fields.integer('Tests', readonly=True),
+        'duration': fields.float('Duration (s)', readonly=True),
+        'baseline': fields.float('Baseline (s)', readonly=True, group_operator='avg',
+                                 help='Mean duration of the module in the previous builds of the branch'),
+        'regression': fields.boolean('Regression', readonly=True),
+    }
+
+    _sql_constraints = [
+        ('build_module_unique', 'unique(build_id, module)', 'A module is timed once per build'),
+    ]
+
+    def record(self, cr, uid, build_id, timings, context=None):
+        """Store ``timings``, a dict of [load time, test time, test count] by module, as those of ``build_id``"""
+        for module, (load_time, test_time, test_count) in timings.items():
+            cr.execute("""INSERT INTO runbot_build_module_timing
+                                      (build_id, repo_id, branch_id, date, module, load_time, test_time, test_count, duration)
+                               SELECT id, repo_id, branch_id, create_date, %s, %s, %s, %s, %s
+                                 FROM runbot_build WHERE id = %s
+                          ON CONFLICT (build_id, module) DO UPDATE
+                                  SET load_time = EXCLUDED.load_time,
+                                      test_time = EXCLUDED.test_time,
+                                      test_count = EXCLUDED.test_count,
+                                      duration = EXCLUDED.duration
+                       """, [module, load_time, test_time, test_count, load_time + test_time, build_id])
+
+    def mean_durations(self, cr, uid, repo_id, modules, builds=5, branch_id=None, before=None, context=None):
+        """Return the mean duration of ``modules`` over their last ``builds``
+        timed builds of ``repo_id`` (or ``branch_id``), by module"""
+        if not modules:
+            return {}
+        where, params = ["module IN %s"], [tuple(modules)]
+        if branch_id:
+            where.append("branch_id = %s")
+            params.append(branch_id)
+        else:
+            where.append("repo_id = %s")
+            params.append(repo_id)
+        if before:
+            where.append("build_id < %s")
+            params.append(before)
+        cr.execute("""SELECT module, avg(duration)
+                        FROM (SELECT module, duration,
+                                     row_number() OVER (PARTITION BY module ORDER BY build_id DESC) AS rank
+                                FROM runbot_build_module_timing
+                               WHERE """ + " AND ".join(where) + """) t
+                       WHERE rank <= %s
+                    GROUP BY module""", params + [builds])
+        return dict(cr.fetchall())
+
+    def check_regressions(self, cr, uid, build_id, context=None):
+        """Flag the modules of ``build_id`` that got slower than the previous
+        builds of its branch, and return their timing records
+
+        A module regresses when its duration exceeds its baseline by more
+        than runbot.timing_regression_ratio (1.5) times and by more than
+        runbot.timing_regression_min seconds (10).
+        """
+        icp = self.pool['ir.config_parameter']
+        ratio = float(icp.get_param(cr, uid, 'runbot.timing_regression_ratio', default=1.5))
+        minimum = float(icp.get_param(cr, uid, 'runbot.timing_regression_min', default=10))
+        build = self.pool['runbot.build'].browse(cr, uid, build_id, context=context)
+        timing_ids = self.search(cr, uid, [('build_id', '=', build_id)], context=context)
+        timings = self.browse(cr, uid, timing_ids, context=context)
+        baselines = self.mean_durations(cr, uid, build.repo_id.id, [t.module for t in timings],
+                                        branch_id=build.branch_id.id, before=build_id, context=context)
+        regressions = []
+        for timing in timings:
+            baseline = baselines.get(timing.module)
+            if baseline is None:
+                continue
+            regression = timing.duration > baseline * ratio and timing.duration - baseline > minimum
+            timing.write({'baseline': baseline, 'regression': regression})
+            if regression:
+                regressions.append(timing)
+        return regressions
+
+class runbot_server_capability(osv.osv):
+    """Options and features of a server tree, probed once by server hash"""
+    _name = "runbot.server.capability"
+    _rec_name = 'server_hash'
+    _log_access = False
+
+    _columns = {
+        'server_hash': fields.char('Server hash', required=True, readonly=True),
+        'script': fields.char('Server script', readonly=True, help='Path of the server script in the builds'),
+        'cli': fields.boolean('Openerp cli', readonly=True, help='The server script runs openerp.cli, see zygote.py'),
+        'no_xmlrpcs': fields.boolean('--no-xmlrpcs', readonly=True),
+        'no_netrpc': fields.boolean('--no-netrpc', readonly=True),
+        'log_db': fields.boolean('--log-db', readonly=True),
+        'allow_uri': fields.boolean('Database uri', readonly=True),
+        'data_dir': fields.boolean('--data-dir', readonly=True),
+        'test_enable': fields.boolean('--test-enable', readonly=True),
+        'db_filter': fields.boolean('--db-filter', readonly=True),
+        'post_install': fields.boolean('Post install tests', readonly=True),
+    }
+
+    _sql_constraints = [
+        ('server_hash_unique', 'unique(server_hash)', 'The capabilities of a server are probed once'),
+    ]
+
+    # capability, file of the server and string it contains when supported
+    _probes = [
+        ('no_xmlrpcs', 'tools/config.py', 'no-xmlrpcs'),
+        ('no_netrpc', 'tools/config.py', 'no-netrpc'),
+        ('log_db', 'tools/config.py', 'log-db'),
+        ('allow_uri', 'sql_db.py', 'allow_uri'),
+        ('data_dir', 'tools/config.py', 'data-dir'),
+        ('test_enable', 'tools/config.py', 'test-enable'),
+        ('db_filter', 'tools/config.py', 'db-filter'),
+        ('post_install', 'test/common.py', 'post_install'),
+    ]
+    # 8.0, 7.0 and 6.0 server scripts
+    _scripts = ['openerp-server', 'openerp-server.py', 'bin/openerp-server.py']
+
+    def probe(self, cr, uid, server_hash, build_path, server_path, context=None):
+        """Return the capabilities of the server tree ``server_hash`` as a dict,
+        probing the checkout ``build_path`` the first time it is seen"""
+        if server_hash not in _server_capabilities:
+            columns = ['server_hash', 'script', 'cli'] + [name for name, filename, string in self._probes]
+            cr.execute("SELECT %s FROM runbot_server_capability WHERE server_hash = %%s" % ', '.join(columns),
+                       [server_hash])
+            row = cr.dictfetchone()
+            if not row:
+                scripts = [s for s in self._scripts if os.path.isfile(os.path.join(build_path, s))]
+                row = {'server_hash': server_hash, 'script': scripts[0] if scripts else self._scripts[-1]}
+                for name, filename, string in self._probes:
+                    row[name] = grep(os.path.join(server_path, filename), string)
+                row['cli'] = (grep(os.path.join(build_path, row['script']), 'openerp.cli.main()') and
+                              os.path.isdir(os.path.join(server_path, 'cli')))
+                cr.execute("""INSERT INTO runbot_server_capability (%s) VALUES (%s)
+                              ON CONFLICT (server_hash) DO NOTHING""" % (', '.join(columns), ', '.join(['%s'] * len(columns))),
+                           [row[c] for c in columns])
+            _server_capabilities[server_hash] = row
+        return dict(_server_capabilities[server_hash])
+
+class runbot_error_fingerprint(osv.osv):
+    """Errors of the build logs, normalized so that the same error found in
+    different builds shares its fingerprint"""
+    _name = "runbot.error.fingerprint"
+    _order = 'last_seen desc'
+    _log_access = False
+
+    _columns = {
+        'name': fields.char('Error', required=True),
+        'fingerprint': fields.char('Fingerprint', required=True, readonly=True),
+        'sample': fields.text('Sample', readonly=True),
+        'first_seen': fields.datetime('First seen', readonly=True),
+        'last_seen': fields.datetime('Last seen', readonly=True),
+        'build_count': fields.integer('Builds', readonly=True),
+        'occurrence_ids': fields.one2many('runbot.error.occurrence', 'fingerprint_id', 'Occurrences'),
+    }
+
+    _sql_constraints = [
+        ('fingerprint_unique', 'unique(fingerprint)', 'An error fingerprint must be unique'),
+    ]
+
+    def record(self, cr, uid, build_id, errors, strip=None, context=None):
+        """Record the ``errors`` found in the logs of ``build_id``
+
+        ``errors`` are (logger, lines) pairs, see error_fingerprint.
+        """
+        counts, samples = {}, {}
+        for name, lines in errors:
+            key, title = error_fingerprint(name, lines, strip=strip)
+            counts[(key, title)] = counts.get((key, title), 0) + 1
+            samples.setdefault(key, '\n'.join(lines))
+        for (key, title), count in counts.items():
+            cr.execute("""INSERT INTO runbot_error_fingerprint (fingerprint, name, sample, first_seen, last_seen, build_count)
+                               VALUES (%s, %s, %s, (now() at time zone 'UTC'), (now() at time zone 'UTC'), 0)
+                          ON CONFLICT (fingerprint) DO UPDATE SET last_seen = EXCLUDED.last_seen
+                            RETURNING id""", [key, title, samples[key]])
+            fingerprint_id = cr.fetchone()[0]
+            cr.execute("""INSERT INTO runbot_error_occurrence (fingerprint_id, build_id, branch_id, repo_id, count)
+                               SELECT %s, id, branch_id, repo_id, %s FROM runbot_build WHERE id = %s
+                          ON CONFLICT (fingerprint_id, build_id) DO UPDATE
+                                  SET count = runbot_error_occurrence.count + EXCLUDED.count
+                            RETURNING xmax = 0""", [fingerprint_id, count, build_id])
+            if cr.fetchone()[0]:
+                # first occurrence in this build
+                cr.execute("UPDATE runbot_error_fingerprint SET build_count = build_count + 1 WHERE id = %s",
+                           [fingerprint_id])
+
+    def affected_builds(self, cr, uid, ids, context=None):
+        """Return the ids of the builds where the errors ``ids`` occurred, most recent first"""
+        cr.execute("""SELECT DISTINCT build_id FROM runbot_error_occurrence
+                       WHERE fingerprint_id IN %s ORDER BY build_id DESC""", [tuple(ids)])
+        return [row[0] for row in cr.fetchall()]
+
+class runbot_error_occurrence(osv.osv):
+    """Number of times an error was found in the logs of a build"""
+    _name = "runbot.error.occurrence"
+    _order = 'build_id desc'
+    _log_access = False
+
+    _columns = {
+        'fingerprint_id': fields.many2one('runbot.error.fingerprint', 'Error', required=True, ondelete='cascade'),
+        'build_id': fields.many2one('runbot.build', 'Build', required=True, ondelete='cascade', select=1),
+        'branch_id': fields.many2one('runbot.branch', 'Branch', readonly=True, select=1),
+        'repo_id': fields.many2one('runbot.repo', 'Repository', readonly=True),
+        'count': fields.integer('Count', readonly=True),
+    }
+
+    _sql_constraints = [
+        ('fingerprint_build_unique', 'unique(fingerprint_id, build_id)', 'An error is counted once per build'),
+    ]
+
 class runbot_event(osv.osv):
     _inherit = 'ir.logging'
     _order = 'id'
@@ -1212,6 +3393,79 @@ class runbot_event(osv.osv):
         'type': fields.selection(TYPES, string='Type', required=True, select=True),
     }
 
+    def _auto_init(self, cr, context=None):
+        res = super(runbot_event, self)._auto_init(cr, context)
+        # keyset pagination of the logs of a build
+        cr.execute("CREATE INDEX IF NOT EXISTS ir_logging_build_id_id_idx ON ir_logging (build_id, id)")
+        # rows inserted by --log-db that still have to be resolved, see resolve_build
+        cr.execute("""CREATE INDEX IF NOT EXISTS ir_logging_unresolved_dbname_idx
+                      ON ir_logging (dbname text_pattern_ops) WHERE build_id IS NULL""")
+        # substring search of the messages, see search_builds
+        cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if not cr.fetchone():
+            try:
+                with cr.savepoint():
+                    cr.execute("CREATE EXTENSION pg_trgm")
+            except psycopg2.Error:
+                _logger.warning("pg_trgm extension not available, log search will not be indexed")
+                return res
+        cr.execute("CREATE INDEX IF NOT EXISTS ir_logging_message_trgm_idx ON ir_logging USING gin (message gin_trgm_ops)")
+        cr.execute("CREATE INDEX IF NOT EXISTS ir_logging_name_trgm_idx ON ir_logging USING gin (name gin_trgm_ops)")
+        return res
+
+    def resolve_build(self, cr, uid, build_ids, context=None):
+        """Set the build of the log rows inserted by the databases of ``build_ids``"""
+        for build in self.pool['runbot.build'].browse(cr, uid, build_ids, context=context):
+            cr.execute("""UPDATE ir_logging SET build_id = %s
+                           WHERE build_id IS NULL AND dbname LIKE %s""", [build.id, '%s-%%' % build.dest])
+
+    def build_logs(self, cr, uid, build_id, after=0, level=None, type=None, search=None, limit=500, context=None):
+        """Return the logs of ``build_id`` following the log id ``after``,
+        and whether more logs are available"""
+        domain = [('build_id', '=', build_id), ('id', '>', after)]
+        if level:
+            domain.append(('level', '=', level.upper()))
+        if type:
+            domain.append(('type', '=', type))
+        if search:
+            domain += ['|', ('name', 'ilike', search), ('message', 'ilike', search)]
+        ids = self.search(cr, SUPERUSER_ID, domain, order='id', limit=limit + 1, context=context)
+        return self.browse(cr, SUPERUSER_ID, ids[:limit], context=context), len(ids) > limit
+
+    def search_builds(self, cr, uid, search, repo_id=None, before=None, limit=50, context=None):
+        """Return the builds whose logs contain ``search``, most recent hit first
+
+        Hits are ordered by the id of their last matching row, not by
+        relevance. Each hit is a dict with the build, the number of matching
+        rows, the id of the last one (the key of the next page, see
+        ``before``) and the first matching message. Only the builds of the
+        repositories ``uid`` can read are searched.
+        """
+        repo_ids = self.pool['runbot.repo'].search(cr, uid, [], context=context)
+        if repo_id:
+            repo_ids = [i for i in repo_ids if i == repo_id]
+        if not repo_ids:
+            return []
+        pattern = '%%%s%%' % re.sub(r'([\\%_])', r'\\\1', search)
+        where = ["(l.message ILIKE %s OR l.name ILIKE %s)", "bu.repo_id IN %s"]
+        params = [pattern, pattern, tuple(repo_ids)]
+        having = ""
+        if before:
+            having = "HAVING max(l.id) < %s"
+            params.append(before)
+        cr.execute("""SELECT l.build_id, count(*), max(l.id), (array_agg(l.message ORDER BY l.id))[1]
+                        FROM ir_logging l
+                        JOIN runbot_build bu ON (bu.id = l.build_id)
+                       WHERE """ + " AND ".join(where) + """
+                    GROUP BY l.build_id
+                    """ + having + """
+                    ORDER BY max(l.id) DESC
+                       LIMIT %s""", params + [limit])
+        rows = cr.fetchall()
+        builds = self.pool['runbot.build'].browse(cr, uid, [row[0] for row in rows], context=context)
+        return [{'build': build, 'hits': hits, 'last_id': last_id, 'message': message}
+                for build, (_, hits, last_id, message) in zip(builds, rows)]
+
 #----------------------------------------------------------
 # Runbot Controller
 #----------------------------------------------------------
@@ -1236,7 +3490,6 @@ class RunbotController(http.Controller):
         context = {
             'repos': repos,
             'repo': repo,
-            'host_stats': [],
             'pending_total': count([('state','=','pending')]),
             'limit': limit,
             'search': search,
@@ -1311,16 +3564,7 @@ class RunbotController(http.Controller):
                 'filters': filters,
             })
 
-        # consider host gone if no build in last 100
-        build_threshold = max(build_ids or [0]) - 100
-
-        for result in build_obj.read_group(cr, uid, [('id', '>', build_threshold)], ['host'], ['host']):
-            if result['host']:
-                context['host_stats'].append({
-                    'host': result['host'],
-                    'testing': count([('state', '=', 'testing'), ('host', '=', result['host'])]),
-                    'running': count([('state', '=', 'running'), ('host', '=', result['host'])]),
-                })
+        context['host_stats'] = registry['runbot.host'].host_stats(cr, SUPERUSER_ID)
 
         return request.render("runbot.repo", context)
 
@@ -1355,7 +3599,6 @@ class RunbotController(http.Controller):
         count = RB.search_count
         qctx = {
             'refresh': refresh,
-            'host_stats': [],
             'pending_total': count([('state', '=', 'pending')]),
         }
 
@@ -1375,15 +3618,7 @@ class RunbotController(http.Controller):
             b = r['branches'].setdefault(branch.id, {'name': branch.branch_name, 'builds': list()})
             b['builds'].append(self.build_info(build))
 
-        # consider host gone if no build in last 100
-        build_threshold = max(builds.ids or [0]) - 100
-        for result in RB.read_group([('id', '>', build_threshold)], ['host'], ['host']):
-            if result['host']:
-                qctx['host_stats'].append({
-                    'host': result['host'],
-                    'testing': count([('state', '=', 'testing'), ('host', '=', result['host'])]),
-                    'running': count([('state', '=', 'running'), ('host', '=', result['host'])]),
-                })
+        qctx['host_stats'] = request.env['runbot.host'].sudo().host_stats()
 
         return request.render("runbot.sticky-dashboard", qctx)
 
@@ -1410,7 +3645,7 @@ class RunbotController(http.Controller):
         }
 
     @http.route(['/runbot/build/<build_id>'], type='http', auth="public", website=True)
-    def build(self, build_id=None, search=None, **post):
+    def build(self, build_id=None, search=None, level=None, type=None, after='0', limit='500', **post):
         registry, cr, uid, context = request.registry, request.cr, request.uid, request.context
 
         Build = registry['runbot.build']
@@ -1419,33 +3654,95 @@ class RunbotController(http.Controller):
         build = Build.browse(cr, uid, [int(build_id)])[0]
         if not build.exists():
             return request.not_found()
+        try:
+            after, limit = int(after), min(int(limit), 5000)
+        except ValueError:
+            raise werkzeug.exceptions.BadRequest()
 
         real_build = build.duplicate_id if build.state == 'duplicate' else build
 
         # other builds
-        build_ids = Build.search(cr, uid, [('branch_id', '=', build.branch_id.id)])
+        build_ids = Build.search(cr, uid, [('branch_id', '=', build.branch_id.id)], order='id desc', limit=20)
         other_builds = Build.browse(cr, uid, build_ids)
 
-        domain = ['|', ('dbname', '=like', '%s-%%' % real_build.dest), ('build_id', '=', real_build.id)]
-        #if type:
-        #    domain.append(('type', '=', type))
-        #if level:
-        #    domain.append(('level', '=', level))
-        if search:
-            domain.append(('name', 'ilike', search))
-        logging_ids = Logging.search(cr, SUPERUSER_ID, domain)
+        # rows inserted by the database of a job are resolved when the job ends, see _check_jobs
+        logs, more = Logging.build_logs(cr, uid, real_build.id, after=after, level=level, type=type,
+                                        search=search, limit=limit)
+
+        Job = registry['runbot.build.job']
+        job_ids = Job.search(cr, SUPERUSER_ID, [('build_id', '=', real_build.id)], order='id')
+        Occurrence = registry['runbot.error.occurrence']
+        occurrence_ids = Occurrence.search(cr, SUPERUSER_ID, [('build_id', '=', real_build.id)])
 
         context = {
             'repo': build.repo_id,
             'build': self.build_info(build),
             'br': {'branch': build.branch_id},
-            'logs': Logging.browse(cr, SUPERUSER_ID, logging_ids),
-            'other_builds': other_builds
+            'logs': logs,
+            'more': more,
+            'after': after,
+            'jobs': Job.browse(cr, SUPERUSER_ID, job_ids),
+            'errors': Occurrence.browse(cr, SUPERUSER_ID, occurrence_ids),
+            'retry_of': real_build.retry_of_id,
+            'retries': real_build.retry_ids,
+            'other_builds': other_builds,
+            'search': search,
+            'level': level,
+            'type': type,
         }
-        #context['type'] = type
-        #context['level'] = level
         return request.render("runbot.build", context)
 
+    @http.route(['/runbot/logs'], type='http', auth="public", website=True)
+    def log_search(self, search='', repo=None, before=None, **post):
+        registry, cr, uid = request.registry, request.cr, request.uid
+
+        try:
+            repo, before = repo and int(repo), before and int(before)
+        except ValueError:
+            raise werkzeug.exceptions.BadRequest()
+        repo_ids = registry['runbot.repo'].search(cr, uid, [])
+        hits, limit = [], 50
+        if len(search) >= 3:
+            # shorter patterns can not use the trigram indexes
+            hits = registry['ir.logging'].search_builds(cr, uid, search, repo_id=repo, before=before,
+                                                        limit=limit + 1)
+        context = {
+            'repos': registry['runbot.repo'].browse(cr, uid, repo_ids),
+            'repo_id': repo,
+            'search': search,
+            'hits': hits[:limit],
+            'more': len(hits) > limit,
+        }
+        return request.render("runbot.log_search", context)
+
+    @http.route(['/runbot/error/<int:fingerprint_id>'], type='http', auth="public", website=True)
+    def error(self, fingerprint_id=None, **post):
+        registry, cr, uid = request.registry, request.cr, request.uid
+
+        Fingerprint = registry['runbot.error.fingerprint']
+        fingerprint = Fingerprint.browse(cr, SUPERUSER_ID, [fingerprint_id])[0]
+        if not fingerprint.exists():
+            return request.not_found()
+        build_ids = Fingerprint.affected_builds(cr, SUPERUSER_ID, [fingerprint_id])
+        # respect the record rules of the builds, the error of restricted repositories is not shown at all
+        build_ids = registry['runbot.build'].search(cr, uid, [('id', 'in', build_ids)], order='id desc')
+        if not build_ids:
+            return request.not_found()
+        context = {
+            'fingerprint': fingerprint,
+            'builds': registry['runbot.build'].browse(cr, uid, build_ids),
+        }
+        return request.render("runbot.error", context)
+
+    @http.route(['/runbot/build/<build_id>/retry'], type='http', auth="public", methods=['POST'], csrf=False)
+    def build_retry(self, build_id, **post):
+        registry, cr, uid, context = request.registry, request.cr, request.uid, request.context
+        try:
+            repo_id = registry['runbot.build'].retry(cr, uid, [int(build_id)])
+        except osv.except_osv as e:
+            raise werkzeug.exceptions.BadRequest(e.value)
+        return werkzeug.utils.redirect('/runbot/repo/%s' % repo_id)
+
     @http.route(['/runbot/build/<build_id>/force'], type='http', auth="public", methods=['POST'], csrf=False)
     def build_force(self, build_id, **post):
         registry, cr, uid, context = request.registry, request.cr, request.uid, request.context
@@ -10,6 +10,14 @@
             $f.submit();
             return false;
        });
+        $('a.runbot-retry').click(function() {
+            var $f = $('<form method="POST">'),
+                url = _.str.sprintf('/runbot/build/%s/retry', $(this).data('runbot-build'));
+            $f.attr('action', url);
+            $f.appendTo($('body'));
+            $f.submit();
+            return false;
+       });
     });
 
 })(jQuery);
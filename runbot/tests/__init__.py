@@ -0,0 +1,24 @@
+# -*- encoding: utf-8 -*-
+import test_adaptive
+import test_build_logs
+import test_capability
+import test_claim
+import test_host
+import test_impact
+import test_log
+import test_memory
+import test_pipeline
+import test_placement
+import test_port
+import test_preempt
+import test_pycompile
+import test_requirements
+import test_retry
+import test_reuse
+import test_scheduling
+import test_search
+import test_shards
+import test_tail
+import test_usage
+import test_watchdog
+import test_zygote
@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+import datetime
+import os
+import shutil
+import subprocess
+import tempfile
+
+import openerp
+from openerp.tests import common
+
+
+def ago(seconds):
+    """Return the server datetime ``seconds`` ago"""
+    date = datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)
+    return date.strftime(openerp.tools.DEFAULT_SERVER_DATETIME_FORMAT)
+
+
+class RunbotCase(common.TransactionCase):
+
+    def setUp(self):
+        super(RunbotCase, self).setUp()
+        self.Repo = self.registry('runbot.repo')
+        self.Branch = self.registry('runbot.branch')
+        self.Build = self.registry('runbot.build')
+        self.icp = self.registry('ir.config_parameter')
+        self.repo_id = self.create_repo('repo')
+
+    def create_repo(self, name, **values):
+        values['name'] = 'https://example.com/runbot/%s.git' % name
+        return self.Repo.create(self.cr, self.uid, values)
+
+    def create_branch(self, repo_id=None, name='master', sticky=False):
+        return self.Branch.create(self.cr, self.uid, {
+            'repo_id': repo_id or self.repo_id,
+            'name': 'refs/heads/%s' % name,
+            'sticky': sticky,
+        })
+
+    def create_build(self, branch_id=None, **values):
+        values.setdefault('name', 'd0d0caca' * 5)
+        values['branch_id'] = branch_id or self.create_branch()
+        return self.Build.create(self.cr, self.uid, values)
+
+    def set_param(self, key, value):
+        self.icp.set_param(self.cr, self.uid, key, value)
+
+    def setup_root(self):
+        """Use a temporary runbot.root"""
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.set_param('runbot.root', self.root)
+
+    def setup_git(self):
+        """Give the repository a git repository in a temporary runbot.root"""
+        self.setup_root()
+        self.repo_path = self.Repo.browse(self.cr, self.uid, self.repo_id).path
+        self.work = os.path.join(self.root, 'work')
+        subprocess.check_call(['git', 'init', '-q', '--bare', self.repo_path])
+        subprocess.check_call(['git', 'init', '-q', self.work])
+        self.git('symbolic-ref', 'HEAD', 'refs/heads/master')
+        self.git('commit', '-q', '--allow-empty', '-m', 'init')
+
+    def git(self, *args):
+        return subprocess.check_output(('git', '-c', 'user.name=runbot', '-c', 'user.email=runbot@example.com') + args,
+                                       cwd=self.work)
+
+    def commit(self, branch, files, base='master'):
+        """Commit ``files``, their content by path, on ``branch`` started
+        from ``base``, push it to the repository and return its sha"""
+        self.git('checkout', '-q', '-B', branch, base)
+        for path, content in files.items():
+            path = os.path.join(self.work, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(content)
+        self.git('add', '-A')
+        self.git('commit', '-q', '--allow-empty', '-m', 'update %s' % branch)
+        self.git('push', '-q', '-f', self.repo_path, '%s:refs/heads/%s' % (branch, branch))
+        return self.git('rev-parse', 'HEAD').strip()
@@ -0,0 +1,55 @@
+# -*- encoding: utf-8 -*-
+import os
+
+from openerp.addons.runbot.runbot import pgroup_rss
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestAdaptive(RunbotCase):
+
+    def setUp(self):
+        super(TestAdaptive, self).setUp()
+        self.Host = self.registry('runbot.host')
+        self.host_id = self.Host.create(self.cr, self.uid, {
+            'name': 'host1', 'adaptive': True, 'nb_worker': 4, 'nb_worker_current': 4})
+
+    def adapt(self, nb_testing=0, **pressure):
+        values = dict(cpus=8, load=1.0, cpu_pressure=0.0, memory_pressure=0.0, mem_available=8 * 1024 * 1024)
+        values.update(pressure)
+        self.Host.write(self.cr, self.uid, [self.host_id], {'nb_testing': nb_testing})
+        self.Host.adapt_workers(self.cr, self.uid, self.host_id, values)
+        return self.Host.browse(self.cr, self.uid, self.host_id).nb_worker_current
+
+    def test_steady(self):
+        # idle workers are not a reason to add more
+        self.assertEqual(self.adapt(nb_testing=2), 4)
+
+    def test_underloaded(self):
+        self.assertEqual(self.adapt(nb_testing=4), 5)
+        self.assertEqual(self.Host.get_capacity(self.cr, self.uid, [self.host_id])[0], 5)
+
+    def test_overloaded(self):
+        self.assertEqual(self.adapt(nb_testing=4, cpu_pressure=90.0), 3)
+        self.assertEqual(self.adapt(nb_testing=3, memory_pressure=50.0), 2)
+        self.assertEqual(self.adapt(nb_testing=2, load=16.0), 1)
+        # never below one worker
+        self.assertEqual(self.adapt(nb_testing=1, load=16.0), 1)
+
+    def test_bounds(self):
+        self.Host.write(self.cr, self.uid, [self.host_id], {'nb_worker_min': 4, 'nb_worker_max': 4})
+        self.assertEqual(self.adapt(nb_testing=4, cpu_pressure=90.0), 4)
+        self.assertEqual(self.adapt(nb_testing=4), 4)
+        # defaults to the number of cpus
+        self.Host.write(self.cr, self.uid, [self.host_id], {'nb_worker_min': 0, 'nb_worker_max': 0,
+                                                            'nb_worker_current': 8})
+        self.assertEqual(self.adapt(nb_testing=8), 8)
+
+    def test_not_adaptive(self):
+        self.Host.write(self.cr, self.uid, [self.host_id], {'adaptive': False, 'nb_worker': 2})
+        self.assertEqual(self.adapt(nb_testing=4, cpu_pressure=90.0), 4)
+        self.assertEqual(self.Host.get_capacity(self.cr, self.uid, [self.host_id])[0], 2)
+
+    def test_pgroup_rss(self):
+        pgid = os.getpgrp()
+        self.assertGreater(pgroup_rss([pgid])[pgid], 0)
+        self.assertEqual(pgroup_rss([]), {})
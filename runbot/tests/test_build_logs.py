@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestBuildLogs(RunbotCase):
+
+    def setUp(self):
+        super(TestBuildLogs, self).setUp()
+        self.Logging = self.registry('ir.logging')
+        self.build_id = self.create_build()
+        self.dest = self.Build.browse(self.cr, self.uid, self.build_id).dest
+
+    def log(self, message, level='INFO', type='server', build_id=None, dbname='db'):
+        return self.Logging.create(self.cr, self.uid, {
+            'build_id': build_id, 'type': type, 'dbname': dbname, 'level': level, 'name': 'openerp.tests',
+            'message': message, 'path': 'runbot', 'line': '0', 'func': '',
+        })
+
+    def logs(self, **kwargs):
+        logs, more = self.Logging.build_logs(self.cr, self.uid, self.build_id, **kwargs)
+        return [log.message for log in logs], more
+
+    def test_pages(self):
+        ids = [self.log('line %d' % i, build_id=self.build_id) for i in range(5)]
+        self.assertEqual(self.logs(limit=2), (['line 0', 'line 1'], True))
+        self.assertEqual(self.logs(after=ids[1], limit=2), (['line 2', 'line 3'], True))
+        self.assertEqual(self.logs(after=ids[3], limit=2), (['line 4'], False))
+        self.assertEqual(self.logs(after=ids[4]), ([], False))
+
+    def test_filters(self):
+        self.log('loading', build_id=self.build_id)
+        self.log('KeyError', level='ERROR', build_id=self.build_id)
+        self.log('Start running build', type='runbot', build_id=self.build_id)
+        self.log('KeyError', level='ERROR', build_id=self.create_build())
+        self.assertEqual(self.logs(level='error'), (['KeyError'], False))
+        self.assertEqual(self.logs(type='runbot'), (['Start running build'], False))
+        self.assertEqual(self.logs(search='keyerr'), (['KeyError'], False))
+
+    def test_resolve_build(self):
+        # logged by the databases of the build, see --log-db
+        log_id = self.log('loading', dbname='%s-all' % self.dest)
+        other_id = self.log('loading', dbname='%s0-all' % self.dest)
+        self.Logging.resolve_build(self.cr, self.uid, [self.build_id])
+        self.assertEqual(self.logs(), (['loading'], False))
+        self.assertEqual(self.Logging.browse(self.cr, self.uid, log_id).build_id.id, self.build_id)
+        self.assertFalse(self.Logging.browse(self.cr, self.uid, other_id).build_id)
@@ -0,0 +1,81 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import uuid
+
+from openerp.addons.runbot import runbot
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestCapability(RunbotCase):
+
+    def setUp(self):
+        super(TestCapability, self).setUp()
+        self.Capability = self.registry('runbot.server.capability')
+        self.build_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.build_path)
+        self.server_path = os.path.join(self.build_path, 'openerp')
+        self.server_hash = uuid.uuid4().hex[:20]
+        self.addCleanup(runbot._server_capabilities.pop, self.server_hash, None)
+
+    def write(self, path, content):
+        path = os.path.join(self.build_path, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def probe(self):
+        return self.Capability.probe(self.cr, self.uid, self.server_hash, self.build_path, self.server_path)
+
+    def test_probe(self):
+        self.write('openerp-server', 'import openerp\nopenerp.cli.main()\n')
+        self.write('openerp/cli/__init__.py', '')
+        self.write('openerp/tools/config.py', "'--data-dir' '--test-enable' '--db-filter' '--log-db'")
+        self.write('openerp/test/common.py', "def post_install(flag):")
+        capabilities = self.probe()
+        self.assertEqual(capabilities['script'], 'openerp-server')
+        for name in ['cli', 'data_dir', 'test_enable', 'db_filter', 'log_db', 'post_install']:
+            self.assertTrue(capabilities[name], name)
+        for name in ['no_xmlrpcs', 'no_netrpc', 'allow_uri']:
+            self.assertFalse(capabilities[name], name)
+
+    def test_old_server(self):
+        self.write('bin/openerp-server.py', 'import openerp\n')
+        self.write('openerp/tools/config.py', "'--no-xmlrpcs' '--no-netrpc'")
+        capabilities = self.probe()
+        self.assertEqual(capabilities['script'], 'bin/openerp-server.py')
+        self.assertTrue(capabilities['no_xmlrpcs'] and capabilities['no_netrpc'])
+        self.assertFalse(capabilities['cli'] or capabilities['test_enable'] or capabilities['post_install'])
+
+    def test_cached(self):
+        self.write('openerp/tools/config.py', "'--test-enable'")
+        self.assertTrue(self.probe()['test_enable'])
+        # probed once by server hash, in memory then in the database
+        shutil.rmtree(self.server_path)
+        self.assertTrue(self.probe()['test_enable'])
+        runbot._server_capabilities.pop(self.server_hash)
+        self.assertTrue(self.probe()['test_enable'])
+        self.assertEqual(self.Capability.search_count(self.cr, self.uid, [('server_hash', '=', self.server_hash)]), 1)
+
+    def test_copy(self):
+        self.probe()['test_enable'] = True
+        self.assertFalse(self.probe()['test_enable'])
+
+
+class TestServerHash(RunbotCase):
+
+    def setUp(self):
+        super(TestServerHash, self).setUp()
+        self.setup_git()
+
+    def server_hash(self, sha):
+        return self.Build.browse(self.cr, self.uid, self.create_build(name=sha))._server_hash()
+
+    def test_server_hash(self):
+        first = self.server_hash(self.commit('master', {'openerp/tools/config.py': '1', 'addons/sale/sale.py': '1'}))
+        # the modules of the build are not part of the server
+        self.assertEqual(self.server_hash(self.commit('master', {'addons/sale/sale.py': '2'})), first)
+        self.assertNotEqual(self.server_hash(self.commit('master', {'openerp/tools/config.py': '2'})), first)
+        self.assertNotEqual(self.server_hash(self.commit('master', {'openerp-server': '#!'})), first)
@@ -0,0 +1,35 @@
+# -*- encoding: utf-8 -*-
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestClaim(RunbotCase):
+
+    def setUp(self):
+        super(TestClaim, self).setUp()
+        self.set_param('runbot.scheduling_policy', 'fifo')
+        self.branch_id = self.create_branch(name='feature')
+        self.build_ids = [self.create_build(self.branch_id) for i in range(3)]
+
+    def claim(self, host, limit, repo_ids=None):
+        return self.Build.claim(self.cr, self.uid, repo_ids or [self.repo_id], host, limit)
+
+    def test_claim(self):
+        claimed_ids = self.claim('host1', 2)
+        self.assertEqual(sorted(claimed_ids), self.build_ids[:2])
+        first_job = self.Build.pipeline(self.cr, self.uid).keys()[0]
+        for build in self.Build.browse(self.cr, self.uid, claimed_ids):
+            self.assertEqual((build.state, build.host, build.job), ('testing', 'host1', first_job))
+            self.assertTrue(build.job_start)
+        self.assertEqual(self.Build.browse(self.cr, self.uid, self.build_ids[2]).state, 'pending')
+
+    def test_claimed_once(self):
+        self.assertEqual(len(self.claim('host1', 2)), 2)
+        self.assertEqual(self.claim('host2', 5), self.build_ids[2:])
+        self.assertEqual(self.claim('host3', 5), [])
+
+    def test_other_repo(self):
+        other_repo_id = self.create_repo('other')
+        self.assertEqual(self.claim('host1', 5, [other_repo_id]), [])
+
+    def test_no_slot(self):
+        self.assertEqual(self.claim('host1', 0), [])
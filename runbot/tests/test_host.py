@@ -0,0 +1,63 @@
+# -*- encoding: utf-8 -*-
+from openerp.addons.runbot.tests.common import RunbotCase, ago
+
+
+class TestHost(RunbotCase):
+
+    def setUp(self):
+        super(TestHost, self).setUp()
+        self.Host = self.registry('runbot.host')
+        self.Job = self.registry('runbot.build.job')
+        self.set_param('runbot.workers', '4')
+        # only the hosts of the test are alive
+        self.Host.unlink(self.cr, self.uid, self.Host.search(self.cr, self.uid, []))
+        self.host_id = self.create_host('host1')
+
+    def create_host(self, name, heartbeat=0, **values):
+        values.update(name=name, heartbeat=ago(heartbeat))
+        return self.Host.create(self.cr, self.uid, values)
+
+    def test_alive(self):
+        dead_id = self.create_host('host2', heartbeat=3600)
+        alive, dead = self.Host.browse(self.cr, self.uid, [self.host_id, dead_id])
+        self.assertTrue(alive.alive)
+        self.assertFalse(dead.alive)
+
+    def test_capacity(self):
+        self.assertEqual(self.Host.get_capacity(self.cr, self.uid, [self.host_id])[0], 4)
+        self.Host.write(self.cr, self.uid, [self.host_id], {'nb_worker': 2, 'running_max': 10})
+        self.assertEqual(self.Host.get_capacity(self.cr, self.uid, [self.host_id]), (2, 10))
+        self.assertEqual(self.Host.get_capacity(self.cr, self.uid, []), (0, 0))
+
+    def test_claim_quota(self):
+        for i in range(4):
+            self.create_build()
+        quota = lambda free: self.Host.claim_quota(self.cr, self.uid, self.host_id, free, [self.repo_id])
+        self.assertEqual(quota(4), 4)
+        self.assertEqual(quota(0), 0)
+        # the pending builds are shared with the free workers of the live hosts
+        self.create_host('host2')
+        self.assertEqual(quota(4), 2)
+        self.create_host('host3', heartbeat=3600)
+        self.assertEqual(quota(4), 2)
+
+    def test_claim_quota_nothing_pending(self):
+        self.assertEqual(self.Host.claim_quota(self.cr, self.uid, self.host_id, 4, [self.repo_id]), 0)
+
+    def test_requeue_dead(self):
+        self.create_host('host2', heartbeat=3600)
+        testing_id = self.create_build(state='testing', host='host2')
+        running_id = self.create_build(state='running', host='host2', job='job_30_run')
+        alive_id = self.create_build(state='testing', host='host1')
+        job_ids = [self.Job.create(self.cr, self.uid, {'build_id': build_id, 'job': job, 'host': 'host2',
+                                                       'state': 'running', 'pid': 4242})
+                   for build_id, job in [(testing_id, 'job_20_test_all'), (running_id, 'job_30_run')]]
+        self.Host.requeue_dead(self.cr, self.uid)
+        testing, running, alive = self.Build.browse(self.cr, self.uid, [testing_id, running_id, alive_id])
+        self.assertEqual(testing.state, 'pending')
+        self.assertEqual(running.state, 'done')
+        self.assertEqual((alive.state, alive.host), ('testing', 'host1'))
+        # killed by the host if it comes back, see kill_orphans
+        for job in self.Job.browse(self.cr, self.uid, job_ids):
+            self.assertEqual(job.state, 'cancelled')
+            self.assertTrue(job.job_end)
@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+import os
+
+from openerp.addons.runbot.tests.common import RunbotCase
+
+MANIFESTS = {
+    'sale': ['base'],
+    'sale_stock': ['sale', 'stock'],
+    'stock': ['base'],
+    'crm': ['base'],
+}
+
+
+class TestImpact(RunbotCase):
+
+    def setUp(self):
+        super(TestImpact, self).setUp()
+        self.setup_git()
+        self.commit('8.0', dict(('%s/__openerp__.py' % module, repr({'depends': depends}))
+                                for module, depends in MANIFESTS.items()))
+        self.create_branch(name='8.0', sticky=True)
+
+    def impacted(self, files, branch='8.0-feature'):
+        name = self.commit(branch, files, base='8.0')
+        build_id = self.create_build(self.create_branch(name=branch), name=name)
+        build = self.Build.browse(self.cr, self.uid, build_id)
+        # the addons of the checkout, see checkout
+        for module, depends in MANIFESTS.items():
+            path = build.server('addons', module, '__openerp__.py')
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(repr({'depends': depends}))
+        return self.Build._impacted_modules(self.cr, self.uid, [build_id], list(MANIFESTS))
+
+    def test_dependents(self):
+        self.assertEqual(self.impacted({'sale/models.py': 'x = 1\n'}), set(['sale', 'sale_stock']))
+        self.assertEqual(self.impacted({'crm/models.py': 'x = 1\n'}, branch='8.0-crm'), set(['crm']))
+
+    def test_server_addons(self):
+        self.assertEqual(self.impacted({'openerp/addons/stock/models.py': 'x = 1\n'}), set(['stock', 'sale_stock']))
+
+    def test_outside_addons(self):
+        self.assertIsNone(self.impacted({'sale/models.py': 'x = 1\n', 'README.md': 'runbot\n'}))
+
+    def test_unknown_base(self):
+        self.assertIsNone(self.impacted({'sale/models.py': 'x = 1\n'}, branch='feature'))
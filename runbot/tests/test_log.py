@@ -0,0 +1,124 @@
+# -*- encoding: utf-8 -*-
+import logging
+
+from openerp.tests import common
+from openerp.addons.runbot.runbot import merge_timings
+
+
+def record(level, name, message, dbname='db-all', time='10:00:00'):
+    return '2026-10-19 %s,123 4242 %s %s %s: %s' % (time, level, dbname, name, message)
+
+
+class TestLogParsing(common.TransactionCase):
+
+    def setUp(self):
+        super(TestLogParsing, self).setUp()
+        self.Job = self.registry('runbot.build.job')
+
+    def test_collect_record(self):
+        buf = {'ship': logging.INFO}
+        for line in [
+            record('INFO', 'openerp.modules.loading', 'loading 1 modules...'),
+            record('DEBUG', 'openerp.sql_db', 'query'),
+            'continuation of a dropped record',
+            record('ERROR', 'openerp.addons.base.ir', 'failed'),
+            'Traceback (most recent call last):',
+        ]:
+            self.Job._collect_record(buf, line)
+        self.assertEqual(buf['records'], [
+            ['2026-10-19 10:00:00', 'db-all', 'openerp.modules.loading', 'INFO', 'loading 1 modules...'],
+        ])
+        # the last record may go on, it is kept pending
+        self.assertEqual(buf['current'], ['2026-10-19 10:00:00', 'db-all', 'openerp.addons.base.ir', 'ERROR',
+                                          'failed\nTraceback (most recent call last):'])
+        self.Job._collect_record(buf, record('INFO', 'werkzeug', 'GET /'))
+        self.assertEqual(len(buf['records']), 2)
+        self.assertEqual(buf['records'][1][4], 'failed\nTraceback (most recent call last):')
+
+    def test_collect_record_level(self):
+        buf = {'ship': logging.WARNING}
+        for line in [
+            record('INFO', 'openerp.modules.loading', 'loading 1 modules...'),
+            record('WARNING', 'openerp.models', 'deprecated'),
+            record('INFO', 'openerp.modules.loading', 'Modules loaded.'),
+        ]:
+            self.Job._collect_record(buf, line)
+        self.assertEqual([r[3] for r in buf['records']], ['WARNING'])
+        self.assertFalse(buf['current'])
+
+    def test_collect_error(self):
+        buf = {}
+        for line in [
+            record('INFO', 'openerp.modules.loading', 'loading 1 modules...'),
+            record('ERROR', 'openerp.addons.base.ir', 'FAIL: test_write'),
+            'Traceback (most recent call last):',
+            '  File "ir.py", line 12, in test_write',
+            'AssertionError',
+            record('WARNING', 'openerp.models', 'deprecated'),
+            record('CRITICAL', 'openerp.service.server', 'Failed to initialize database'),
+        ]:
+            self.Job._collect_error(buf, line)
+        self.assertEqual(buf['errors'], [
+            ('openerp.addons.base.ir', ['FAIL: test_write', 'Traceback (most recent call last):',
+                                        '  File "ir.py", line 12, in test_write', 'AssertionError']),
+        ])
+        # the last error may go on, it is ended by the next record or the end of the log
+        self.assertEqual(buf['error'], ('openerp.service.server', ['Failed to initialize database']))
+        self.Job._end_error(buf)
+        self.assertEqual(len(buf['errors']), 2)
+        self.assertNotIn('error', buf)
+
+    def test_collect_error_stderr(self):
+        buf = {}
+        for line in [
+            'Traceback (most recent call last):',
+            '  File "openerp-server", line 5, in <module>',
+            'ImportError: No module named psycopg2',
+        ]:
+            self.Job._collect_error(buf, line)
+        self.Job._end_error(buf)
+        self.assertEqual(buf['errors'], [('', ['Traceback (most recent call last):',
+                                               '  File "openerp-server", line 5, in <module>',
+                                               'ImportError: No module named psycopg2'])])
+
+    def test_collect_timing(self):
+        buf = {'loading': {}}
+        for line in [
+            record('INFO', 'openerp.modules.loading', 'module base: creating or updating database tables', time='10:00:00'),
+            record('INFO', 'openerp.modules.loading', 'module stock: creating or updating database tables',
+                   dbname='db-other', time='10:00:05'),
+            record('INFO', 'openerp.modules.loading', 'module sale: creating or updating database tables', time='10:00:10'),
+            record('INFO', 'openerp.addons.sale.tests.test_order', 'Ran 3 tests in 2.500s', time='10:00:15'),
+            record('INFO', 'openerp.modules.loading', 'Modules loaded.', dbname='db-other', time='10:00:25'),
+            record('INFO', 'openerp.modules.loading', 'Modules loaded.', time='10:00:40'),
+        ]:
+            self.Job._collect_timing(buf, line)
+        self.assertEqual(buf['timings'], {
+            'db-all': {'base': [10.0, 0.0, 0], 'sale': [30.0, 2.5, 3]},
+            'db-other': {'stock': [20.0, 0.0, 0]},
+        })
+        self.assertEqual(buf['loading'], {})
+
+    def test_collect_timing_passes(self):
+        # the module being loaded is carried over to the next pass, see tail_log
+        buf = {'loading': {}}
+        self.Job._collect_timing(buf, record('INFO', 'openerp.modules.loading',
+                                             'module base: creating or updating database tables', time='10:00:00'))
+        self.assertEqual(buf['timings'], {'db-all': {}})
+        buf = {'loading': buf['loading'], 'timings': buf['timings']}
+        self.Job._collect_timing(buf, record('INFO', 'openerp.modules.loading', 'Modules loaded.', time='10:01:00'))
+        self.assertEqual(buf['timings'], {'db-all': {'base': [60.0, 0.0, 0]}})
+
+    def test_merge_timings(self):
+        # base is loaded in the -all database and in both shards
+        timings = {
+            'b-all': {'base': [40.0, 0.0, 0], 'sale': [20.0, 0.0, 0], 'stock': [20.0, 0.0, 0]},
+            'b-all-1': {'base': [30.0, 5.0, 2], 'sale': [50.0, 10.0, 4]},
+            'b-all-2': {'base': [32.0, 0.0, 0], 'stock': [25.0, 1.0, 1]},
+        }
+        self.assertEqual(merge_timings(timings, skip=['b-all']), {
+            'base': [30.0, 5.0, 2],
+            'sale': [50.0, 10.0, 4],
+            'stock': [25.0, 1.0, 1],
+        })
+        self.assertEqual(merge_timings(timings)['base'], [40.0, 0.0, 0])
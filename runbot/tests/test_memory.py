@@ -0,0 +1,82 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+
+from openerp.addons.runbot.runbot import _spawned
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestMemory(RunbotCase):
+
+    def setUp(self):
+        super(TestMemory, self).setUp()
+        self.setup_root()
+        self.set_param('runbot.log_shipping', 'none')
+        self.Job = self.registry('runbot.build.job')
+        self.build_id = self.create_build(state='testing', host='host1')
+        self.build = self.Build.browse(self.cr, self.uid, self.build_id)
+        os.makedirs(self.build.path('logs'))
+
+    def test_limit(self):
+        self.assertEqual(self.build._memory_limits('job_20_test_all'), {})
+        self.set_param('runbot.memory_limit', '2048')
+        self.set_param('runbot.memory_limit.job_20_test_all', '4096')
+        self.assertEqual(self.build._memory_limit('job_10_test_base'), 2048)
+        self.assertEqual(self.build._memory_limit('job_20_test_all'), 4096)
+        self.build.branch_id.write({'job_memory_limit': 1024})
+        self.assertEqual(self.build._memory_limits('job_20_test_all'), {'memory_limit': 1024, 'cgroup': None})
+
+    def test_cgroup(self):
+        cgroup_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cgroup_root)
+        self.set_param('runbot.cgroup_root', cgroup_root)
+        self.set_param('runbot.memory_limit', '1024')
+        limits = self.build._memory_limits('job_20_test_all')
+        self.assertEqual(os.path.dirname(limits['cgroup']), cgroup_root)
+        with open(os.path.join(limits['cgroup'], 'memory.max')) as f:
+            self.assertEqual(f.read(), str(1024 * 1024 * 1024))
+        self.assertFalse(self.build._memory_exceeded('job_20_test_all'))
+        with open(os.path.join(limits['cgroup'], 'memory.events'), 'w') as f:
+            f.write('low 0\nhigh 0\nmax 12\noom 1\noom_kill 1\n')
+        self.assertTrue(self.build._memory_exceeded('job_20_test_all'))
+
+    def run_job(self, script, log=''):
+        """Spawn ``script`` as job_20_test_all of the build, with ``log`` as its log, and reap it"""
+        pid = self.Build.spawn(['sh', '-c', script], self.build.path('logs', 'job_20_test_all.lock'),
+                               self.build.path('logs', 'job_20_test_all.txt'), **self.build._memory_limits('job_20_test_all'))
+        job_id = self.Job.create(self.cr, self.uid, {'build_id': self.build_id, 'job': 'job_20_test_all',
+                                                     'host': 'host1', 'state': 'running', 'pid': pid})
+        job = self.Job.browse(self.cr, self.uid, job_id)
+        for i in range(50):
+            job.reap()
+            job.refresh()
+            if job.reaped:
+                break
+            time.sleep(0.1)
+        with open(self.build.path('logs', 'job_20_test_all.txt'), 'a') as f:
+            f.write(log)
+        return job
+
+    def test_rlimit(self):
+        self.set_param('runbot.memory_limit', '512')
+        job = self.run_job('ulimit -v')
+        self.assertTrue(job.reaped)
+        self.assertNotIn(job.pid, _spawned)
+        with open(self.build.path('logs', 'job_20_test_all.txt')) as f:
+            self.assertEqual(f.read().strip(), str(512 * 1024))
+
+    def test_memory_error(self):
+        self.set_param('runbot.memory_limit', '512')
+        job = self.run_job('exit 1', log='MemoryError\n')
+        self.assertEqual(job.exit_status, 1)
+        self.assertTrue(self.build._memory_exceeded('job_20_test_all'))
+
+    def test_memory_error_logged(self):
+        # a test may log a MemoryError, the job is only stopped by the limit if it dies of it
+        self.set_param('runbot.memory_limit', '512')
+        self.run_job('exit 0', log='MemoryError\n')
+        self.assertFalse(self.build._memory_exceeded('job_20_test_all'))
+        self.set_param('runbot.memory_limit', '0')
+        self.assertFalse(self.build._memory_exceeded('job_20_test_all'))
@@ -0,0 +1,85 @@
+# -*- encoding: utf-8 -*-
+import subprocess
+
+import mock
+import unittest2
+
+from openerp.addons.runbot.runbot import now, parallel_command, with_port
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestPipeline(RunbotCase):
+
+    def setUp(self):
+        super(TestPipeline, self).setUp()
+        self.Job = self.registry('runbot.build.job')
+        self.set_param('runbot.workers', '4')
+        self.build_id = self.create_build(state='testing', host='host1')
+        self.started = []
+        test = self
+
+        def run_job(self, cr, uid, build, job, final=False, context=None):
+            # spawned jobs keep running until the test marks them done
+            test.started.append(job)
+            spawn = test.pipeline[job]['spawn']
+            test.Job.create(cr, uid, {'build_id': build.id, 'job': job, 'host': build.host, 'job_start': now(),
+                                      'state': 'running' if spawn else 'done'})
+        patcher = mock.patch.object(type(self.Build), '_run_job', run_job)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pipeline = self.Build.pipeline(self.cr, self.uid)
+
+    def start_jobs(self):
+        self.started = []
+        self.Build._start_jobs(self.cr, self.uid, [self.build_id], self.pipeline)
+        return self.started
+
+    def done(self, *jobs):
+        job_ids = self.Job.search(self.cr, self.uid, [('build_id', '=', self.build_id), ('job', 'in', jobs)])
+        self.Job.write(self.cr, self.uid, job_ids, {'state': 'done'})
+
+    def test_specs(self):
+        self.assertEqual(self.pipeline.keys(), ['job_00_init', 'job_10_test_base', 'job_20_test_all', 'job_30_run'])
+        self.assertEqual(self.pipeline['job_00_init'], {'depends': [], 'spawn': False, 'slots': 1})
+        self.assertEqual(self.pipeline['job_10_test_base']['depends'], ['job_00_init'])
+        self.assertEqual(self.pipeline['job_20_test_all']['depends'], ['job_00_init'])
+        # the running stage waits for every other job
+        self.assertEqual(self.pipeline['job_30_run']['depends'], ['job_00_init', 'job_10_test_base', 'job_20_test_all'])
+
+    def test_shard_slots(self):
+        self.assertEqual(self.pipeline['job_20_test_all']['slots'], 1)
+        self.set_param('runbot.test_shards', '3')
+        self.assertEqual(self.Build.pipeline(self.cr, self.uid)['job_20_test_all']['slots'], 4)
+
+    def test_concurrent(self):
+        self.assertEqual(self.start_jobs(), ['job_00_init', 'job_10_test_base', 'job_20_test_all'])
+        self.assertEqual(self.start_jobs(), [])
+        self.done('job_10_test_base')
+        self.assertEqual(self.start_jobs(), [])
+        self.done('job_20_test_all')
+        self.assertEqual(self.start_jobs(), ['job_30_run'])
+        self.assertEqual(self.Build.browse(self.cr, self.uid, self.build_id).state, 'running')
+
+    def test_free_slots(self):
+        self.set_param('runbot.workers', '1')
+        # a job is always started when the build has no running job
+        self.assertEqual(self.start_jobs(), ['job_00_init', 'job_10_test_base'])
+        self.done('job_10_test_base')
+        self.assertEqual(self.start_jobs(), ['job_20_test_all'])
+
+
+class TestCommands(unittest2.TestCase):
+
+    def test_with_port(self):
+        cmd = ['openerp-server', '--xmlrpc-port=8069', '--addons-path=addons']
+        self.assertEqual(with_port(cmd, 8071), ['openerp-server', '--xmlrpc-port=8071', '--addons-path=addons'])
+        self.assertEqual(cmd[1], '--xmlrpc-port=8069')
+
+    def test_parallel_command(self):
+        cmd = parallel_command([['echo', 'a b'], ['sh', '-c', 'exit 3'], ['echo', "'c'"]])
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        output = process.communicate()[0]
+        # every command runs, the first failure is the exit status
+        self.assertEqual(process.returncode, 3)
+        self.assertEqual(sorted(output.splitlines()), ["'c'", 'a b'])
+        self.assertEqual(subprocess.call(parallel_command([['true'], ['true']])), 0)
@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from openerp.addons.runbot.runbot import _spawned, parse_cpus
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestParseCpus(unittest2.TestCase):
+
+    def test_parse_cpus(self):
+        self.assertEqual(parse_cpus('0-3,8'), [0, 1, 2, 3, 8])
+        self.assertEqual(parse_cpus(' 4, 2-3 ,4'), [4, 2, 3])
+        self.assertEqual(parse_cpus(''), [])
+        self.assertEqual(parse_cpus(False), [])
+
+
+class TestPlacement(RunbotCase):
+
+    def setUp(self):
+        super(TestPlacement, self).setUp()
+        self.Host = self.registry('runbot.host')
+        self.Job = self.registry('runbot.build.job')
+        self.host_id = self.Host.create(self.cr, self.uid, {
+            'name': 'host1', 'testing_cpus': '0-7', 'cpus_per_job': 2, 'testing_nice': 10,
+            'testing_ioclass': 'idle', 'running_cpus': '8-9', 'running_nice': 0,
+        })
+
+    def placement(self, job_class, slot=0, slots=1):
+        return self.Host.placement(self.cr, self.uid, [self.host_id], job_class, slot=slot, slots=slots)
+
+    def test_host_placement(self):
+        self.assertEqual(self.placement('testing', slot=1),
+                         {'cpus': [0, 1], 'nice': 10, 'ioclass': 'idle', 'iolevel': 7})
+        self.assertEqual(self.placement('testing', slot=2)['cpus'], [2, 3])
+        # slots beyond the cpus of the host wrap around
+        self.assertEqual(self.placement('testing', slot=5)['cpus'], [0, 1])
+        self.assertEqual(self.placement('testing', slot=4, slots=2)['cpus'], [0, 1, 6, 7])
+        # without a slot, the job may use every testing cpu
+        self.assertEqual(self.placement('testing')['cpus'], range(8))
+        self.assertEqual(self.placement('running'),
+                         {'cpus': [8, 9], 'nice': 0, 'ioclass': 'best-effort', 'iolevel': 0})
+
+    def testing_job(self, job='job_20_test_all'):
+        build_id = self.create_build(state='testing', host='host1')
+        self.Job.create(self.cr, self.uid, {'build_id': build_id, 'job': job, 'host': 'host1', 'state': 'running'})
+        build = self.Build.browse(self.cr, self.uid, build_id)
+        return build._placement('testing', job)['cpus'], build
+
+    def test_build_placement(self):
+        first, first_build = self.testing_job()
+        self.assertEqual(first, [0, 1])
+        self.assertEqual(self.testing_job()[0], [2, 3])
+        self.assertEqual(self.testing_job('job_10_test_base')[0], [4, 5])
+        # the slot of a job is kept, and given to the next job once it is over
+        self.assertEqual(first_build._placement('testing', 'job_20_test_all')['cpus'], [0, 1])
+        self.Build.write(self.cr, self.uid, [first_build.id], {'state': 'done'})
+        self.assertEqual(self.testing_job()[0], [0, 1])
+
+    def test_sharded_placement(self):
+        self.set_param('runbot.test_shards', '2')
+        self.assertEqual(self.testing_job('job_10_test_base')[0], [0, 1])
+        # as many consecutive slots as server processes
+        self.assertEqual(self.testing_job()[0], [2, 3, 4, 5, 6, 7])
+
+    def test_spawn(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        log_path = os.path.join(tmp, 'job.txt')
+        with open('/proc/self/status') as f:
+            allowed = [line.split()[1] for line in f if line.startswith('Cpus_allowed_list:')][0]
+        cpu = parse_cpus(allowed)[-1]
+        pid = self.Build.spawn(['sh', '-c', 'grep Cpus_allowed_list /proc/self/status'], os.path.join(tmp, 'job.lock'),
+                               log_path, placement={'cpus': [cpu], 'nice': 5, 'ioclass': 'idle', 'iolevel': 7})
+        self.assertEqual(_spawned.pop(pid).wait(), 0)
+        with open(log_path) as f:
+            self.assertEqual(f.read().split(), ['Cpus_allowed_list:', str(cpu)])
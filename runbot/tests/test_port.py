@@ -0,0 +1,39 @@
+# -*- encoding: utf-8 -*-
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestPort(RunbotCase):
+
+    def setUp(self):
+        super(TestPort, self).setUp()
+        self.Port = self.registry('runbot.port')
+        self.set_param('runbot.starting_port', '42000')
+        self.set_param('runbot.port_probe', '')
+        self.build_id = self.create_build()
+
+    def allocate(self, host='host1'):
+        return self.Port.allocate(self.cr, self.uid, self.build_id, host=host)
+
+    def test_pairs(self):
+        self.assertEqual(self.allocate(), 42000)
+        self.assertEqual(self.allocate(), 42002)
+        self.assertEqual(self.allocate(), 42004)
+
+    def test_per_host(self):
+        self.assertEqual(self.allocate('host1'), 42000)
+        self.assertEqual(self.allocate('host2'), 42000)
+
+    def test_release(self):
+        other_id = self.create_build()
+        self.assertEqual(self.allocate(), 42000)
+        self.assertEqual(self.Port.allocate(self.cr, self.uid, other_id, host='host1'), 42002)
+        self.Port.release(self.cr, self.uid, [self.build_id])
+        # the lowest free port is reused
+        self.assertEqual(self.Port.allocate(self.cr, self.uid, other_id, host='host1'), 42000)
+
+    def test_release_keep_build_port(self):
+        self.Build.write(self.cr, self.uid, [self.build_id], {'port': self.allocate()})
+        self.allocate()
+        self.Port.release(self.cr, self.uid, [self.build_id], keep_build_port=True)
+        ports = self.Port.search_read(self.cr, self.uid, [('build_id', '=', self.build_id)], ['port'])
+        self.assertEqual([p['port'] for p in ports], [42000])
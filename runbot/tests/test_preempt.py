@@ -0,0 +1,65 @@
+# -*- encoding: utf-8 -*-
+import datetime
+
+import mock
+
+import openerp
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestPreempt(RunbotCase):
+
+    def setUp(self):
+        super(TestPreempt, self).setUp()
+        self.set_param('runbot.preempt_delay', '3600')
+        self.branch_id = self.create_branch(name='feature')
+        self.sticky_branch_id = self.create_branch(name='8.0', sticky=True)
+        # builds of host1, from the oldest to the youngest
+        self.testing_ids = [self.create_build(self.branch_id, state='testing', host='host1') for i in range(3)]
+        self.sticky_testing_id = self.create_build(self.sticky_branch_id, state='testing', host='host1')
+        # the scheduler commits and cleans up the preempted builds
+        for patcher in [mock.patch.object(self.cr, 'commit'),
+                        mock.patch.object(type(self.Build), '_local_cleanup', lambda *args, **kwargs: None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def queue(self, branch_id, hours):
+        build_id = self.create_build(branch_id)
+        queued = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+        self.Build.write(self.cr, self.uid, [build_id], {
+            'queue_date': queued.strftime(openerp.tools.DEFAULT_SERVER_DATETIME_FORMAT),
+        })
+        return build_id
+
+    def preempt(self):
+        return self.Build.preempt(self.cr, self.uid, [self.repo_id], 'host1')
+
+    def test_not_waiting(self):
+        self.queue(self.sticky_branch_id, 0)
+        self.queue(self.branch_id, 2)
+        self.assertEqual(self.preempt(), [])
+
+    def test_disabled(self):
+        self.queue(self.sticky_branch_id, 2)
+        self.set_param('runbot.preempt_delay', '0')
+        self.assertEqual(self.preempt(), [])
+
+    def test_youngest(self):
+        self.queue(self.sticky_branch_id, 2)
+        self.queue(self.sticky_branch_id, 3)
+        self.assertEqual(self.preempt(), [self.testing_ids[2], self.testing_ids[1]])
+        builds = self.Build.browse(self.cr, self.uid, self.testing_ids + [self.sticky_testing_id])
+        self.assertEqual([b.state for b in builds], ['testing', 'pending', 'pending', 'testing'])
+
+    def test_requeued_ahead(self):
+        pending_id = self.queue(self.branch_id, 0)
+        # queued before the preempted build was created
+        self.Build.write(self.cr, self.uid, [pending_id], {'sequence': 1})
+        self.queue(self.sticky_branch_id, 2)
+        queue_date = self.Build.browse(self.cr, self.uid, self.testing_ids[2]).queue_date
+        self.preempt()
+        preempted, pending = self.Build.browse(self.cr, self.uid, [self.testing_ids[2], pending_id])
+        self.assertFalse(preempted.host)
+        self.assertLess(preempted.sequence, pending.sequence)
+        # its age in the queue still counts
+        self.assertEqual(preempted.queue_date, queue_date)
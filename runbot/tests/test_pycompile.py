@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+import marshal
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from openerp.addons.runbot import pycompile
+
+
+class TestPycompile(unittest2.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.cache = os.path.join(self.root, 'cache')
+
+    def write(self, tree, relpath, content):
+        path = os.path.join(self.root, tree, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def compile(self, tree, relpath):
+        path = os.path.join(self.root, tree, relpath)
+        return pycompile.compile_file((self.cache, os.path.join(self.root, tree), path))
+
+    def code(self, tree, relpath):
+        with open(os.path.join(self.root, tree, relpath + 'c'), 'rb') as f:
+            # magic and mtime
+            f.read(8)
+            return marshal.load(f)
+
+    def inode(self, tree, relpath):
+        return os.stat(os.path.join(self.root, tree, relpath + 'c')).st_ino
+
+    def test_shared(self):
+        self.write('build1', 'addons/m.py', 'x = 1\n')
+        self.write('build2', 'addons/m.py', 'x = 1\n')
+        self.assertTrue(self.compile('build1', 'addons/m.py'))
+        self.assertTrue(self.compile('build2', 'addons/m.py'))
+        # both builds link the same cached bytecode
+        self.assertEqual(self.inode('build1', 'addons/m.py'), self.inode('build2', 'addons/m.py'))
+        self.assertEqual(self.code('build2', 'addons/m.py').co_filename, 'addons/m.py')
+        self.assertEqual(os.stat(os.path.join(self.root, 'build2', 'addons/m.py')).st_mtime,
+                         pycompile.SOURCE_MTIME)
+
+    def test_path_in_key(self):
+        # the same content at another path records another file name
+        self.write('build1', 'a/m.py', 'x = 1\n')
+        self.write('build1', 'b/m.py', 'x = 1\n')
+        self.assertTrue(self.compile('build1', 'a/m.py'))
+        self.assertTrue(self.compile('build1', 'b/m.py'))
+        self.assertNotEqual(self.inode('build1', 'a/m.py'), self.inode('build1', 'b/m.py'))
+        self.assertEqual(self.code('build1', 'b/m.py').co_filename, 'b/m.py')
+
+    def test_content_in_key(self):
+        self.write('build1', 'm.py', 'x = 1\n')
+        self.write('build2', 'm.py', 'x = 2\n')
+        self.compile('build1', 'm.py')
+        self.compile('build2', 'm.py')
+        self.assertNotEqual(self.inode('build1', 'm.py'), self.inode('build2', 'm.py'))
+
+    def test_syntax_error(self):
+        self.write('build1', 'm.py', 'print "python 2"\nexec = 1 +\n')
+        self.assertFalse(self.compile('build1', 'm.py'))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'build1', 'm.pyc')))
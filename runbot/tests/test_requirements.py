@@ -0,0 +1,54 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import tempfile
+
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestRequirements(RunbotCase):
+
+    def setUp(self):
+        super(TestRequirements, self).setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.set_param('runbot.root', root)
+        self.build_id = self.create_build(modules='sale,stock,missing')
+        self.build = self.Build.browse(self.cr, self.uid, self.build_id)
+
+    def write(self, content, *path):
+        path = self.build.path(*path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def requirements(self):
+        return self.Build._requirements(self.cr, self.uid, [self.build_id])
+
+    def test_requirements_txt(self):
+        self.write('\n'.join([
+            '# pinned for the tests',
+            'psycopg2==2.7.3  # with a comment',
+            '',
+            'git+https://github.com/odoo/foo.git#egg=foo',
+            '-r other.txt',
+            '--index-url https://example.com/simple',
+            'lxml',
+            'psycopg2==2.7.3',
+        ]), 'requirements.txt')
+        self.assertEqual(self.requirements(), [
+            'git+https://github.com/odoo/foo.git#egg=foo',
+            'lxml',
+            'psycopg2==2.7.3',
+        ])
+
+    def test_manifests(self):
+        self.write("{'name': 'Sales', 'external_dependencies': {'python': ['xlwt', 'lxml']}}",
+                   'openerp', 'addons', 'sale', '__openerp__.py')
+        self.write("{'name': 'Inventory', 'external_dependencies': {'python': ['lxml'], 'bin': ['wkhtmltopdf']}}",
+                   'openerp', 'addons', 'stock', '__openerp__.py')
+        self.assertEqual(self.requirements(), ['lxml', 'xlwt'])
+
+    def test_none(self):
+        self.assertEqual(self.requirements(), [])
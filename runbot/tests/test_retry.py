@@ -0,0 +1,56 @@
+# -*- encoding: utf-8 -*-
+from openerp.osv import osv
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestRetry(RunbotCase):
+
+    def setUp(self):
+        super(TestRetry, self).setUp()
+        self.Job = self.registry('runbot.build.job')
+        self.build_id = self.create_build(state='done', result='ko')
+
+    def process(self, lines):
+        """Classify ``lines`` as the log of the job_20_test_all of the build"""
+        job_id = self.Job.create(self.cr, self.uid, {'build_id': self.build_id, 'job': 'job_20_test_all'})
+        job = self.Job.browse(self.cr, self.uid, job_id)
+        state = dict((name, job[name]) for name in self.Job._log_state_fields)
+        buf = {'ship': None, 'fingerprint': False}
+        for line in lines:
+            self.Job._process_line(self.cr, self.uid, job, state, buf, line + '\n')
+        job.write(state)
+        return state
+
+    def test_failed_modules(self):
+        state = self.process([
+            '2026-10-19 10:00:00,123 4242 INFO db openerp.addons.sale.tests.test_order: test_confirm',
+            '2026-10-19 10:00:01,123 4242 ERROR db openerp.addons.sale.tests.test_order: FAIL: test_confirm',
+            '2026-10-19 10:00:02,123 4242 ERROR db openerp.addons.stock.models: invalid move',
+            '2026-10-19 10:00:03,123 4242 ERROR db openerp.addons.sale.tests.test_order: FAIL: test_cancel',
+            '2026-10-19 10:00:04,123 4242 ERROR db openerp.sql_db: bad query',
+        ])
+        self.assertEqual(state['log_errors'], 4)
+        self.assertEqual(state['log_failed_modules'], 'sale,stock')
+
+    def test_retry(self):
+        self.process([
+            '2026-10-19 10:00:01,123 4242 ERROR db openerp.addons.sale.tests.test_order: FAIL: test_confirm',
+        ])
+        pending_ids = [self.create_build() for i in range(2)]
+        self.Build.retry(self.cr, self.uid, [self.build_id])
+        retry_ids = self.Build.search(self.cr, self.uid, [('retry_of_id', '=', self.build_id)])
+        self.assertEqual(len(retry_ids), 1)
+        retry, original = self.Build.browse(self.cr, self.uid, [retry_ids[0], self.build_id])
+        self.assertEqual(retry.modules, 'sale')
+        self.assertEqual(retry.name, original.name)
+        self.assertEqual(retry.state, 'pending')
+        # ahead of the pending builds
+        for pending in self.Build.browse(self.cr, self.uid, pending_ids):
+            self.assertLess(retry.sequence, pending.sequence)
+
+    def test_retry_nothing(self):
+        self.process([
+            '2026-10-19 10:00:01,123 4242 WARNING db openerp.addons.sale.models: deprecated',
+        ])
+        with self.assertRaises(osv.except_osv):
+            self.Build.retry(self.cr, self.uid, [self.build_id])
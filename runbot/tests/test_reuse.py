@@ -0,0 +1,56 @@
+# -*- encoding: utf-8 -*-
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestReuse(RunbotCase):
+
+    def setUp(self):
+        super(TestReuse, self).setUp()
+        self.setup_git()
+        self.first = self.commit('feature', {'sale/__openerp__.py': '{}'})
+        # another commit of the same tree
+        self.second = self.commit('feature', {}, base='feature')
+        self.branch_id = self.create_branch(name='feature')
+
+    def input_hash(self, build_id):
+        return self.Build._input_hash(self.cr, self.uid, [build_id])
+
+    def test_same_tree(self):
+        first_id = self.create_build(self.branch_id, name=self.first)
+        second_id = self.create_build(self.branch_id, name=self.second)
+        self.assertTrue(self.input_hash(first_id))
+        self.assertEqual(self.input_hash(first_id), self.input_hash(second_id))
+        changed = self.commit('feature', {'sale/models.py': 'x = 1\n'}, base='feature')
+        self.assertNotEqual(self.input_hash(first_id), self.input_hash(self.create_build(self.branch_id, name=changed)))
+
+    def test_modules(self):
+        other_branch_id = self.create_branch(name='other')
+        self.Branch.write(self.cr, self.uid, [other_branch_id], {'modules': 'sale'})
+        build_id = self.create_build(self.branch_id, name=self.first)
+        other_id = self.create_build(other_branch_id, name=self.first)
+        self.assertNotEqual(self.input_hash(build_id), self.input_hash(other_id))
+
+    def test_unicode(self):
+        self.Branch.write(self.cr, self.uid, [self.branch_id], {'modules': u'sale_\xe9t\xe9'})
+        self.assertEqual(len(self.input_hash(self.create_build(self.branch_id, name=self.first))), 40)
+
+    def test_unknown_commit(self):
+        self.assertIsNone(self.input_hash(self.create_build(self.branch_id, name='deadbeef' * 5)))
+
+    def test_reuse(self):
+        original_id = self.create_build(self.branch_id, name=self.first, state='done', result='ok')
+        self.Build.write(self.cr, self.uid, [original_id], {'input_hash': self.input_hash(original_id)})
+        build_id = self.create_build(self.branch_id, name=self.second)
+        self.assertTrue(self.Build._reuse_result(self.cr, self.uid, [build_id]))
+        build, original = self.Build.browse(self.cr, self.uid, [build_id, original_id])
+        self.assertEqual(build.state, 'duplicate')
+        # linked both ways, as the duplicates found by create
+        self.assertEqual(build.duplicate_id, original)
+        self.assertEqual(original.duplicate_id, build)
+
+    def test_not_done(self):
+        original_id = self.create_build(self.branch_id, name=self.first, state='testing')
+        self.Build.write(self.cr, self.uid, [original_id], {'input_hash': self.input_hash(original_id)})
+        build_id = self.create_build(self.branch_id, name=self.second)
+        self.assertFalse(self.Build._reuse_result(self.cr, self.uid, [build_id]))
+        self.assertEqual(self.Build.browse(self.cr, self.uid, build_id).state, 'pending')
@@ -0,0 +1,73 @@
+# -*- encoding: utf-8 -*-
+import datetime
+
+import openerp
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestScheduling(RunbotCase):
+
+    def setUp(self):
+        super(TestScheduling, self).setUp()
+        self.repo_b_id = self.create_repo('repo_b')
+        self.branch_a_id = self.create_branch(self.repo_id, 'feature-a')
+        self.branch_b_id = self.create_branch(self.repo_b_id, 'feature-b')
+
+    def order(self, policy, repo_ids=None):
+        """Return the pending builds in the order ``policy`` would claim them"""
+        repo_ids = repo_ids or [self.repo_id, self.repo_b_id]
+        query, params = getattr(self.Build, '_policy_%s' % policy)(self.cr, self.uid, repo_ids)
+        self.cr.execute("""SELECT q.id
+                             FROM (""" + query + """) q
+                             JOIN runbot_build bu ON (bu.id = q.id)
+                         ORDER BY q.lane, q.score, bu.sequence, bu.id""", params)
+        return [row[0] for row in self.cr.fetchall()]
+
+    def test_fifo(self):
+        a1, a2, a3 = [self.create_build(self.branch_a_id) for i in range(3)]
+        b1 = self.create_build(self.branch_b_id)
+        sticky = self.create_build(self.create_branch(self.repo_b_id, '8.0', sticky=True))
+        self.assertEqual(self.order('fifo'), [sticky, a1, a2, a3, b1])
+
+    def test_fair(self):
+        a1, a2, a3 = [self.create_build(self.branch_a_id) for i in range(3)]
+        b1 = self.create_build(self.branch_b_id)
+        sticky = self.create_build(self.create_branch(self.repo_b_id, '8.0', sticky=True))
+        self.assertEqual(self.order('fair'), [sticky, a1, b1, a2, a3])
+
+    def test_fair_share_weight(self):
+        self.Repo.write(self.cr, self.uid, [self.repo_b_id], {'share_weight': 2.0})
+        a1, a2 = [self.create_build(self.branch_a_id) for i in range(2)]
+        b1, b2 = [self.create_build(self.branch_b_id) for i in range(2)]
+        self.assertEqual(self.order('fair'), [b1, a1, b2, a2])
+
+    def test_fair_testing(self):
+        # the testing builds of a repository count against its share
+        self.create_build(self.branch_a_id, state='testing')
+        a1 = self.create_build(self.branch_a_id)
+        b1 = self.create_build(self.branch_b_id)
+        self.assertEqual(self.order('fair'), [b1, a1])
+
+    def test_fair_aging(self):
+        a1, a2, a3 = [self.create_build(self.branch_a_id) for i in range(3)]
+        queued = datetime.datetime.utcnow() - datetime.timedelta(hours=3)
+        self.Build.write(self.cr, self.uid, [a3], {
+            'queue_date': queued.strftime(openerp.tools.DEFAULT_SERVER_DATETIME_FORMAT),
+        })
+        self.assertEqual(self.order('fair', [self.repo_id]), [a3, a1, a2])
+
+    def test_max_testing(self):
+        self.Repo.write(self.cr, self.uid, [self.repo_id], {'max_testing': 1})
+        a1 = self.create_build(self.branch_a_id)
+        self.assertEqual(self.order('fair', [self.repo_id]), [a1])
+        # sticky builds do not count against the cap
+        self.create_build(self.create_branch(self.repo_id, '8.0', sticky=True), state='testing')
+        self.assertEqual(self.order('fair', [self.repo_id]), [a1])
+        self.create_build(self.branch_a_id, state='testing')
+        self.assertEqual(self.order('fair', [self.repo_id]), [])
+
+    def test_unknown_policy(self):
+        self.set_param('runbot.scheduling_policy', 'unknown')
+        build_ids = [self.create_build(self.branch_a_id) for i in range(2)]
+        claimed_ids = self.Build.claim(self.cr, self.uid, [self.repo_id], 'host1', 10)
+        self.assertEqual(sorted(claimed_ids), build_ids)
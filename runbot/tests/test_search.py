@@ -0,0 +1,58 @@
+# -*- encoding: utf-8 -*-
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestSearchBuilds(RunbotCase):
+
+    def setUp(self):
+        super(TestSearchBuilds, self).setUp()
+        self.Logging = self.registry('ir.logging')
+        self.build_ids = [self.create_build() for i in range(3)]
+
+    def log(self, build_id, message, name='openerp.addons.sale.tests'):
+        return self.Logging.create(self.cr, self.uid, {
+            'build_id': build_id, 'type': 'server', 'dbname': 'db', 'level': 'ERROR', 'name': name,
+            'message': message, 'path': name, 'line': '0', 'func': '',
+        })
+
+    def search(self, search, **kwargs):
+        kwargs.setdefault('repo_id', self.repo_id)
+        return self.Logging.search_builds(self.cr, self.uid, search, **kwargs)
+
+    def test_search(self):
+        self.log(self.build_ids[0], 'KeyError: 42')
+        self.log(self.build_ids[0], 'Traceback\nKeyError: 43')
+        self.log(self.build_ids[1], 'ValueError')
+        last_id = self.log(self.build_ids[2], 'keyerror')
+        hits = self.search('KeyError')
+        # most recent hit first, case insensitive
+        self.assertEqual([hit['build'].id for hit in hits], [self.build_ids[2], self.build_ids[0]])
+        self.assertEqual((hits[0]['hits'], hits[0]['last_id']), (1, last_id))
+        self.assertEqual((hits[1]['hits'], hits[1]['message']), (2, 'KeyError: 42'))
+
+    def test_search_name(self):
+        self.log(self.build_ids[0], 'failed', name='openerp.addons.stock.tests')
+        self.assertEqual([hit['build'].id for hit in self.search('addons.stock')], self.build_ids[:1])
+
+    def test_escape(self):
+        self.log(self.build_ids[0], 'took 1000 queries, load data')
+        self.log(self.build_ids[1], 'coverage 100%')
+        self.log(self.build_ids[2], 'load_data')
+        self.assertEqual([hit['build'].id for hit in self.search('100%')], [self.build_ids[1]])
+        self.assertEqual([hit['build'].id for hit in self.search('load_data')], [self.build_ids[2]])
+
+    def test_pages(self):
+        for build_id in self.build_ids:
+            self.log(build_id, 'KeyError')
+        hits = self.search('KeyError', limit=2)
+        self.assertEqual([hit['build'].id for hit in hits], self.build_ids[:0:-1])
+        hits = self.search('KeyError', limit=2, before=hits[-1]['last_id'])
+        self.assertEqual([hit['build'].id for hit in hits], self.build_ids[:1])
+
+    def test_repo(self):
+        other_repo_id = self.create_repo('other')
+        other_id = self.create_build(self.create_branch(other_repo_id))
+        self.log(self.build_ids[0], 'KeyError')
+        self.log(other_id, 'KeyError')
+        self.assertEqual([hit['build'].id for hit in self.search('KeyError')], self.build_ids[:1])
+        self.assertEqual([hit['build'].id for hit in self.search('KeyError', repo_id=other_repo_id)], [other_id])
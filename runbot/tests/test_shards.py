@@ -0,0 +1,33 @@
+# -*- encoding: utf-8 -*-
+import unittest2
+
+from openerp.addons.runbot.runbot import split_shards
+
+
+class TestSplitShards(unittest2.TestCase):
+
+    def test_balanced(self):
+        weights = {'a': 10, 'b': 6, 'c': 4, 'd': 3, 'e': 1}
+        shards = split_shards(sorted(weights), weights, 2)
+        self.assertEqual(shards, [['a', 'd'], ['b', 'c', 'e']])
+        self.assertEqual([sum(weights[m] for m in shard) for shard in shards], [13, 11])
+
+    def test_every_item_once(self):
+        items = ['m%d' % i for i in range(20)]
+        weights = dict((item, i % 7) for i, item in enumerate(items))
+        shards = split_shards(items, weights, 3)
+        self.assertEqual(len(shards), 3)
+        self.assertEqual(sorted(sum(shards, [])), sorted(items))
+
+    def test_unknown_weight_is_mean(self):
+        # c is weighted as the mean of the others, 4
+        weights = {'a': 6, 'b': 2, 'd': 4}
+        shards = split_shards(['a', 'b', 'c', 'd'], weights, 2)
+        self.assertEqual(shards, [['a', 'b'], ['c', 'd']])
+
+    def test_no_weight(self):
+        shards = split_shards(['a', 'b', 'c', 'd'], {}, 2)
+        self.assertEqual(shards, [['a', 'c'], ['b', 'd']])
+
+    def test_more_shards_than_items(self):
+        self.assertEqual(split_shards(['a', 'b'], {}, 4), [['a'], ['b']])
@@ -0,0 +1,98 @@
+# -*- encoding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+from openerp.addons.runbot.tests.common import RunbotCase
+from openerp.addons.runbot.runbot import now
+
+# holds the lock of the job like a server process, see runbot_build.spawn
+LOCKER = """
+import fcntl, os, sys, time
+fd = os.open(sys.argv[1], os.O_CREAT | os.O_RDWR, 0600)
+fcntl.lockf(fd, fcntl.LOCK_EX)
+sys.stdout.write('locked\\n')
+sys.stdout.flush()
+time.sleep(60)
+"""
+
+
+def record(level, name, message):
+    return '2026-10-19 10:00:00,123 4242 %s db-all %s: %s\n' % (level, name, message)
+
+
+class TestTail(RunbotCase):
+
+    def setUp(self):
+        super(TestTail, self).setUp()
+        self.setup_root()
+        self.set_param('runbot.log_shipping', 'none')
+        self.Job = self.registry('runbot.build.job')
+        self.build_id = self.create_build(state='testing', host='host1', job='job_20_test_all')
+        self.build = self.Build.browse(self.cr, self.uid, self.build_id)
+        os.makedirs(self.build.path('logs'))
+        self.job_id = self.Job.create(self.cr, self.uid, {
+            'build_id': self.build_id, 'job': 'job_20_test_all', 'host': 'host1',
+            'state': 'running', 'job_start': now(),
+        })
+
+    def append(self, *lines):
+        with open(self.build.path('logs', 'job_20_test_all.txt'), 'a') as f:
+            f.write(''.join(lines))
+
+    def classify(self, final=False):
+        return self.build._classify('job_20_test_all', final=final)
+
+    def test_incremental(self):
+        self.append(record('INFO', 'openerp.modules.loading', 'loading 1 modules...'),
+                    record('WARNING', 'openerp.addons.base.ir', 'deprecated'),
+                    '2026-10-19 10:00:01,123 4242 ERROR db-all openerp.addons.sale.tests: fai')
+        job = self.classify()
+        self.assertEqual((job.log_errors, job.log_warnings), (0, 1))
+        # the line being written is left for the next pass
+        self.assertEqual(job.log_offset, len(record('INFO', 'openerp.modules.loading', 'loading 1 modules...')) +
+                         len(record('WARNING', 'openerp.addons.base.ir', 'deprecated')))
+        self.append('led\n', record('INFO', 'openerp.modules.loading', 'Modules loaded.'))
+        job = self.classify()
+        # each line is counted once
+        self.assertEqual((job.log_errors, job.log_warnings), (1, 1))
+        self.assertEqual(job.log_failed_modules, 'sale')
+        self.assertTrue(job.log_loaded)
+        job = self.classify(final=True)
+        self.assertEqual((job.log_errors, job.log_warnings), (1, 1))
+        self.assertEqual(job.log_offset, os.path.getsize(self.build.path('logs', 'job_20_test_all.txt')))
+
+    def test_shutdown(self):
+        self.append(record('INFO', 'openerp.modules.loading', 'Modules loaded.'),
+                    record('INFO', 'openerp.service.server', 'Initiating shutdown.'),
+                    'Traceback (most recent call last):\n')
+        job = self.classify(final=True)
+        self.assertTrue(job.log_loaded and job.log_shutdown)
+        self.assertEqual(job.log_errors, 1)
+
+    def lock(self):
+        """Start a process holding the lock of the test job, return it"""
+        process = subprocess.Popen([sys.executable, '-c', LOCKER, self.build.path('logs', 'job_20_test_all.lock')],
+                                   stdout=subprocess.PIPE, preexec_fn=os.setsid)
+        self.addCleanup(lambda: process.poll() is None and process.kill())
+        process.stdout.readline()
+        self.Job.write(self.cr, self.uid, [self.job_id], {'pid': process.pid})
+        return process
+
+    def test_fail_fast(self):
+        self.build.branch_id.write({'fail_fast': True})
+        process = self.lock()
+        self.append(record('INFO', 'openerp.modules.loading', 'loading 1 modules...'))
+        self.build._check_jobs(self.Build.pipeline(self.cr, self.uid))
+        self.assertIsNone(process.poll())
+        self.append(record('ERROR', 'openerp.addons.sale.tests', 'failed'))
+        self.build._check_jobs(self.Build.pipeline(self.cr, self.uid))
+        # stopped on the first error
+        self.assertEqual(process.wait(), -15)
+
+    def test_no_fail_fast(self):
+        process = self.lock()
+        self.append(record('ERROR', 'openerp.addons.sale.tests', 'failed'))
+        self.build._check_jobs(self.Build.pipeline(self.cr, self.uid))
+        self.assertIsNone(process.poll())
+        self.assertEqual(self.classify().log_errors, 1)
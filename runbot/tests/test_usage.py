@@ -0,0 +1,68 @@
+# -*- encoding: utf-8 -*-
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from openerp.addons.runbot.runbot import fqdn
+from openerp.addons.runbot.tests.common import RunbotCase
+
+
+class TestUsage(RunbotCase):
+
+    def setUp(self):
+        super(TestUsage, self).setUp()
+        self.Job = self.registry('runbot.build.job')
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.build_id = self.create_build(state='testing', host=fqdn())
+
+    def create_job(self, pid=0):
+        return self.Job.create(self.cr, self.uid, {'build_id': self.build_id, 'job': 'job_20_test_all',
+                                                   'host': fqdn(), 'state': 'running', 'pid': pid})
+
+    def run_job(self, script):
+        """Spawn ``script`` for a job of the build and reap it with the scheduler, return the job"""
+        pid = self.Build.spawn(['sh', '-c', script], os.path.join(self.tmp, 'job.lock'), os.path.join(self.tmp, 'job.txt'))
+        job = self.Job.browse(self.cr, self.uid, self.create_job(pid))
+        for i in range(50):
+            self.Build.reap(self.cr, self.uid, [self.build_id])
+            job.refresh()
+            if job.reaped:
+                break
+            time.sleep(0.1)
+        return job
+
+    def test_usage(self):
+        job = self.run_job('i=0; while [ $i -lt 100000 ]; do i=$((i+1)); done; exit 3')
+        self.assertTrue(job.reaped)
+        self.assertEqual(job.exit_status, 3)
+        self.assertTrue(job.job_end)
+        self.assertGreater(job.cpu_time, 0)
+        self.assertAlmostEqual(job.cpu_time, job.cpu_user + job.cpu_system)
+        self.assertGreater(job.max_rss, 0)
+
+    def test_signal(self):
+        job = self.run_job('kill -9 $$')
+        self.assertEqual(job.exit_status, -9)
+
+    def test_other_host(self):
+        job_id = self.create_job(pid=4242)
+        self.Job.write(self.cr, self.uid, [job_id], {'host': 'otherhost'})
+        # the pids of the other hosts are not the children of this one
+        self.Job.record_usage(self.cr, self.uid, 4242, 0, resource.getrusage(resource.RUSAGE_SELF))
+        self.assertFalse(self.Job.browse(self.cr, self.uid, job_id).reaped)
+
+    def test_record_exit(self):
+        # written by the zygote which forked the job process
+        exit_path = os.path.join(self.tmp, 'job.lock.exit')
+        with open(exit_path, 'w') as f:
+            f.write('{"status": 256, "cpu_user": 1.5, "cpu_system": 0.5, "max_rss": 2048}')
+        job = self.Job.browse(self.cr, self.uid, self.create_job(pid=4242))
+        job.record_exit(exit_path)
+        job.refresh()
+        self.assertEqual((job.exit_status, job.cpu_time, job.max_rss, job.reaped), (1, 2.0, 2048, True))
+        self.assertFalse(os.path.exists(exit_path))
+        # nothing to record once it is gone
+        job.record_exit(exit_path)
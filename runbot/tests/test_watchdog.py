@@ -0,0 +1,75 @@
+# -*- encoding: utf-8 -*-
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import unittest2
+
+from openerp.addons.runbot.runbot import Watchdog, timeout_marker
+
+# a job holding its lock, which ignores SIGTERM when asked to
+JOB = """
+import fcntl, os, signal, sys, time
+if sys.argv[2] == 'stubborn':
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+fd = os.open(sys.argv[1], os.O_CREAT | os.O_RDWR, 0600)
+fcntl.lockf(fd, fcntl.LOCK_EX)
+sys.stdout.write('locked\\n')
+sys.stdout.flush()
+time.sleep(60)
+"""
+
+
+class TestWatchdog(unittest2.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.lock_path = os.path.join(self.tmp, 'job_20_test_all.lock')
+        self.watchdog = Watchdog()
+
+    def start(self, mode='polite'):
+        process = subprocess.Popen([sys.executable, '-c', JOB, self.lock_path, mode],
+                                   stdout=subprocess.PIPE, preexec_fn=os.setsid)
+        self.addCleanup(lambda: process.poll() is None and process.kill())
+        process.stdout.readline()
+        return process
+
+    def wait(self, process, timeout=5):
+        deadline = time.time() + timeout
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        return process.poll()
+
+    def test_timeout(self):
+        process = self.start()
+        self.watchdog.arm(process.pid, self.lock_path, 0.2, grace=5)
+        self.assertEqual(self.wait(process), -15)
+        self.assertTrue(os.path.exists(timeout_marker(self.lock_path)))
+
+    def test_grace(self):
+        process = self.start('stubborn')
+        self.watchdog.arm(process.pid, self.lock_path, 0.2, grace=0.3)
+        self.assertEqual(self.wait(process), -9)
+
+    def test_order(self):
+        # a timer armed later but expiring first is not delayed
+        process = self.start()
+        self.watchdog.arm(4242, self.lock_path + '.other', 60)
+        self.watchdog.arm(process.pid, self.lock_path, 0.2)
+        self.assertEqual(self.wait(process), -15)
+
+    def test_disarm(self):
+        process = self.start()
+        self.watchdog.arm(process.pid, self.lock_path, 0.2)
+        self.watchdog.disarm(process.pid)
+        self.assertIsNone(self.wait(process, timeout=0.5))
+        self.assertFalse(os.path.exists(timeout_marker(self.lock_path)))
+
+    def test_finished(self):
+        # the job finished in time, its process group may be reused
+        self.watchdog.expire(os.getpgrp(), self.lock_path, 0, 15)
+        self.assertFalse(os.path.exists(timeout_marker(self.lock_path)))
@@ -0,0 +1,87 @@
+# -*- encoding: utf-8 -*-
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import unittest2
+
+from openerp.addons.runbot.runbot import zygote_alive, zygote_spawn
+
+ZYGOTE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'zygote.py')
+
+# server of the children: prints its arguments and an environment variable
+CLI = """import os, sys
+def main():
+    print 'argv %s' % ' '.join(sys.argv[1:])
+    print 'env %s' % os.environ.get('RUNBOT_TEST')
+    sys.exit(int(os.environ.get('RUNBOT_EXIT', 0)))
+"""
+
+
+class TestZygote(unittest2.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        server = os.path.join(self.root, 'server', 'openerp')
+        os.makedirs(os.path.join(server, 'service'))
+        for name in ['__init__.py', 'service/__init__.py', 'service/server.py']:
+            open(os.path.join(server, name), 'w').close()
+        with open(os.path.join(server, 'cli.py'), 'w') as f:
+            f.write(CLI)
+        self.sock = os.path.join(self.root, 'zygote.sock')
+        self.zygote = subprocess.Popen([sys.executable, ZYGOTE, self.sock, os.path.dirname(server), '30'])
+        self.addCleanup(self.stop)
+        for i in range(100):
+            if zygote_alive(self.sock):
+                break
+            time.sleep(0.05)
+
+    def stop(self):
+        if self.zygote.poll() is None:
+            self.zygote.kill()
+            self.zygote.wait()
+
+    def spawn(self, name, env):
+        return zygote_spawn(self.sock, {
+            'cwd': self.root,
+            'env': env,
+            'argv': ['openerp-server', '--addons-path=addons', '-d', name],
+            'log_path': os.path.join(self.root, '%s.txt' % name),
+            'lock_path': os.path.join(self.root, '%s.lock' % name),
+        })
+
+    def exit_status(self, name):
+        path = os.path.join(self.root, '%s.lock.exit' % name)
+        for i in range(100):
+            if os.path.isfile(path):
+                with open(path) as f:
+                    return json.load(f)
+            time.sleep(0.05)
+        self.fail('no exit file for %s' % name)
+
+    def test_spawn(self):
+        pid = self.spawn('job', {'RUNBOT_TEST': 'forked'})
+        self.assertTrue(pid > 0)
+        usage = self.exit_status('job')
+        self.assertTrue(os.WIFEXITED(usage['status']))
+        self.assertEqual(os.WEXITSTATUS(usage['status']), 0)
+        self.assertTrue(set(['cpu_user', 'cpu_system', 'max_rss']) <= set(usage))
+        with open(os.path.join(self.root, 'job.txt')) as f:
+            self.assertEqual(f.read().splitlines(), ['argv --addons-path=addons -d job', 'env forked'])
+
+    def test_exit_status(self):
+        # children exiting right away are reported too
+        pids = [self.spawn('job%d' % i, {'RUNBOT_EXIT': '3'}) for i in range(5)]
+        self.assertEqual(len(set(pids)), 5)
+        for i in range(5):
+            self.assertEqual(os.WEXITSTATUS(self.exit_status('job%d' % i)['status']), 3)
+
+    def test_not_available(self):
+        self.stop()
+        self.assertFalse(zygote_alive(os.path.join(self.root, 'none.sock')))
+        self.assertIsNone(zygote_spawn(os.path.join(self.root, 'none.sock'), {}))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""Warm server process forking the server processes of the build jobs
+
+    zygote.py SOCKET SERVER_ROOT [IDLE_TIMEOUT]
+
+SERVER_ROOT contains the ``openerp`` package, with base as its only module,
+which is imported once. Each request received on the unix SOCKET is a json line
+describing a job process; the zygote forks it and answers its pid. The child
+sets itself up as runbot's spawn does (session, limits, placement, log
+redirection, lock), then runs the server command line with the addons of its
+build. The answer is sent once the child holds its lock, as spawn's does
+when Popen returns. When the child exits, its status and resource usage are written as
+json to ``<lock_path>.exit``. The zygote exits when idle for IDLE_TIMEOUT
+seconds (default 1800).
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import json
+import os
+import resource
+import signal
+import socket
+import sys
+import time
+
+# exit file of the running children by pid
+children = {}
+# status and usage of the children reaped before they were registered
+exited = {}
+
+# loaded before forking, find_library runs a subprocess
+libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+
+def write_exit(exit_path, status, rusage):
+    with open(exit_path, 'w') as f:
+        json.dump({
+            'status': status,
+            'cpu_user': rusage.ru_utime,
+            'cpu_system': rusage.ru_stime,
+            'max_rss': rusage.ru_maxrss,
+        }, f)
+
+
+def reap(signum, frame):
+    while True:
+        try:
+            pid, status, rusage = os.wait3(os.WNOHANG)
+        except OSError:
+            return
+        if pid == 0:
+            return
+        exit_path = children.pop(pid, None)
+        if exit_path:
+            write_exit(exit_path, status, rusage)
+        else:
+            exited[pid] = (status, rusage)
+
+
+def register(pid, exit_path):
+    """Register the child ``pid``, which may already have been reaped"""
+    children[pid] = exit_path
+    if pid in exited:
+        status, rusage = exited.pop(pid)
+        if children.pop(pid, None):
+            write_exit(exit_path, status, rusage)
+
+
+def set_affinity(cpus):
+    mask = (ctypes.c_ulong * 16)()
+    bits = ctypes.sizeof(ctypes.c_ulong) * 8
+    for cpu in cpus:
+        mask[cpu / bits] |= 1 << (cpu % bits)
+    libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask))
+
+
+def setup_child(job, ready):
+    """Same setup as the preexec_fn of runbot_build.spawn, ``ready`` is closed once locked"""
+    os.setsid()
+    if job.get('cpu_limit'):
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        r = resource.getrusage(resource.RUSAGE_SELF)
+        resource.setrlimit(resource.RLIMIT_CPU, (r.ru_utime + r.ru_stime + job['cpu_limit'], hard))
+    if job.get('cgroup'):
+        with open(os.path.join(job['cgroup'], 'cgroup.procs'), 'w') as f:
+            f.write('%d' % os.getpid())
+    elif job.get('memory_limit'):
+        limit = job['memory_limit'] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    placement = job.get('placement') or {}
+    try:
+        if placement.get('cpus'):
+            set_affinity(placement['cpus'])
+        if placement.get('nice'):
+            os.nice(placement['nice'])
+        if placement.get('ioprio_nr'):
+            libc.syscall(placement['ioprio_nr'], 1, 0, placement['ioprio'])
+    except OSError:
+        pass
+    # log redirection
+    out = os.open(job['log_path'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0644)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(out, 1)
+    os.dup2(out, 2)
+    os.closerange(3, ready)
+    os.closerange(ready + 1, os.sysconf("SC_OPEN_MAX"))
+    # lock, held until the process exits
+    fd = os.open(job['lock_path'], os.O_CREAT | os.O_RDWR, 0600)
+    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    os.close(ready)
+
+
+def run_child(job):
+    import openerp.cli
+    os.chdir(job['cwd'])
+    os.environ.clear()
+    os.environ.update(job['env'])
+    sys.stdout = os.fdopen(1, 'w', 0)
+    sys.stderr = os.fdopen(2, 'w', 0)
+    sys.argv = job['argv']
+    openerp.cli.main()
+
+
+def serve(sock_path, idle_timeout):
+    signal.signal(signal.SIGCHLD, reap)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(sock_path):
+        os.unlink(sock_path)
+    server.bind(sock_path)
+    server.listen(16)
+    server.settimeout(min(60, idle_timeout))
+    last = time.time()
+    while children or time.time() - last < idle_timeout:
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            continue
+        except socket.error as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        try:
+            conn.settimeout(10)
+            line = conn.makefile().readline()
+            if not line:
+                # liveness probe, see runbot.zygote_alive
+                continue
+            last = time.time()
+            job = json.loads(line)
+            ready_r, ready_w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                os.close(ready_r)
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                code = 1
+                try:
+                    setup_child(job, ready_w)
+                    code = 0
+                    run_child(job)
+                except SystemExit as e:
+                    code = e.code if isinstance(e.code, int) else 0
+                except BaseException:
+                    import traceback
+                    traceback.print_exc()
+                    code = 1
+                finally:
+                    os._exit(code)
+            register(pid, job['lock_path'] + '.exit')
+            os.close(ready_w)
+            # end of file once the child is locked, or dead
+            while True:
+                try:
+                    os.read(ready_r, 1)
+                    break
+                except OSError as e:
+                    if e.errno != errno.EINTR:
+                        raise
+            os.close(ready_r)
+            conn.sendall('%d\n' % pid)
+        except Exception as e:
+            print >> sys.stderr, 'zygote: request failed: %s' % e
+        finally:
+            conn.close()
+    os.unlink(sock_path)
+
+
+def main(sock_path, server_root, idle_timeout=1800):
+    sys.path.insert(0, server_root)
+    # the framework and its dependencies, the addons are loaded by the children
+    import openerp
+    import openerp.cli
+    import openerp.service.server
+    serve(sock_path, idle_timeout)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 1800)
@@ -12,6 +12,12 @@ _logger = logging.getLogger(__name__)
 class runbot_build(openerp.models.Model):
     _inherit = "runbot.build"
 
+    def pipeline(self, cr, uid, context=None):
+        specs = super(runbot_build, self).pipeline(cr, uid, context=context)
+        # only needs the checkout, next to the tests
+        specs['job_05_check_cla'].update(depends=['job_00_init'], spawn=False)
+        return specs
+
     def job_05_check_cla(self, cr, uid, build, lock_path, log_path):
         cla_glob = glob.glob(build.path("doc/cla/*/*.md"))
         if cla_glob: